@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Send, MessageSquare } from 'lucide-react';
 
-export default function Chat({ socket, roomId, username }) {
+export default function Chat({ socket, roomId, username, peerEvents, sendToPeers }) {
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const messagesEndRef = useRef(null);
@@ -13,18 +13,27 @@ export default function Chat({ socket, roomId, username }) {
             setMessages((prev) => [...prev, { ...data, isSelf: false }]);
         };
 
+        // The same messages arrive over the peer data channel once the call is connected
+        const handlePeerMessage = (e) => handleMessage(e.detail);
+
         socket.on('chat-message', handleMessage);
+        peerEvents?.addEventListener('chat-message', handlePeerMessage);
 
         return () => {
             socket.off('chat-message', handleMessage);
+            peerEvents?.removeEventListener('chat-message', handlePeerMessage);
         };
-    }, [socket]);
+    }, [socket, peerEvents]);
 
     const sendMessage = (e) => {
         e.preventDefault();
         if (input.trim() && socket) {
             const msgData = { roomId, sender: username, message: input };
-            socket.emit('chat-message', msgData);
+            if (sendToPeers) {
+                sendToPeers('chat-message', msgData);
+            } else {
+                socket.emit('chat-message', msgData);
+            }
             setMessages((prev) => [...prev, { ...msgData, isSelf: true }]);
             setInput('');
         }
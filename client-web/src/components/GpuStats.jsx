@@ -113,6 +113,12 @@ export default function GpuStats({ peerConnection, backendStats }) {
         return () => clearInterval(interval);
     }, [peerConnection]);
 
+    // Live histogram snapshots pushed by the Python backend on hardware-info
+    const pipeline = backendStats?.metrics;
+    // Bucket upper bounds; "+Inf" means above the largest bucket
+    const formatMs = (value) => (value === null || value === undefined ? '-'
+        : value === '+Inf' ? 'off scale' : `≤${value} ms`);
+
     return (
         <div className="absolute top-4 right-4 z-50 bg-black/80 backdrop-blur-xl border border-gray-700/50 p-4 rounded-xl text-xs font-mono text-cyan-400 shadow-[0_0_20px_rgba(34,211,238,0.1)] w-64">
             <div className="flex items-center gap-2 mb-3 pb-2 border-b border-gray-800">
@@ -135,6 +141,26 @@ export default function GpuStats({ peerConnection, backendStats }) {
                 </div>
             </div>
 
+            {pipeline && (
+                <div className="mb-3">
+                    <div className="text-gray-400 text-[10px] uppercase mb-1">Backend Pipeline (live)</div>
+                    <div className="grid grid-cols-2 gap-x-3 gap-y-0.5 text-[10px]">
+                        <span className="text-gray-400">Processing p95</span>
+                        <span className="text-white text-right">{formatMs(pipeline.lumen_process_ms?.p95)}</span>
+                        <span className="text-gray-400">Capture p95</span>
+                        <span className="text-white text-right">{formatMs(pipeline.lumen_capture_ms?.p95)}</span>
+                        <span className="text-gray-400">Encode p95</span>
+                        <span className="text-white text-right">{formatMs(pipeline.lumen_encode_ms?.p95)}</span>
+                        <span className="text-gray-400">Frames sent</span>
+                        <span className="text-white text-right">{(pipeline.lumen_frames_sent_total || 0).toLocaleString()}</span>
+                        <span className="text-gray-400">Frames dropped</span>
+                        <span className="text-white text-right">{(pipeline.lumen_frames_dropped_total || 0).toLocaleString()}</span>
+                        <span className="text-gray-400">Queue depth</span>
+                        <span className="text-white text-right">{pipeline.lumen_executor_in_flight ?? 0}</span>
+                    </div>
+                </div>
+            )}
+
             <div className="grid grid-cols-2 gap-3 mt-3">
                 <div className="bg-gray-900/50 p-2 rounded-lg border border-gray-800">
                     <div className="flex items-center gap-1.5 text-red-400 mb-1">
@@ -6,6 +6,30 @@ import GpuStats from './GpuStats';
 
 const SIGNALING_URL = `http://${window.location.hostname}:3000`;
 
+// Chat and hardware stats go peer to peer once the call is up (see python_src/data_channel.py).
+// Both ends create the channel with the same fixed id, so no in-band open handshake is needed.
+const CHANNEL = { label: 'lumen', options: { negotiated: true, id: 0 } };
+const EVENT_CODES = { c: 'chat-message', h: 'hardware-info' };
+
+const mergeDelta = (base, delta) => {
+    for (const [key, value] of Object.entries(delta)) {
+        if (value && typeof value === 'object' && !Array.isArray(value)
+                && base[key] && typeof base[key] === 'object') {
+            mergeDelta(base[key], value);
+        } else {
+            base[key] = value;
+        }
+    }
+    return base;
+};
+
+// Batches are a JSON list of [code, payload]; large ones arrive zlib-compressed as binary
+const decodeBatch = async (data) => {
+    if (typeof data === 'string') return JSON.parse(data);
+    const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return JSON.parse(await new Response(stream).text());
+};
+
 const RTC_CONFIG = {
     iceServers: [
         { urls: 'stun:stun.l.google.com:19302' },
@@ -25,8 +49,23 @@ export default function Room({ username, roomId, onLeave }) {
     const localVideoRef = useRef(null);
     const remoteVideoRef = useRef(null);
     const peerConnection = useRef(null);
+    const dataChannel = useRef(null);
+    // Messages from the data channel are re-dispatched here, one event per message type
+    const peerEvents = useRef(new EventTarget());
     const localStreamRef = useRef(null);
 
+    // Over the data channel when open, otherwise through signaling
+    const sendToPeers = (event, data) => {
+        const channel = dataChannel.current;
+        if (channel && channel.readyState === 'open') {
+            const { roomId: _, ...payload } = data;
+            const code = Object.keys(EVENT_CODES).find(c => EVENT_CODES[c] === event);
+            channel.send(JSON.stringify([[code, payload]]));
+        } else if (socket) {
+            socket.emit(event, data);
+        }
+    };
+
     useEffect(() => {
         const newSocket = io(SIGNALING_URL);
         setSocket(newSocket);
@@ -35,10 +74,14 @@ export default function Room({ username, roomId, onLeave }) {
             console.log('Socket connected:', newSocket.id);
         });
 
-        newSocket.on('hardware-info', (data) => {
+        const onHardwareInfo = (data) => {
             console.log("Received Backend Hardware Info:", data);
             setBackendStats(data.specs);
-        });
+        };
+        newSocket.on('hardware-info', onHardwareInfo);
+        const events = peerEvents.current;
+        const onPeerHardwareInfo = (e) => setBackendStats(e.detail.specs);
+        events.addEventListener('hardware-info', onPeerHardwareInfo);
 
         const startCall = async () => {
             try {
@@ -83,6 +126,7 @@ export default function Room({ username, roomId, onLeave }) {
                 peerConnection.current.close();
                 console.log('Closed peer connection');
             }
+            events.removeEventListener('hardware-info', onPeerHardwareInfo);
             newSocket.disconnect();
         };
     }, [roomId]);
@@ -123,6 +167,27 @@ export default function Room({ username, roomId, onLeave }) {
                 console.log("Connection State:", pc.connectionState);
             };
 
+            const channel = pc.createDataChannel(CHANNEL.label, CHANNEL.options);
+            channel.binaryType = 'arraybuffer';
+            channel.onopen = () => console.log('Data channel open');
+            // Full payloads per code, for applying the upper-case (delta) codes on top
+            const received = {};
+            // Decoding compressed batches is async; chain them so messages keep their order
+            let decoding = Promise.resolve();
+            channel.onmessage = (event) => {
+                decoding = decoding.then(async () => {
+                    for (const [code, payload] of await decodeBatch(event.data)) {
+                        const key = code.toLowerCase();
+                        if (!EVENT_CODES[key]) continue;
+                        const detail = code !== key ? mergeDelta(received[key] || (received[key] = {}), payload)
+                            : (received[key] = payload);
+                        peerEvents.current.dispatchEvent(
+                            new CustomEvent(EVENT_CODES[key], { detail: structuredClone(detail) }));
+                    }
+                }).catch(err => console.error('Bad data channel message:', err));
+            };
+            dataChannel.current = channel;
+
             pc.ontrack = (event) => {
                 console.log("Remote Track Received:", event.streams[0].id);
                 setRemoteStream(event.streams[0]);
@@ -369,7 +434,8 @@ export default function Room({ username, roomId, onLeave }) {
 
             {/* Chat Sidebar */}
             <div className="w-80 h-full border-l border-gray-700 bg-gray-800 hidden md:block">
-                <Chat socket={socket} roomId={roomId} username={username} />
+                <Chat socket={socket} roomId={roomId} username={username}
+                      peerEvents={peerEvents.current} sendToPeers={sendToPeers} />
             </div>
         </div>
     );
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import collections
+import fractions
+import sys
+import threading
+import time
+import wave
+import numpy as np
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import AudioFrame
+from metrics import REGISTRY
+
+AUDIO_SENT = REGISTRY.counter("lumen_audio_frames_sent_total", help="Audio frames handed to the Opus encoder")
+AUDIO_SUPPRESSED = REGISTRY.counter("lumen_audio_frames_suppressed_total", help="Silent audio frames not encoded")
+AUDIO_CAPTURE_DROPPED = REGISTRY.counter("lumen_audio_capture_dropped_total",
+                                         help="Captured audio frames dropped because the capture buffer was full")
+AUDIO_LEVEL_DB = REGISTRY.gauge("lumen_audio_level_db", help="Level of the last captured audio frame (dBFS)")
+AUDIO_LATENCY_MS = REGISTRY.histogram("lumen_audio_capture_ms", help="Time from capture to the frame leaving recv()")
+
+# 20 ms at 48 kHz is exactly one Opus frame, so aiortc's encoder never holds samples back
+SAMPLE_RATE = 48000
+FRAME_MS = 20
+
+
+class AudioCaptureBuffer:
+    """Bounded hand-off from a capture thread to the event loop, in whole FRAME_MS frames.
+
+    Holds at most max_frames; when the loop falls behind the oldest frame is dropped, so the
+    capture latency never exceeds max_frames * FRAME_MS.
+    """
+
+    def __init__(self, frame_samples, channels=1, max_frames=3):
+        self.frame_samples = frame_samples
+        self.channels = channels
+        self.frames = collections.deque(maxlen=max_frames)
+        self.partial = np.empty((0, channels), dtype=np.int16)
+        self.lock = threading.Lock()
+        self.loop = None
+        self.event = None
+        self.dropped = 0
+
+    def attach(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def push(self, samples):
+        """Called from the capture thread with (n, channels) int16 samples."""
+        now = time.monotonic()
+        with self.lock:
+            pending = np.concatenate((self.partial, samples.reshape(-1, self.channels)))
+            complete = len(pending) // self.frame_samples * self.frame_samples
+            for start in range(0, complete, self.frame_samples):
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped += 1
+                    AUDIO_CAPTURE_DROPPED.inc()
+                self.frames.append((pending[start:start + self.frame_samples], now))
+            self.partial = pending[complete:]
+        if complete and self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.event.set)
+            except RuntimeError:
+                pass  # loop shutting down
+
+    async def read(self):
+        while True:
+            with self.lock:
+                if self.frames:
+                    return self.frames.popleft()
+            self.event.clear()
+            await self.event.wait()
+
+
+class SoundDeviceSource:
+    """Microphone through PortAudio (sounddevice), on Windows, macOS and Linux."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=1, buffer_frames=3, device=None):
+        import sounddevice
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = AudioCaptureBuffer(sample_rate * FRAME_MS // 1000, channels, buffer_frames)
+        self.stream = sounddevice.InputStream(samplerate=sample_rate, channels=channels, dtype="int16",
+                                              blocksize=self.buffer.frame_samples, latency="low",
+                                              device=device, callback=self._callback)
+
+    def _callback(self, indata, frames, time_info, status):
+        self.buffer.push(indata.copy())
+
+    def start(self):
+        self.buffer.attach(asyncio.get_running_loop())
+        self.stream.start()
+
+    async def read(self):
+        return await self.buffer.read()
+
+    def stop(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+# FFmpeg capture device per platform, for machines without PortAudio
+FFMPEG_DEVICES = {
+    "win32": ("dshow", "audio=microphone"),
+    "darwin": ("avfoundation", ":0"),
+    "linux": ("pulse", "default"),
+}
+
+
+class FFmpegAudioSource:
+    """Microphone through an FFmpeg capture device (aiortc MediaPlayer), re-framed into FRAME_MS frames."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=1, buffer_frames=3, device=None):
+        from aiortc.contrib.media import MediaPlayer
+        from av import AudioResampler
+
+        format, default = FFMPEG_DEVICES.get(sys.platform, FFMPEG_DEVICES["linux"])
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = AudioCaptureBuffer(sample_rate * FRAME_MS // 1000, channels, buffer_frames)
+        # Ask the device for a small buffer; its default can be several hundred ms
+        options = {"audio_buffer_size": str(FRAME_MS)} if format == "dshow" else {}
+        self.player = MediaPlayer(device or default, format=format, options=options)
+        if self.player.audio is None:
+            raise RuntimeError(f"No audio stream from {format} device {device or default}")
+        self.resampler = AudioResampler(format="s16", layout="mono" if channels == 1 else "stereo", rate=sample_rate)
+        self.task = None
+
+    def start(self):
+        self.buffer.attach(asyncio.get_running_loop())
+        self.task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        # MediaPlayer's own queue is unbounded; draining it here keeps only what the buffer allows
+        while True:
+            try:
+                frame = await self.player.audio.recv()
+            except MediaStreamError:
+                return
+            for out in self.resampler.resample(frame):
+                self.buffer.push(out.to_ndarray().reshape(-1, self.channels))
+
+    async def read(self):
+        return await self.buffer.read()
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.player.audio.stop()
+
+
+class WavFileSource:
+    """16-bit PCM WAV file as a capture source, for offline tests. realtime=False reads as fast as possible."""
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.wav = wave.open(path, "rb")
+        if self.wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        self.sample_rate = self.wav.getframerate()
+        self.channels = self.wav.getnchannels()
+        self.frame_samples = self.sample_rate * FRAME_MS // 1000
+        self.realtime = realtime
+        self.loop = loop
+        self.started = None
+        self.read_frames = 0
+
+    def start(self):
+        self.started = time.monotonic()
+
+    async def read(self):
+        data = self.wav.readframes(self.frame_samples)
+        if len(data) < self.frame_samples * self.channels * 2:
+            if not self.loop:
+                return None
+            self.wav.rewind()
+            data = self.wav.readframes(self.frame_samples)
+        if self.realtime:
+            due = self.started + self.read_frames * FRAME_MS / 1000
+            await asyncio.sleep(max(due - time.monotonic(), 0))
+        self.read_frames += 1
+        samples = np.frombuffer(data, dtype="<i2").reshape(-1, self.channels)
+        return samples, time.monotonic()
+
+    def stop(self):
+        self.wav.close()
+
+
+def open_microphone(sample_rate=SAMPLE_RATE, channels=1, buffer_frames=3, device=None):
+    """PortAudio when sounddevice is installed, otherwise the platform's FFmpeg capture device."""
+    try:
+        return SoundDeviceSource(sample_rate, channels, buffer_frames, device)
+    except (ImportError, OSError) as e:
+        print(f"sounddevice unavailable ({e}), using FFmpeg audio capture")
+    return FFmpegAudioSource(sample_rate, channels, buffer_frames, device)
+
+
+def level_db(samples):
+    x = samples.astype(np.float32).ravel()
+    rms = np.sqrt(np.dot(x, x) / max(len(x), 1)) / 32768.0
+    return 20.0 * np.log10(max(rms, 1e-9))
+
+
+class VoiceActivityDetector:
+    """Energy VAD over FRAME_MS frames.
+
+    A frame is speech when its level clears both threshold_db and the tracked noise floor by
+    margin_db. The floor follows quieter frames at once and rises slowly, so speech does not
+    drag it up. Hangover keeps the detector open across short pauses and word endings.
+    """
+
+    def __init__(self, threshold_db=-50.0, margin_db=10.0, hangover_ms=300, floor_rise_db=0.05):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.hangover = hangover_ms // FRAME_MS
+        self.floor_rise_db = floor_rise_db
+        self.noise_db = None
+        self.level_db = None
+        self.remaining = 0
+        self.speech = False
+
+    def update(self, samples):
+        level = self.level_db = level_db(samples)
+        if self.noise_db is None or level < self.noise_db:
+            self.noise_db = level
+        else:
+            self.noise_db = min(level, self.noise_db + self.floor_rise_db)
+        if level > max(self.threshold_db, self.noise_db + self.margin_db):
+            self.remaining = self.hangover
+            self.speech = True
+        elif self.remaining > 0:
+            self.remaining -= 1
+            self.speech = True
+        else:
+            self.speech = False
+        return self.speech
+
+
+class VadAudioTrack(MediaStreamTrack):
+    """Audio track from a capture source, gated by a VoiceActivityDetector.
+
+    silence="drop" returns no frames while nobody speaks, so aiortc neither encodes nor sends.
+    silence="comfort" sends one frame of noise at the measured floor every comfort_ms, like Opus
+    DTX, so the far end hears a live line instead of dead air. silence="send" disables gating.
+    """
+
+    kind = "audio"
+
+    def __init__(self, source, vad=None, silence="drop", comfort_ms=400, seed=0):
+        super().__init__()
+        self.source = source
+        self.vad = vad or VoiceActivityDetector()
+        self.silence = silence
+        self.comfort_every = max(comfort_ms // FRAME_MS, 1)
+        self.time_base = fractions.Fraction(1, source.sample_rate)
+        self.layout = "mono" if source.channels == 1 else "stereo"
+        self.rng = np.random.default_rng(seed)
+        self.started = False
+        self.pts = 0
+        self.since_sent = 0
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+
+    def _frame(self, samples, pts):
+        frame = AudioFrame.from_ndarray(np.ascontiguousarray(samples).reshape(1, -1), format="s16", layout=self.layout)
+        frame.sample_rate = self.source.sample_rate
+        frame.pts = pts
+        frame.time_base = self.time_base
+        return frame
+
+    def _comfort_noise(self, shape):
+        rms = 32768.0 * 10 ** ((self.vad.noise_db or -90.0) / 20)
+        return np.clip(self.rng.normal(0.0, rms, shape), -32768, 32767).astype(np.int16)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if not self.started:
+            self.started = True
+            self.source.start()
+        while True:
+            item = await self.source.read()
+            if item is None:
+                self.stop()
+                raise MediaStreamError
+            samples, captured_at = item
+            pts = self.pts
+            self.pts += len(samples)
+            speech = self.vad.update(samples)
+            AUDIO_LEVEL_DB.set(round(self.vad.level_db, 1))
+            if speech or self.silence == "send":
+                out = samples
+            elif self.silence == "comfort" and self.since_sent + 1 >= self.comfort_every:
+                out = self._comfort_noise(samples.shape)
+            else:
+                self.since_sent += 1
+                self.frames_suppressed += 1
+                AUDIO_SUPPRESSED.inc()
+                continue
+            self.since_sent = 0
+            self.frames_sent += 1
+            AUDIO_SENT.inc()
+            AUDIO_LATENCY_MS.record((time.monotonic() - captured_at) * 1000)
+            return self._frame(out, pts)
+
+    def stop(self):
+        if self.readyState == "live" and self.started:
+            self.source.stop()
+        super().stop()
+
+
+def write_test_wav(path, seconds=10.0, sample_rate=SAMPLE_RATE, seed=0):
+    """Alternating talk spurts (modulated harmonics) and room noise, about 40% speech."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    noise = rng.normal(0, 30, len(t))
+    voice = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((140, 280, 420, 700, 1100)))
+    envelope = (np.sin(2 * np.pi * 3.5 * t) * 0.4 + 0.6) * ((t % 2.5) < 1.0)
+    samples = np.clip(noise + 6000 * voice * envelope, -32768, 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+
+
+async def measure(path, silence, vad_args):
+    """Run a WAV through the track and aiortc's Opus encoder; returns frames, encode time and bytes."""
+    from aiortc.codecs.opus import OpusEncoder
+
+    track = VadAudioTrack(WavFileSource(path, realtime=False), VoiceActivityDetector(**vad_args), silence=silence)
+    encoder = OpusEncoder()
+    encode_ms = 0.0
+    encoded_bytes = 0
+    while True:
+        try:
+            frame = await track.recv()
+        except MediaStreamError:
+            break
+        start = time.perf_counter()
+        payloads, _ = encoder.encode(frame)
+        encode_ms += (time.perf_counter() - start) * 1000
+        encoded_bytes += sum(len(p) for p in payloads)
+    return {"silence": silence, "sent": track.frames_sent, "suppressed": track.frames_suppressed,
+            "encode_ms": round(encode_ms, 1), "bytes": encoded_bytes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline VAD check: a WAV through VadAudioTrack and the Opus encoder")
+    parser.add_argument("--wav", help="16-bit PCM WAV; a synthetic talk/silence clip is written if omitted")
+    parser.add_argument("--threshold-db", type=float, default=-50.0)
+    parser.add_argument("--margin-db", type=float, default=10.0)
+    parser.add_argument("--hangover-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    path = args.wav
+    if path is None:
+        path = "vad_test.wav"
+        write_test_wav(path)
+        print(f"Wrote synthetic clip to {path}")
+    vad_args = {"threshold_db": args.threshold_db, "margin_db": args.margin_db, "hangover_ms": args.hangover_ms}
+    baseline = None
+    for silence in ("send", "drop", "comfort"):
+        result = asyncio.run(measure(path, silence, vad_args))
+        baseline = baseline or result
+        total = result["sent"] + result["suppressed"]
+        print(f"{silence:8s} encoded {result['sent']:5d}/{total} frames  {result['encode_ms']:7.1f} ms  "
+              f"{result['bytes'] / 1024:7.1f} KiB  "
+              f"({1 - result['encode_ms'] / max(baseline['encode_ms'], 1e-9):.0%} less encode time, "
+              f"{1 - result['bytes'] / max(baseline['bytes'], 1):.0%} fewer bytes)")
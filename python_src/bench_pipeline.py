@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from capture import SyntheticSource
+from filter_graph import FilterGraph, graph_spec, luma_capable
+from quality_governor import QUALITY_LEVELS
+from media_pipeline import MediaPipelineTrack
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720)]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    values = np.asarray(samples)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "mean": round(float(values.mean()), 3)}
+
+
+def frame_source(width, height, fps, video=None):
+    if video:
+        cap = cv2.VideoCapture(video)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return cap
+    return SyntheticSource(width, height, fps=fps)
+
+
+def bench_stages(level, width, height, frames, video=None):
+    """Per-stage latency of the level's filter graph, run directly on this thread."""
+    timings = {}
+
+    def hook(name, elapsed_ms):
+        timings.setdefault(name, []).append(elapsed_ms)
+
+    graph = FilterGraph(level.spec, timing_hook=hook)
+    source = frame_source(width, height, None, video)
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    totals = []
+    for i in range(frames + 5):
+        ret, image = source.read(image)
+        if not ret:
+            break
+        if image.shape != out.shape:
+            image = cv2.resize(image, (width, height))
+        start = time.perf_counter()
+        graph.run(image, dst=out)
+        if i >= 5:  # first frames allocate buffers and warm caches
+            totals.append((time.perf_counter() - start) * 1000)
+        elif i == 4:
+            timings.clear()
+    source.release()
+    stages = {name: percentiles(samples) for name, samples in timings.items()}
+    stages["total"] = percentiles(totals)
+    return stages
+
+
+def bench_pyramid(level, width, height, frames, scales, video=None):
+    """Pyramid-mode trade-off: latency and PSNR against the full-resolution result, per processing
+    scale, with plain bilinear and guided (edge-aware) upsampling."""
+    full = FilterGraph(level.spec)
+    graphs = [(scale, upsample, FilterGraph(graph_spec(level.tier, scale, upsample)))
+              for scale in scales for upsample in ("linear", "guided")]
+    timings = {id(graph): [] for _, _, graph in graphs}
+    quality = {id(graph): [] for _, _, graph in graphs}
+    source = frame_source(width, height, None, video)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    for i in range(frames + 2):
+        ret, image = source.read(image)
+        if not ret:
+            break
+        if image.shape != (height, width, 3):
+            image = cv2.resize(image, (width, height))
+        reference = full.run(image)
+        for _, _, graph in graphs:
+            start = time.perf_counter()
+            out = graph.run(image)
+            if i >= 2:
+                timings[id(graph)].append((time.perf_counter() - start) * 1000)
+                quality[id(graph)].append(cv2.PSNR(reference, out))
+    source.release()
+    return [{"scale": scale, "upsample": upsample, "latency": percentiles(timings[id(graph)]),
+             "psnr_db": round(float(np.mean(quality[id(graph)])), 2) if quality[id(graph)] else None}
+            for scale, upsample, graph in graphs]
+
+
+def bench_allocations(level, width, height, frames):
+    """Bytes allocated (peak, transient) and gen-0 collections per frame through the filter graph."""
+    graph = FilterGraph(level.spec)
+    source = SyntheticSource(width, height)
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    for _ in range(3):
+        _, image = source.read(image)
+        graph.run(image, dst=out)
+
+    gc_before = gc.get_stats()[0]["collections"]
+    peaks = []
+    tracemalloc.start()
+    for _ in range(frames):
+        _, image = source.read(image)
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        graph.run(image, dst=out)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return {
+        "bytes_per_frame": int(np.mean(peaks)),
+        "gc_gen0_per_frame": (gc.get_stats()[0]["collections"] - gc_before) / frames,
+    }
+
+
+async def bench_track(level_index, width, height, frames, source_fps, executor_mode, workers, video=None,
+                      yuv=False, incremental=False, pyramid=False):
+    """End-to-end MediaPipelineTrack.recv(): sustained FPS and per-frame latency, no camera or window.
+
+    `encoder_convert` is the yuv420p conversion the encoder does on each returned frame (none in YUV mode).
+    """
+    specs = {"tier": QUALITY_LEVELS[level_index].tier}
+    track = MediaPipelineTrack(specs, executor_mode=executor_mode, workers=workers,
+                               source=frame_source(width, height, source_fps, video),
+                               preview=False, adaptive=False, yuv=yuv, incremental=incremental,
+                               pyramid=pyramid)
+    track.governor.index = level_index
+    recv_ms = []
+    convert_ms = []
+    try:
+        for _ in range(5):
+            await track.recv()
+        start = time.perf_counter()
+        for _ in range(frames):
+            t0 = time.perf_counter()
+            frame = await track.recv()
+            t1 = time.perf_counter()
+            if frame.format.name != "yuv420p":
+                frame.reformat(format="yuv420p")
+            recv_ms.append((t1 - t0) * 1000)
+            convert_ms.append((time.perf_counter() - t1) * 1000)
+        elapsed = time.perf_counter() - start
+    finally:
+        track.stop()
+        track.release()
+    return {
+        "fps": round(frames / elapsed, 2),
+        "recv": percentiles(recv_ms),
+        "encoder_convert": percentiles(convert_ms),
+        "frames_dropped": track.grabber.frames_dropped,
+    }
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+async def run(args):
+    levels = [i for i, level in enumerate(QUALITY_LEVELS) if args.levels == "all" or level.scale == 1.0]
+    if args.yuv:
+        # Colour-only stages (detailEnhance, ONNX) have no YUV-native variant
+        levels = [i for i in levels if luma_capable(QUALITY_LEVELS[i].spec)]
+    resolutions = [parse_resolution(r) for r in args.resolutions] if args.resolutions else RESOLUTIONS
+    results = []
+    for width, height in resolutions:
+        for index in levels:
+            level = QUALITY_LEVELS[index]
+            print(f"[BENCH] {level.name} @ {width}x{height}")
+            entry = {
+                "level": level.name,
+                "resolution": f"{width}x{height}",
+                "stages": bench_stages(level, width, height, args.frames, args.video),
+                "allocations": bench_allocations(level, width, height, min(args.frames, 20)),
+                "track": await bench_track(index, width, height, args.frames, args.source_fps,
+                                           args.executor, args.workers, args.video, args.yuv,
+                                           args.incremental, args.pyramid),
+            }
+            total = entry["stages"]["total"]
+            print(f"        p50 {total['p50']} ms  p99 {total['p99']} ms  "
+                  f"{entry['track']['fps']} fps  {entry['allocations']['bytes_per_frame']} B/frame")
+            if level.spec and level.scale == 1.0 and args.pyramid_scales:
+                entry["pyramid"] = bench_pyramid(level, width, height, min(args.frames, 20),
+                                                 args.pyramid_scales, args.video)
+                for row in entry["pyramid"]:
+                    print(f"        pyramid {row['scale']:.2f} {row['upsample']:6s} "
+                          f"p50 {row['latency']['p50']} ms  {row['psnr_db']} dB")
+            results.append(entry)
+
+    report = {
+        "machine": machine_info(),
+        "config": {"frames": args.frames, "source_fps": args.source_fps, "executor": args.executor,
+                   "workers": args.workers, "video": args.video, "yuv": args.yuv,
+                   "incremental": args.incremental, "pyramid": args.pyramid},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless LumenRTC media pipeline benchmark")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--resolutions", nargs="*", help="e.g. 640x480 1280x720")
+    parser.add_argument("--levels", choices=["tiers", "all"], default="tiers",
+                        help="'tiers': each tier's filter at full scale, 'all': every governor level")
+    parser.add_argument("--video", help="Recorded clip to use instead of the synthetic pattern")
+    parser.add_argument("--source-fps", type=float, default=120, help="Synthetic source rate for the track run")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--yuv", action="store_true", help="Track runs use the I420 (YUV-native) path")
+    parser.add_argument("--incremental", action="store_true", help="Track runs refilter only changed tiles")
+    parser.add_argument("--pyramid", action="store_true", help="Track runs use pyramid mode (per-tier scale)")
+    parser.add_argument("--pyramid-scales", type=float, nargs="*", default=[0.75, 0.5, 0.33, 0.25],
+                        help="Processing scales for the PSNR/latency table; pass none to skip it")
+    parser.add_argument("--out", default="bench_results.json")
+    asyncio.run(run(parser.parse_args()))
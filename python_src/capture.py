@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+import fractions
+import cv2
+import numpy as np
+from metrics import CAPTURE_MS, CAPTURE_BACKLOG, FRAMES_DROPPED
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+
+class FrameRingBuffer:
+    """Small preallocated ring of frames. The capture thread writes, recv() reads the newest."""
+
+    def __init__(self, width=640, height=480, slots=3):
+        self.slots = slots
+        self.frames = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(slots)]
+        # What the reader gets for each slot: the captured frame or a downscaled copy of it
+        self.outputs = list(self.frames)
+        self.timestamps = [0.0] * slots
+        self.seq = 0          # total frames written
+        self.latest = -1      # slot holding the newest frame
+        self.held = -1        # slot currently handed out to the reader
+        self.lock = threading.Lock()
+
+    def next_write_slot(self):
+        # Never overwrite the slot the reader holds or the newest complete frame
+        with self.lock:
+            for i in range(1, self.slots + 1):
+                idx = (self.latest + i) % self.slots
+                if idx != self.held and idx != self.latest:
+                    return idx
+        return (self.latest + 1) % self.slots
+
+    def publish(self, idx, frame, timestamp, output=None):
+        with self.lock:
+            self.frames[idx] = frame
+            self.outputs[idx] = frame if output is None else output
+            self.timestamps[idx] = timestamp
+            self.latest = idx
+            self.seq += 1
+
+    def acquire_latest(self):
+        # Hand out the newest slot; the previously held slot goes back to the writer
+        with self.lock:
+            if self.latest < 0:
+                return None
+            self.held = self.latest
+            return self.seq, self.outputs[self.held], self.timestamps[self.held]
+
+
+class FrameGrabber:
+    """Runs the blocking cap.read() on its own thread so the event loop never waits on the camera."""
+
+    def __init__(self, cap, fps=15, width=640, height=480, slots=3, format="bgr24"):
+        self.cap = cap
+        self.fps = fps
+        # "yuv420p": frames are converted once on this thread and handed out as planar I420
+        # ((h * 3 / 2, w) uint8), which the encoder takes without another conversion
+        self.format = format
+        self.planar = [None] * slots
+        self.ring = FrameRingBuffer(width, height, slots)
+        self.running = False
+        self.thread = None
+        self.loop = None
+        self.frame_event = None
+        self.last_seq = 0
+        self.frames_dropped = 0
+        self.start_time = None
+        # Set by the congestion controller: downscale on the capture thread, skip frames to cap the rate
+        self.scale = 1.0
+        self.scaled = [None] * slots
+        self.min_interval = 0.0
+        self.last_timestamp = None
+
+    def set_profile(self, scale=1.0, fps=None):
+        self.scale = scale
+        # A little slack so a camera running at exactly `fps` is not cut in half by jitter
+        self.min_interval = 0.9 / fps if fps else 0.0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, name="lumen-capture", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def _notify(self):
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.frame_event.set)
+            except RuntimeError:
+                pass  # loop shutting down
+
+    def _capture_loop(self):
+        interval = 1.0 / self.fps
+        while self.running:
+            idx = self.ring.next_write_slot()
+            started = time.monotonic()
+            ret, frame = self.cap.read(self.ring.frames[idx])
+            timestamp = time.monotonic()
+            CAPTURE_MS.record((timestamp - started) * 1000)
+            if not ret or frame is None:
+                # Publish a black frame if capture fails, and avoid spinning on a dead camera
+                frame = self.ring.frames[idx]
+                frame[:] = 0
+                time.sleep(interval)
+            output = self._downscale(idx, frame)
+            if self.format == "yuv420p":
+                output = self._to_i420(idx, frame if output is None else output)
+            self.ring.publish(idx, frame, timestamp, output)
+            self._notify()
+
+    def _to_i420(self, idx, frame):
+        # I420 needs even dimensions; an odd last row/column is dropped
+        h, w = frame.shape[0] & ~1, frame.shape[1] & ~1
+        out = self.planar[idx]
+        if out is None or out.shape != (h * 3 // 2, w):
+            out = self.planar[idx] = np.empty((h * 3 // 2, w), dtype=np.uint8)
+        cv2.cvtColor(frame[:h, :w], cv2.COLOR_BGR2YUV_I420, dst=out)
+        return out
+
+    def _downscale(self, idx, frame):
+        scale = self.scale
+        if scale >= 1.0:
+            return None
+        h, w = frame.shape[:2]
+        shape = (max(2, int(h * scale) & ~1), max(2, int(w * scale) & ~1), 3)
+        out = self.scaled[idx]
+        if out is None or out.shape != shape:
+            out = self.scaled[idx] = np.empty(shape, dtype=np.uint8)
+        cv2.resize(frame, (shape[1], shape[0]), dst=out, interpolation=cv2.INTER_AREA)
+        return out
+
+    async def next_frame(self):
+        """Wait (without blocking the loop) for a frame newer than the last one returned.
+
+        Returns (frame, pts, time_base). Frames that arrived in between are dropped.
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.frame_event = asyncio.Event()
+            self.start()
+
+        while True:
+            latest = self.ring.acquire_latest()
+            if latest is not None and latest[0] != self.last_seq:
+                if self.last_timestamp is None or latest[2] - self.last_timestamp >= self.min_interval:
+                    break
+                # Too soon for the capped frame rate: skipped on purpose, not counted as dropped
+                self.last_seq = latest[0]
+            self.frame_event.clear()
+            await self.frame_event.wait()
+
+        seq, frame, timestamp = latest
+        self.last_timestamp = timestamp
+        backlog = seq - self.last_seq - 1 if self.last_seq else 0
+        CAPTURE_BACKLOG.set(backlog)
+        if backlog > 0:
+            self.frames_dropped += backlog
+            FRAMES_DROPPED.inc(backlog)
+        self.last_seq = seq
+
+        # Capture clock drives pts instead of a fixed-rate pacer
+        if self.start_time is None:
+            self.start_time = timestamp
+        pts = int((timestamp - self.start_time) * VIDEO_CLOCK_RATE)
+        return frame, pts, VIDEO_TIME_BASE
+
+
+class SyntheticSource:
+    """Stand-in for cv2.VideoCapture that renders a moving test pattern, for headless runs.
+
+    fps=None renders as fast as it is read (benchmarks); otherwise read() paces like a camera.
+    """
+
+    def __init__(self, width=640, height=480, fps=None, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.index = 0
+        rng = np.random.default_rng(seed)
+        # Static textured background plus a bright block that moves, like a talking head on a desk
+        self.background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        self.block = min(height, width) // 4
+        self.next_time = None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps or 0
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if self.fps:
+            now = time.monotonic()
+            if self.next_time is None:
+                self.next_time = now
+            self.next_time += 1.0 / self.fps
+            if self.next_time > now:
+                time.sleep(self.next_time - now)
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        x = (self.index * 8) % max(1, self.width - self.block)
+        y = (self.height - self.block) // 2
+        image[y:y + self.block, x:x + self.block] = (40, 200, 240)
+        self.index += 1
+        return True, image
+
+    def release(self):
+        pass
@@ -0,0 +1,161 @@
+import asyncio
+from metrics import REGISTRY
+
+NET_BITRATE_KBPS = REGISTRY.gauge("lumen_net_bitrate_kbps", help="Outgoing video bitrate of the weakest peer")
+NET_RTT_MS = REGISTRY.gauge("lumen_net_rtt_ms", help="Round-trip time of the weakest peer")
+NET_LOSS = REGISTRY.gauge("lumen_net_loss", help="Fraction of video packets lost (weakest peer)")
+NET_PROFILE = REGISTRY.gauge("lumen_net_profile", help="Index of the active network profile (0 = full)")
+
+
+class NetworkProfile:
+    def __init__(self, name, scale, fps, max_level=None):
+        self.name = name
+        self.scale = scale
+        self.fps = fps
+        # Highest QUALITY_LEVELS index the governor may use; None leaves it uncapped
+        self.max_level = max_level
+
+    def __repr__(self):
+        return f"NetworkProfile({self.name})"
+
+
+# Best first. Each step sends fewer pixels, and the lower ones also stop spending CPU on
+# enhancement detail the encoder would quantize away at that bitrate.
+NETWORK_PROFILES = [
+    NetworkProfile("Full", 1.0, 15),
+    NetworkProfile("75%", 0.75, 15),
+    NetworkProfile("50%", 0.5, 15, max_level=4),
+    NetworkProfile("50% @ 10 fps", 0.5, 10, max_level=2),
+    NetworkProfile("25% @ 7 fps", 0.25, 7, max_level=0),
+]
+
+
+class LinkSample:
+    """Rates between two video_stats() snapshots of one peer."""
+
+    def __init__(self, previous, current):
+        elapsed = max(current['time'] - previous['time'], 1e-3)
+        packets = current['packets_sent'] - previous['packets_sent']
+        self.bitrate_kbps = (current['bytes_sent'] - previous['bytes_sent']) * 8 / elapsed / 1000
+        self.rtt_ms = current['rtt_ms']
+        self.loss = current['fraction_lost'] or 0.0
+        self.nack_ratio = (current['nack'] - previous['nack']) / packets if packets > 0 else 0.0
+        self.pli_per_s = (current['pli'] - previous['pli']) / elapsed
+
+
+class CongestionController:
+    """Moves the outgoing video along NETWORK_PROFILES from RTCPeerConnection stats.
+
+    One processed track feeds every peer, so the weakest link decides. It steps down on loss,
+    RTT, NACK/PLI bursts, or when the bitrate the encoder gets leaves too few bits per pixel.
+    It steps up after a run of clean samples, and only if the larger profile would still get
+    enough bits per pixel at the current bitrate.
+    """
+
+    def __init__(self, rtc, track, interval=1.0, min_bpp=0.04, max_loss=0.08, max_rtt_ms=400,
+                 max_nack_ratio=0.05, max_pli_per_s=0.5, down_after=2, up_after=8, cooldown=4, alpha=0.3):
+        self.rtc = rtc
+        self.track = track
+        self.interval = interval
+        self.min_bpp = min_bpp
+        self.max_loss = max_loss
+        self.max_rtt_ms = max_rtt_ms
+        self.max_nack_ratio = max_nack_ratio
+        self.max_pli_per_s = max_pli_per_s
+        self.down_after = down_after
+        self.up_after = up_after
+        self.cooldown = cooldown
+        # Per-second bitrate swings with keyframes; decisions use a smoothed value
+        self.alpha = alpha
+        self.bitrate_kbps = None
+        self.index = 0
+        self.previous = {}
+        self.bad = 0
+        self.good = 0
+        self.hold = 0
+        self.changes = 0
+
+    @property
+    def profile(self):
+        return NETWORK_PROFILES[self.index]
+
+    def bits_per_pixel(self, bitrate_kbps, profile):
+        width, height = self.track.capture_size
+        pixels_per_s = width * height * profile.scale ** 2 * profile.fps
+        return bitrate_kbps * 1000 / pixels_per_s
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.step()
+
+    async def step(self):
+        """Take one stats sample. Returns True when the profile changed."""
+        samples = []
+        current = await self.rtc.video_stats()
+        for peer_id, stats in current.items():
+            previous = self.previous.get(peer_id)
+            if previous is not None:
+                samples.append(LinkSample(previous, stats))
+        self.previous = current
+        if not samples:
+            return False
+
+        bitrate = min(s.bitrate_kbps for s in samples)
+        if self.bitrate_kbps is None:
+            self.bitrate_kbps = bitrate
+        else:
+            self.bitrate_kbps += self.alpha * (bitrate - self.bitrate_kbps)
+        bitrate = self.bitrate_kbps
+        rtts = [s.rtt_ms for s in samples if s.rtt_ms is not None]
+        rtt = max(rtts) if rtts else None
+        loss = max(s.loss for s in samples)
+        NET_BITRATE_KBPS.set(round(bitrate))
+        NET_RTT_MS.set(round(rtt) if rtt is not None else 0)
+        NET_LOSS.set(round(loss, 3))
+
+        reason = self.congestion_reason(samples, bitrate, rtt, loss)
+        if self.hold > 0:
+            self.hold -= 1
+            return False
+        if reason is not None:
+            self.bad += 1
+            self.good = 0
+        else:
+            self.good += 1
+            self.bad = 0
+
+        if self.bad >= self.down_after and self.index < len(NETWORK_PROFILES) - 1:
+            return self._change(self.index + 1, reason)
+        if self.good >= self.up_after and self.index > 0:
+            if self.bits_per_pixel(bitrate, NETWORK_PROFILES[self.index - 1]) >= self.min_bpp * 1.5:
+                return self._change(self.index - 1, f"clean for {self.good} samples")
+        return False
+
+    def congestion_reason(self, samples, bitrate, rtt, loss):
+        if loss > self.max_loss:
+            return f"loss {loss:.0%}"
+        if rtt is not None and rtt > self.max_rtt_ms:
+            return f"rtt {rtt:.0f} ms"
+        nack_ratio = max(s.nack_ratio for s in samples)
+        if nack_ratio > self.max_nack_ratio:
+            return f"nack {nack_ratio:.0%} of packets"
+        pli_per_s = max(s.pli_per_s for s in samples)
+        if pli_per_s > self.max_pli_per_s:
+            return f"pli {pli_per_s:.1f}/s"
+        bpp = self.bits_per_pixel(bitrate, self.profile)
+        if bitrate > 0 and bpp < self.min_bpp:
+            return f"{bitrate:.0f} kbps is {bpp:.3f} bits/pixel"
+        return None
+
+    def _change(self, index, reason):
+        previous = self.profile
+        self.index = index
+        self.bad = self.good = 0
+        self.hold = self.cooldown
+        self.changes += 1
+        profile = self.profile
+        self.track.set_capture_profile(profile.scale, profile.fps, profile.max_level)
+        NET_PROFILE.set(index)
+        print(f"[CONGESTION] {previous.name} -> {profile.name} ({reason})")
+        return True
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import zlib
+from metrics import REGISTRY
+
+DC_MESSAGES = REGISTRY.counter("lumen_dc_messages_total", help="App messages sent over peer data channels")
+DC_BATCHES = REGISTRY.counter("lumen_dc_batches_total", help="Data channel sends (batches of app messages)")
+DC_BYTES = REGISTRY.counter("lumen_dc_bytes_total", help="Bytes sent on peer data channels")
+DC_FALLBACK = REGISTRY.counter("lumen_dc_signaling_fallback_total",
+                               help="App messages sent through signaling because a peer had no open data channel")
+
+CHANNEL_LABEL = "lumen"
+# Pre-negotiated on both ends (browser and Python) so neither side waits for a 'datachannel' event
+CHANNEL_ID = 0
+
+# Batch wire format: JSON list of [code, payload]. A code in CODES carries the full payload; its
+# upper-case form carries only what changed since the previous one on that channel (a delta can
+# not remove keys, so a payload whose keys changed goes out in full). Batches larger
+# than COMPRESS_OVER bytes are sent as zlib-compressed binary instead of text.
+CODES = {"chat-message": "c", "hardware-info": "h"}
+EVENTS = {code: event for event, code in CODES.items()}
+# Only the newest of these matters, so a batch keeps one
+LATEST_WINS = {"hardware-info"}
+COMPRESS_OVER = 512
+
+
+def diff(old, new):
+    """Keys of `new` whose values differ from `old`, recursing into nested dicts."""
+    changed = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changed[key] = nested
+        elif value != previous or key not in old:
+            changed[key] = value
+    return changed
+
+
+def same_keys(old, new):
+    """Whether `new` has exactly the keys of `old`, at every depth diff() recurses into."""
+    if old.keys() != new.keys():
+        return False
+    return all(same_keys(value, new[key]) for key, value in old.items()
+               if isinstance(value, dict) and isinstance(new[key], dict))
+
+
+def merge(base, delta):
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def encode_batch(items):
+    text = json.dumps(items, separators=(",", ":"))
+    if len(text) > COMPRESS_OVER:
+        return zlib.compress(text.encode())
+    return text
+
+
+def decode_batch(data):
+    if isinstance(data, bytes):
+        data = zlib.decompress(data).decode()
+    return json.loads(data)
+
+
+class PeerChannel:
+    """Batches app messages onto one peer's RTCDataChannel.
+
+    Messages sent in the same loop iteration (or, for stats, within flush_ms) go out as one data
+    channel message. Payloads drop the
+    'roomId' (the channel already is the peer) and repeated hardware-info is sent as a delta.
+    Messages still pending when the channel turns out closed go to on_undelivered(event, data).
+    """
+
+    def __init__(self, channel, on_message=None, flush_ms=20, on_undelivered=None):
+        self.channel = channel
+        self.on_message = on_message
+        self.on_undelivered = on_undelivered
+        self.flush_delay = flush_ms / 1000
+        self.pending = []
+        self.flush_handle = None
+        self.sent_state = {}
+        self.received_state = {}
+        channel.on("message", self._receive)
+
+    @property
+    def open(self):
+        return self.channel.readyState == "open"
+
+    def send(self, event, data):
+        payload = {k: v for k, v in data.items() if k != "roomId"}
+        if event in LATEST_WINS:
+            self.pending = [item for item in self.pending if item[0] != event]
+        self.pending.append((event, payload, data))
+        DC_MESSAGES.inc()
+        loop = asyncio.get_running_loop()
+        if event not in LATEST_WINS:
+            # Chat goes out at the end of this loop iteration, still batched with anything sent alongside it
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+            self.flush_handle = loop.call_soon(self.flush)
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.flush_delay, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        if not self.open:
+            # Closed between send() and now: hand the messages back rather than lose them
+            if self.on_undelivered is not None:
+                for event, _, data in pending:
+                    self.on_undelivered(event, data)
+            return
+        items = []
+        for event, payload, _ in pending:
+            code = CODES[event]
+            previous = self.sent_state.get(event)
+            if event in LATEST_WINS:
+                self.sent_state[event] = payload
+                if previous is not None and same_keys(previous, payload):
+                    items.append([code.upper(), diff(previous, payload)])
+                    continue
+            items.append([code, payload])
+        data = encode_batch(items)
+        self.channel.send(data)
+        DC_BATCHES.inc()
+        DC_BYTES.inc(len(data))
+
+    def _receive(self, data):
+        try:
+            items = decode_batch(data)
+        except (ValueError, zlib.error) as e:
+            print(f"Ignoring malformed data channel message: {e}")
+            return
+        for code, payload in items:
+            event = EVENTS.get(code.lower())
+            if event is None:
+                continue
+            if code.isupper():
+                payload = merge(self.received_state.setdefault(event, {}), payload)
+            elif event in LATEST_WINS:
+                self.received_state[event] = payload
+            if self.on_message is not None:
+                asyncio.ensure_future(self.on_message(event, json.loads(json.dumps(payload))))
+
+
+class Messenger:
+    """Chat and hardware-info for the room: over peer data channels once the call is up, over signaling before.
+
+    Drop-in for the SignalingClient send_* methods. Handlers registered with on() receive the
+    same payloads whichever path a message took.
+    """
+
+    def __init__(self, signaling, rtc=None):
+        self.signaling = signaling
+        self.rtc = None
+        self.handlers = {}
+        if rtc is not None:
+            self.attach(rtc)
+
+    def attach(self, rtc):
+        self.rtc = rtc
+        rtc.on_message = self.dispatch
+        rtc.on_undelivered = self.undelivered
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+        self.signaling.sio.on(event, handler)
+
+    async def dispatch(self, event, data):
+        handler = self.handlers.get(event)
+        if handler is not None:
+            await handler(data)
+
+    def _channels(self):
+        # Data channels only when every peer has one open; otherwise signaling still reaches everyone
+        if self.rtc is None or not self.rtc.peers:
+            return None
+        channels = [peer.channel for peer in self.rtc.peers.values()]
+        return channels if all(channel.open for channel in channels) else None
+
+    def undelivered(self, peer_id, event, data):
+        # Queued for a peer whose channel closed before the flush: resend to that peer only, since the
+        # others already have it over their channels
+        DC_FALLBACK.inc()
+        if self.signaling.connected:
+            asyncio.ensure_future(self.signaling.sio.emit(event, {**data, 'to': peer_id} if peer_id else data))
+
+    async def emit(self, event, data):
+        channels = self._channels()
+        if channels is None:
+            DC_FALLBACK.inc()
+            if self.signaling.connected:
+                await self.signaling.sio.emit(event, data)
+            return
+        for channel in channels:
+            channel.send(event, data)
+
+    async def send_chat(self, sender, message):
+        await self.emit('chat-message', {'roomId': self.signaling.room_id, 'sender': sender, 'message': message})
+
+    async def send_hardware_info(self, specs):
+        await self.emit('hardware-info', {'roomId': self.signaling.room_id, 'specs': specs})
+
+    async def send_metrics(self, specs, metrics):
+        # Same event as send_hardware_info so the frontend picks it up without changes to the relay
+        await self.emit('hardware-info', {'roomId': self.signaling.room_id, 'specs': {**specs, 'metrics': metrics}})
@@ -0,0 +1,461 @@
+import os
+import time
+import threading
+import importlib
+import cv2
+import numpy as np
+from hardware_probe import HardwareTier
+
+STAGES = {}
+
+# Stages with heavy optional dependencies register themselves when first used
+LAZY_STAGES = {
+    "onnx": "onnx_stage",
+}
+
+
+def register_stage(name):
+    def decorator(cls):
+        cls.name = name
+        STAGES[name] = cls
+        return cls
+    return decorator
+
+
+class Stage:
+    """A graph node. run() must write its result into dst, which the graph preallocates."""
+
+    name = None
+    # True when run() works on a single-channel image, so the stage can filter just the Y plane
+    luma = False
+    # True when the stage also needs the graph's input frame; the graph sets `self.guide` before run()
+    guided = False
+
+    def __init__(self, **params):
+        self.params = params
+
+    def output_shape(self, in_shape, graph_shape):
+        return in_shape
+
+    def run(self, src, dst):
+        raise NotImplementedError
+
+
+@register_stage("gaussian")
+class GaussianStage(Stage):
+    luma = True
+
+    def __init__(self, ksize=5, sigma=0):
+        super().__init__(ksize=ksize, sigma=sigma)
+        self.ksize = (ksize, ksize)
+        self.sigma = sigma
+
+    def run(self, src, dst):
+        cv2.GaussianBlur(src, self.ksize, self.sigma, dst=dst)
+
+
+@register_stage("bilateral")
+class BilateralStage(Stage):
+    luma = True
+
+    def __init__(self, d=9, sigma_color=75, sigma_space=75):
+        super().__init__(d=d, sigma_color=sigma_color, sigma_space=sigma_space)
+        self.d = d
+        self.sigma_color = sigma_color
+        self.sigma_space = sigma_space
+
+    def run(self, src, dst):
+        cv2.bilateralFilter(src, self.d, self.sigma_color, self.sigma_space, dst=dst)
+
+
+@register_stage("detail")
+class DetailEnhanceStage(Stage):
+    def __init__(self, sigma_s=10, sigma_r=0.15):
+        super().__init__(sigma_s=sigma_s, sigma_r=sigma_r)
+        self.sigma_s = sigma_s
+        self.sigma_r = sigma_r
+
+    def run(self, src, dst):
+        cv2.detailEnhance(src, dst=dst, sigma_s=self.sigma_s, sigma_r=self.sigma_r)
+
+
+@register_stage("downscale")
+class DownscaleStage(Stage):
+    luma = True
+
+    def __init__(self, scale=0.5):
+        super().__init__(scale=scale)
+        self.scale = scale
+
+    def output_shape(self, in_shape, graph_shape):
+        h, w = in_shape[:2]
+        return (max(1, int(h * self.scale)), max(1, int(w * self.scale))) + tuple(in_shape[2:])
+
+    def run(self, src, dst):
+        cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+
+
+@register_stage("upscale")
+class UpscaleStage(Stage):
+    """Back to the graph's input resolution."""
+
+    luma = True
+
+    def output_shape(self, in_shape, graph_shape):
+        return tuple(graph_shape[:2]) + tuple(in_shape[2:])
+
+    def run(self, src, dst):
+        cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_LINEAR)
+
+
+@register_stage("guided_upscale")
+class GuidedUpscaleStage(Stage):
+    """Back to the graph's input resolution, edge-aware: fast guided filter joint upsampling.
+
+    The local linear model q = a * I + b that maps the downscaled input I to the filtered result q
+    is fitted on the small frame with box filters. Only the coefficients are upsampled, then
+    applied to the full-resolution input, so edges come from the original instead of being
+    interpolated. `eps` is in normalized intensity units (0..1).
+    """
+
+    luma = True
+    guided = True
+
+    def __init__(self, radius=4, eps=0.01):
+        super().__init__(radius=radius, eps=eps)
+        self.ksize = (2 * radius + 1, 2 * radius + 1)
+        self.eps = eps * 255.0 * 255.0
+        self.guide = None
+        self.shapes = None
+
+    def output_shape(self, in_shape, graph_shape):
+        return tuple(graph_shape[:2]) + tuple(in_shape[2:])
+
+    def _allocate(self, low_shape, high_shape):
+        self.shapes = (low_shape, high_shape)
+        self.guide_low = np.empty(low_shape, dtype=np.uint8)
+        self.low = [np.empty(low_shape, dtype=np.float32) for _ in range(6)]
+        self.high = [np.empty(high_shape, dtype=np.float32) for _ in range(2)]
+
+    def run(self, src, dst):
+        guide = self.guide
+        if self.shapes != (src.shape, dst.shape):
+            self._allocate(src.shape, dst.shape)
+        I, p, mean_I, mean_p, corr, tmp = self.low
+        a_up, b_up = self.high
+        cv2.resize(guide, (src.shape[1], src.shape[0]), dst=self.guide_low, interpolation=cv2.INTER_AREA)
+        np.copyto(I, self.guide_low)
+        np.copyto(p, src)
+        cv2.boxFilter(I, -1, self.ksize, dst=mean_I)
+        cv2.boxFilter(p, -1, self.ksize, dst=mean_p)
+        # corr = box(I * p) - mean_I * mean_p  (covariance), tmp = box(I * I) - mean_I^2 + eps
+        cv2.multiply(I, p, dst=corr)
+        cv2.boxFilter(corr, -1, self.ksize, dst=corr)
+        cv2.subtract(corr, cv2.multiply(mean_I, mean_p, dst=tmp), dst=corr)
+        cv2.multiply(I, I, dst=tmp)
+        cv2.boxFilter(tmp, -1, self.ksize, dst=tmp)
+        cv2.subtract(tmp, cv2.multiply(mean_I, mean_I, dst=I), dst=tmp)
+        # numpy, not cv2.add: OpenCV 4.x adds a bare Python scalar to channel 0 only
+        tmp += self.eps
+        # a = cov / (var + eps) -> corr, b = mean_p - a * mean_I -> mean_p
+        cv2.divide(corr, tmp, dst=corr)
+        cv2.subtract(mean_p, cv2.multiply(corr, mean_I, dst=tmp), dst=mean_p)
+        cv2.boxFilter(corr, -1, self.ksize, dst=corr)
+        cv2.boxFilter(mean_p, -1, self.ksize, dst=mean_p)
+        size = (dst.shape[1], dst.shape[0])
+        cv2.resize(corr, size, dst=a_up, interpolation=cv2.INTER_LINEAR)
+        cv2.resize(mean_p, size, dst=b_up, interpolation=cv2.INTER_LINEAR)
+        cv2.multiply(a_up, guide, dst=a_up, dtype=cv2.CV_32F)
+        cv2.add(a_up, b_up, dst=dst, dtype=cv2.CV_8U)
+
+
+@register_stage("resize")
+class ResizeStage(Stage):
+    """Fixed scale factor, e.g. 2.0 to upscale a low-resolution remote stream."""
+
+    INTERPOLATION = {"area": cv2.INTER_AREA, "linear": cv2.INTER_LINEAR, "cubic": cv2.INTER_CUBIC,
+                     "lanczos": cv2.INTER_LANCZOS4}
+
+    def __init__(self, scale=2.0, interpolation="cubic"):
+        super().__init__(scale=scale, interpolation=interpolation)
+        self.scale = scale
+        self.interpolation = self.INTERPOLATION[interpolation]
+
+    def output_shape(self, in_shape, graph_shape):
+        h, w = in_shape[:2]
+        return (max(1, int(h * self.scale)), max(1, int(w * self.scale))) + tuple(in_shape[2:])
+
+    def run(self, src, dst):
+        cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=self.interpolation)
+
+
+# Default stage chain per tier
+TIER_GRAPHS = {
+    HardwareTier.TIER_3_NORMAL_CPU: (("gaussian", ()),),
+    HardwareTier.TIER_2_HIGH_CPU: (("bilateral", ()),),
+    HardwareTier.TIER_1_RTX: (("detail", ()),),
+}
+
+
+# Graph worker processes running side by side; process-pool workers set it so stages with their own
+# thread pools (ONNX Runtime) split the machine instead of each sizing for all of it
+POOL_PROCESSES = 1
+
+# Tier 1 runs a real model when one is configured, otherwise the detailEnhance placeholder
+ONNX_MODEL = os.environ.get("LUMENRTC_ONNX_MODEL")
+ONNX_MODEL_SCALE = int(os.environ.get("LUMENRTC_ONNX_SCALE", "1"))
+
+if ONNX_MODEL:
+    model_graph = (("onnx", (("model", ONNX_MODEL), ("scale", ONNX_MODEL_SCALE))),)
+    if ONNX_MODEL_SCALE > 1:
+        # Super-resolution model: feed it a reduced frame so it comes back at full size
+        model_graph = (("downscale", (("scale", 1.0 / ONNX_MODEL_SCALE),)),) + model_graph
+    TIER_GRAPHS[HardwareTier.TIER_1_RTX] = model_graph
+
+
+def freeze_spec(spec):
+    """Turn [("name", {params}) | "name", ...] into a hashable, picklable tuple."""
+    frozen = []
+    for entry in spec:
+        if isinstance(entry, str):
+            name, params = entry, {}
+        else:
+            name, params = entry
+        frozen.append((name, tuple(sorted(dict(params).items()))))
+    return tuple(frozen)
+
+
+def i420_spec(spec):
+    """Run `spec` on the Y plane of an I420 frame ((h * 3 / 2, w) array); chroma is passed through."""
+    return (("i420", ()),) + tuple(spec)
+
+
+def luma_capable(spec):
+    # Every stage can run on the single-channel Y plane and keeps the frame size
+    for entry in freeze_spec(spec):
+        name = entry[0]
+        if name not in STAGES and name in LAZY_STAGES:
+            importlib.import_module(LAZY_STAGES[name])
+        if name not in STAGES or not STAGES[name].luma:
+            return False
+    return True
+
+
+def tiled_spec(spec, tile=64, halo=8, threshold=4, refresh=30):
+    """Refilter only the tiles whose input changed; see FilterGraph. Stages must be local filters
+    (no output pixel depends on input further than `halo` away) and keep the frame size."""
+    params = (("halo", halo), ("refresh", refresh), ("threshold", threshold), ("tile", tile))
+    return (("tiles", params),) + tuple(spec)
+
+
+# Pyramid mode: processing scale per tier. Cheap filters stay at full size; env overrides all tiers.
+PYRAMID_SCALES = {
+    HardwareTier.TIER_3_NORMAL_CPU: 1.0,
+    HardwareTier.TIER_2_HIGH_CPU: 0.5,
+    HardwareTier.TIER_1_RTX: 0.5,
+}
+if os.environ.get("LUMENRTC_PYRAMID_SCALE"):
+    PYRAMID_SCALES = dict.fromkeys(PYRAMID_SCALES, float(os.environ["LUMENRTC_PYRAMID_SCALE"]))
+
+
+def graph_spec(tier, scale=1.0, upsample="linear"):
+    spec = TIER_GRAPHS.get(tier, ())
+    if spec and scale < 1.0:
+        # Run the filter on a downscaled copy and scale the result back up; "guided" recovers
+        # edges from the full-resolution input
+        up = ("guided_upscale", ()) if upsample == "guided" else ("upscale", ())
+        spec = (("downscale", (("scale", scale),)),) + spec + (up,)
+    return spec
+
+
+def pyramid_spec(tier, scale=1.0):
+    """graph_spec for pyramid mode: the tier's pyramid scale on top of `scale`, guided upsample."""
+    return graph_spec(tier, scale * PYRAMID_SCALES.get(tier, 1.0), upsample="guided")
+
+
+class FilterGraph:
+    """Chains registered stages. Intermediate buffers are allocated once per input shape and reused,
+    so steady-state frames allocate nothing.
+
+    `timing_hook(stage_name, elapsed_ms)` is called after every stage when set.
+
+    With a ("tiles", ...) entry the graph keeps its previous output and the input it came from.
+    Each frame, the mean absolute difference per tile against that reference picks the changed
+    tiles; every tile row with changes is refiltered once, from its first to its last changed tile
+    plus a `halo` border for filter context. Everything else reuses the previous output. A full
+    pass runs every `refresh` frames and whenever most tiles changed.
+    """
+
+    def __init__(self, spec, timing_hook=None):
+        self.spec = freeze_spec(spec)
+        self.stages = []
+        # A leading ("i420", ()) entry means the input is planar I420 and stages see only the Y plane
+        entries = list(self.spec)
+        self.planar = bool(entries) and entries[0][0] == "i420"
+        if self.planar:
+            entries.pop(0)
+        self.tiling = dict(entries.pop(0)[1]) if entries and entries[0][0] == "tiles" else None
+        self.output = None
+        self.reference = None
+        self.tiled_output = None
+        self.frames_since_refresh = 0
+        self.reprocessed = 1.0  # fraction of the last frame that was refiltered
+        for name, params in entries:
+            if name not in STAGES and name in LAZY_STAGES:
+                importlib.import_module(LAZY_STAGES[name])
+            if name not in STAGES:
+                raise ValueError(f"Unknown filter stage: {name}")
+            self.stages.append(STAGES[name](**dict(params)))
+        self.timing_hook = timing_hook
+        self.shape = None
+        self.buffers = []
+
+    def _allocate(self, shape):
+        self.shape = shape
+        self.buffers = []
+        current = shape
+        for stage in self.stages:
+            current = stage.output_shape(current, shape)
+            self.buffers.append(np.empty(current, dtype=np.uint8))
+
+    def run(self, src, dst=None):
+        """Process src. Writes into dst when given, otherwise returns a graph-owned buffer."""
+        if self.planar:
+            return self._run_planar(src, dst)
+        return self._run(src, dst)
+
+    def _run_planar(self, src, dst):
+        if dst is None:
+            if self.output is None or self.output.shape != src.shape:
+                self.output = np.empty_like(src)
+            dst = self.output
+        rows = src.shape[0] * 2 // 3
+        self._run(src[:rows], dst[:rows])
+        np.copyto(dst[rows:], src[rows:])
+        return dst
+
+    def _run(self, src, dst=None):
+        if self.tiling is None or not self.stages:
+            return self._run_stages(src, dst)
+        return self._run_tiled(src, dst)
+
+    def _run_tiled(self, src, dst):
+        if self.reference is None or self.reference.shape != src.shape:
+            self._allocate_tiles(src.shape)
+            full = True
+        else:
+            full = self.frames_since_refresh >= self.tiling["refresh"]
+        if not full:
+            changed = self._changed_tiles(src)
+            full = changed.mean() > 0.5
+        if full:
+            self._run_stages(src, self.tiled_output)
+            np.copyto(self.reference, src)
+            self.frames_since_refresh = 0
+            self.reprocessed = 1.0
+        else:
+            self.frames_since_refresh += 1
+            self._refilter_rows(src, changed)
+        if dst is None:
+            return self.tiled_output
+        np.copyto(dst, self.tiled_output)
+        return dst
+
+    def _allocate_tiles(self, shape):
+        tile = self.tiling["tile"]
+        h, w = shape[:2]
+        self.reference = np.empty(shape, dtype=np.uint8)
+        self.tiled_output = np.empty(shape, dtype=np.uint8)
+        self.diff = np.empty(shape, dtype=np.uint8)
+        self.diff_gray = np.empty((h, w), dtype=np.uint8)
+        self.tile_rows = np.arange(0, h, tile)
+        self.tile_cols = np.arange(0, w, tile)
+        # Summed difference above which a tile counts as changed; edge tiles may be smaller
+        heights = np.minimum(tile, h - self.tile_rows)
+        widths = np.minimum(tile, w - self.tile_cols)
+        self.tile_limits = np.outer(heights, widths) * self.tiling["threshold"]
+        self.frames_since_refresh = 0
+
+    def _changed_tiles(self, src):
+        cv2.absdiff(src, self.reference, dst=self.diff)
+        diff = self.diff
+        if diff.ndim == 3:
+            diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY, dst=self.diff_gray)
+        sums = np.add.reduceat(np.add.reduceat(diff, self.tile_rows, axis=0, dtype=np.uint32),
+                               self.tile_cols, axis=1)
+        return sums > self.tile_limits
+
+    def _refilter_rows(self, src, changed):
+        tile = self.tiling["tile"]
+        halo = self.tiling["halo"]
+        h, w = src.shape[:2]
+        area = 0
+        for row in np.flatnonzero(changed.any(axis=1)):
+            cols = np.flatnonzero(changed[row])
+            y0, y1 = row * tile, min(h, (row + 1) * tile)
+            x0, x1 = cols[0] * tile, min(w, (cols[-1] + 1) * tile)
+            hy0, hy1 = max(0, y0 - halo), min(h, y1 + halo)
+            hx0, hx1 = max(0, x0 - halo), min(w, x1 + halo)
+            result = self._run_region(src[hy0:hy1, hx0:hx1])
+            np.copyto(self.tiled_output[y0:y1, x0:x1], result[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0])
+            np.copyto(self.reference[y0:y1, x0:x1], src[y0:y1, x0:x1])
+            area += (y1 - y0) * (x1 - x0)
+        self.reprocessed = area / (h * w)
+
+    def _run_region(self, src):
+        # Stage outputs go into the top-left corner of the full-frame buffers, so regions allocate nothing
+        if self.shape != self.reference.shape:
+            self._allocate(self.reference.shape)
+        region_shape = src.shape
+        current = src
+        for stage, buffer in zip(self.stages, self.buffers):
+            out_shape = stage.output_shape(current.shape, region_shape)
+            out = buffer[:out_shape[0], :out_shape[1]]
+            if stage.guided:
+                stage.guide = src
+            stage.run(current, out)
+            current = out
+        return current
+
+    def _run_stages(self, src, dst=None):
+        if src.shape != self.shape:
+            self._allocate(src.shape)
+        if not self.stages:
+            if dst is None:
+                return src
+            np.copyto(dst, src)
+            return dst
+
+        current = src
+        last = len(self.stages) - 1
+        for i, stage in enumerate(self.stages):
+            out = self.buffers[i]
+            if i == last and dst is not None and dst.shape == out.shape:
+                out = dst
+            if stage.guided:
+                stage.guide = src
+            if self.timing_hook is None:
+                stage.run(current, out)
+            else:
+                start = time.perf_counter()
+                stage.run(current, out)
+                self.timing_hook(stage.name, (time.perf_counter() - start) * 1000)
+            current = out
+        if dst is not None and current is not dst:
+            np.copyto(dst, current)
+            return dst
+        return current
+
+
+_local = threading.local()
+
+
+def cached_graph(spec):
+    """Per-thread graph cache: graphs own their buffers, so threads must not share them."""
+    graphs = getattr(_local, "graphs", None)
+    if graphs is None:
+        graphs = _local.graphs = {}
+    graph = graphs.get(spec)
+    if graph is None:
+        graph = graphs[spec] = FilterGraph(spec)
+    return graph
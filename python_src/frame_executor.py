@@ -0,0 +1,158 @@
+import asyncio
+import sys
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import filter_graph
+from filter_graph import cached_graph, graph_spec
+
+# Per-process cache of attached shared memory blocks (worker side)
+_attached = {}
+
+
+def _init_worker(workers):
+    import cv2
+    # One pool worker per core already; avoid oversubscribing with OpenCV's own threads
+    cv2.setNumThreads(1)
+    filter_graph.POOL_PROCESSES = workers
+
+
+def _process_shared_slot(shm_name, shape, spec, live):
+    # Detach from slots the executor has released (resolution change, executor rebuild)
+    for name in [name for name in _attached if name not in live]:
+        _attached.pop(name).close()
+    shm = _attached.get(shm_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _attached[shm_name] = shm
+    size = int(np.prod(shape))
+    src = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf[:size])
+    dst = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf[size:2 * size])
+    graph = cached_graph(spec)
+    start = time.perf_counter()
+    graph.run(src, dst=dst)
+    return (time.perf_counter() - start) * 1000
+
+
+def _process_local_slot(src, dst, spec):
+    graph = cached_graph(spec)
+    start = time.perf_counter()
+    graph.run(src, dst=dst)
+    return (time.perf_counter() - start) * 1000
+
+
+class FrameSlot:
+    """Input/output frame pair. Backed by shared memory in process mode so frames are never pickled."""
+
+    def __init__(self, shape, shared):
+        self.shape = shape
+        self.shm = None
+        size = int(np.prod(shape))
+        if shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=2 * size)
+            self.input = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf[:size])
+            self.output = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf[size:2 * size])
+        else:
+            self.input = np.empty(shape, dtype=np.uint8)
+            self.output = np.empty(shape, dtype=np.uint8)
+
+    def close(self):
+        if self.shm is not None:
+            # Drop our views before closing the mapping
+            self.input = self.output = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class FrameExecutor:
+    """Runs the filter graph off the event loop on a thread or process pool.
+
+    Up to `in_flight` frames are processed concurrently; results are returned in submission order.
+    """
+
+    def __init__(self, tier, mode="thread", workers=1, in_flight=None):
+        # Stage chain for the next submitted frame; workers build and cache their own graph per spec
+        self.spec = graph_spec(tier)
+        self.mode = mode
+        self.workers = workers
+        self.in_flight = in_flight or workers
+        self.pending = collections.deque()
+        self.slots = {}
+        self.free_slots = []
+        self.next_slot = 0
+        self.last_returned = None
+        if mode == "process":
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,))
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lumen-proc")
+        print(f"Frame Executor: {mode} pool, {workers} worker(s), {self.in_flight} frame(s) in flight")
+
+    def _slot_for(self, shape):
+        # Recycle a free slot of the right size; slots left over from a resolution change are dropped
+        while self.free_slots:
+            idx = self.free_slots.pop()
+            if self.slots[idx].shape == shape:
+                return idx
+            self.slots.pop(idx).close()
+        idx = self.next_slot
+        self.next_slot += 1
+        self.slots[idx] = FrameSlot(shape, shared=(self.mode == "process"))
+        return idx
+
+    def submit(self, frame, meta=None):
+        loop = asyncio.get_running_loop()
+        idx = self._slot_for(frame.shape)
+        slot = self.slots[idx]
+        np.copyto(slot.input, frame)
+        if self.mode == "process":
+            live = tuple(s.shm.name for s in self.slots.values())
+            future = loop.run_in_executor(self.pool, _process_shared_slot, slot.shm.name, slot.shape, self.spec, live)
+        else:
+            future = loop.run_in_executor(self.pool, _process_local_slot, slot.input, slot.output, self.spec)
+        self.pending.append((idx, future, meta))
+
+    @property
+    def ready(self):
+        return len(self.pending) >= self.in_flight
+
+    async def next_result(self):
+        """Await the oldest submitted frame. Returns (output, process_time_ms, meta).
+
+        The output array belongs to the executor and stays valid until the next submit().
+        """
+        idx, future, meta = self.pending.popleft()
+        try:
+            process_time_ms = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The worker may still be writing the slot; it goes back to the ring once the work is done
+            future.add_done_callback(lambda done: self._release(idx, done))
+            raise
+        except Exception:
+            self._release(idx)
+            raise
+        if self.last_returned is not None:
+            self.free_slots.append(self.last_returned)
+        self.last_returned = idx
+        return self.slots[idx].output, process_time_ms, meta
+
+    def _release(self, idx, done=None):
+        if done is not None and not done.cancelled():
+            done.exception()  # retrieved, so a failure after cancellation is not reported as unhandled
+        if idx in self.slots:
+            self.free_slots.append(idx)
+
+    def shutdown(self):
+        if sys.version_info >= (3, 9):
+            self.pool.shutdown(wait=True, cancel_futures=True)
+        else:
+            # cancel_futures is 3.9+; on 3.8 the few frames still queued are processed, then discarded
+            self.pool.shutdown(wait=True)
+        self.pending.clear()
+        self.last_returned = None
+        for slot in self.slots.values():
+            slot.close()
+        self.slots = {}
+        self.free_slots = []
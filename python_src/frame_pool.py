@@ -0,0 +1,59 @@
+import numpy as np
+from av import VideoFrame
+
+
+class VideoFramePool:
+    """Round-robin pool of av.VideoFrame objects that are refilled in place instead of reallocated.
+
+    A frame is reused `size` frames later, so the pool must be larger than the number of frames
+    the consumer (encoder, relay) can hold on to at once.
+    """
+
+    def __init__(self, format="bgr24", size=4):
+        self.format = format
+        self.size = size
+        self.frames = []
+        self.views = []
+        self.index = 0
+        self.shape = None
+
+    def _allocate(self, width, height):
+        self.shape = (height, width)
+        self.frames = []
+        self.views = []
+        for _ in range(self.size):
+            frame = VideoFrame(width, height, self.format)
+            if self.format == "yuv420p":
+                views = tuple(self._plane_view(frame.planes[i], h, w) for i, (h, w) in
+                              enumerate(((height, width), (height // 2, width // 2), (height // 2, width // 2))))
+            else:
+                views = self._plane_view(frame.planes[0], height, width * 3).reshape(height, width, 3)
+            self.frames.append(frame)
+            self.views.append(views)
+
+    @staticmethod
+    def _plane_view(plane, height, row_bytes):
+        # Writable ndarray over the plane, skipping any row padding
+        rows = np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)
+        return rows[:height, :row_bytes]
+
+    def from_ndarray(self, array, pts, time_base):
+        """Copy a frame in: (h, w, 3) for bgr24, or planar I420 as (h * 3 / 2, w) for yuv420p."""
+        height, width = array.shape[:2]
+        if self.format == "yuv420p":
+            height = height * 2 // 3
+        if self.shape != (height, width):
+            self._allocate(width, height)
+        frame = self.frames[self.index]
+        if self.format == "yuv420p":
+            y, u, v = self.views[self.index]
+            chroma = height // 4
+            np.copyto(y, array[:height])
+            np.copyto(u, array[height:height + chroma].reshape(u.shape))
+            np.copyto(v, array[height + chroma:].reshape(v.shape))
+        else:
+            np.copyto(self.views[self.index], array)
+        self.index = (self.index + 1) % self.size
+        frame.pts = pts
+        frame.time_base = time_base
+        return frame
@@ -1,15 +1,141 @@
 import os
+import sys
+import json
+import time
+import hashlib
+import platform
 import multiprocessing
-import onnxruntime as ort
+import importlib.metadata
+
+CACHE_DIR = os.environ.get("LUMENRTC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".lumenrtc"))
+CACHE_FILE = os.path.join(CACHE_DIR, "hardware_cache.json")
+
+# A tier qualifies when its filter fits the 15 fps frame budget with some headroom
+FRAME_BUDGET_MS = 1000.0 / 15
+BUDGET_HEADROOM = 0.8
+CALIBRATION_VERSION = 2
 
 class HardwareTier:
     TIER_1_RTX = "Tier 1: RTX GPU (Maxine/TensorRT)"
     TIER_2_HIGH_CPU = "Tier 2: High-Performance CPU (ONNX AVX2)"
     TIER_3_NORMAL_CPU = "Tier 3: Standard CPU (Basic Filters)"
 
+def _cpu_model():
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/cpuinfo") as f:
+                for line in f:
+                    if line.startswith("model name"):
+                        return line.split(":", 1)[1].strip()
+        except OSError:
+            pass
+    return platform.processor() or platform.machine()
+
+def _package_versions(*names):
+    versions = {}
+    for dist in importlib.metadata.distributions():
+        name = (dist.metadata["Name"] or "").lower()
+        if any(name.startswith(prefix) for prefix in names):
+            versions[name] = dist.version
+    return versions
+
+def hardware_fingerprint():
+    """Identifies the machine and the libraries that decide filter speed, without importing them.
+
+    The installed onnxruntime distribution (e.g. onnxruntime-gpu) stands in for the GPU stack, so a
+    cache hit never needs to import onnxruntime or spawn nvidia-smi.
+    """
+    info = {
+        "cpu": _cpu_model(),
+        "cores": multiprocessing.cpu_count(),
+        "os": f"{platform.system()} {platform.release()}",
+        "python": platform.python_version(),
+        "packages": _package_versions("opencv", "numpy", "onnxruntime"),
+        "onnx_model": os.environ.get("LUMENRTC_ONNX_MODEL"),
+        # Bumped when tier selection changes, so older cached picks are recalibrated
+        "calibration": CALIBRATION_VERSION,
+    }
+    digest = hashlib.sha256(json.dumps(info, sort_keys=True).encode()).hexdigest()[:16]
+    return digest, info
+
+def calibrate_tiers(width=640, height=480, frames=15, warmup=2):
+    """Median ms/frame of each tier's actual filter graph on synthetic frames."""
+    import numpy as np
+    from filter_graph import FilterGraph, graph_spec
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    out = np.empty_like(frame)
+    results = {}
+    for tier in (HardwareTier.TIER_3_NORMAL_CPU, HardwareTier.TIER_2_HIGH_CPU, HardwareTier.TIER_1_RTX):
+        try:
+            graph = FilterGraph(graph_spec(tier))
+            for _ in range(warmup):
+                graph.run(frame, dst=out)
+            samples = []
+            for _ in range(frames):
+                start = time.perf_counter()
+                graph.run(frame, dst=out)
+                samples.append((time.perf_counter() - start) * 1000)
+            results[tier] = round(float(np.median(samples)), 2)
+        except Exception as e:
+            print(f"Calibration of {tier} failed: {e}")
+    return results
+
+def _load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = CACHE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, CACHE_FILE)
+    except OSError as e:
+        print(f"Could not write hardware cache: {e}")
+
 class HardwareProvider:
     @staticmethod
-    def get_capabilities():
+    def get_capabilities(recalibrate=False):
+        fingerprint, info = hardware_fingerprint()
+        cache = _load_cache()
+        if not recalibrate and fingerprint in cache:
+            specs = dict(cache[fingerprint]["specs"])
+            specs["source"] = "cache"
+            return specs
+
+        print("Calibrating hardware tier (first run on this machine/library set)...")
+        specs = HardwareProvider.probe()
+        specs["calibration_ms"] = calibrate_tiers()
+
+        # Highest tier whose measured filter time fits the frame budget; Tier 3 is the floor
+        budget = FRAME_BUDGET_MS * BUDGET_HEADROOM
+        tier = HardwareTier.TIER_3_NORMAL_CPU
+        candidates = [HardwareTier.TIER_2_HIGH_CPU]
+        if specs["has_cuda"]:
+            # The RTX tier's CPU fallback can fit the budget, but without CUDA it is not that tier
+            candidates.append(HardwareTier.TIER_1_RTX)
+        for candidate in candidates:
+            measured = specs["calibration_ms"].get(candidate)
+            if measured is not None and measured <= budget:
+                tier = candidate
+        specs["tier"] = tier
+
+        cache[fingerprint] = {"specs": specs, "fingerprint": info, "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        _save_cache(cache)
+        specs = dict(specs)
+        specs["source"] = "calibrated"
+        return specs
+
+    @staticmethod
+    def probe():
+        import onnxruntime as ort
+
         specs = {
             "tier": HardwareTier.TIER_3_NORMAL_CPU,
             "cpu_cores": multiprocessing.cpu_count(),
@@ -21,9 +147,8 @@ class HardwareProvider:
         providers = ort.get_available_providers()
         if 'CUDAExecutionProvider' in providers:
             specs["has_cuda"] = True
-            specs["tier"] = HardwareTier.TIER_1_RTX
             specs["gpu_name"] = "CUDA Capable GPU" # ONNX Runtime doesn't easily give name without session
-            
+
             # Try to get more info via nvidia-smi if available (optional)
             try:
                 import subprocess
@@ -33,20 +158,13 @@ class HardwareProvider:
             except:
                 pass
 
-        # 2. Check CPU if no GPU
-        if not specs["has_cuda"]:
-            # Threshold: Using 12 logical cores as the split point
-            if specs["cpu_cores"] > 12:
-                specs["tier"] = HardwareTier.TIER_2_HIGH_CPU
-            else:
-                specs["tier"] = HardwareTier.TIER_3_NORMAL_CPU
-
         return specs
 
 if __name__ == "__main__":
     print("Probing Hardware...")
-    specs = HardwareProvider.get_capabilities()
+    specs = HardwareProvider.get_capabilities(recalibrate="--recalibrate" in sys.argv)
     print(f"Cores: {specs['cpu_cores']}")
     print(f"CUDA: {specs['has_cuda']}")
     print(f"GPU: {specs['gpu_name']}")
-    print(f"Detected: {specs['tier']}")
+    print(f"Calibration (ms/frame): {specs.get('calibration_ms')}")
+    print(f"Detected: {specs['tier']} ({specs['source']})")
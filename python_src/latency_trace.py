@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+import aiortc
+import numpy as np
+from metrics import REGISTRY
+
+STAGES = ("capture", "processing", "encode_network", "decode", "display")
+G2G_MS = REGISTRY.histogram("lumen_g2g_ms", help="Glass-to-glass latency: capture to remote display")
+G2G_STAGE_MS = {stage: REGISTRY.histogram(f"lumen_g2g_{stage}_ms", help=f"Glass-to-glass latency, {stage} stage")
+                for stage in STAGES}
+MARKERS_MISSED = REGISTRY.counter("lumen_g2g_markers_missed_total",
+                                  help="Remote frames whose latency marker was missing or failed its checksum")
+
+# Marker fields, most significant bit first. Times are wall-clock milliseconds, so both ends need
+# the same clock: same host, or NTP-synced hosts (the sync error then lands in encode_network).
+SEQ_BITS = 12
+TIME_BITS = 24
+OFFSET_BITS = 12
+CHECK_BITS = 8
+ROWS = 2
+BITS = SEQ_BITS + TIME_BITS + 2 * OFFSET_BITS + CHECK_BITS
+COLUMNS = -(-BITS // ROWS)
+
+
+def wall_ms():
+    return time.time() * 1000
+
+
+def cell_size(height):
+    # Relative to the frame height so a receiver sees the same grid after the sender downscales
+    return max(4, height // 60)
+
+
+def pack(seq, captured_ms, picked_ms, sent_ms):
+    """Bit list for one frame: seq, capture time, then pickup and send as offsets from capture."""
+    picked = min(int(picked_ms - captured_ms), (1 << OFFSET_BITS) - 1)
+    sent = min(int(sent_ms - captured_ms), (1 << OFFSET_BITS) - 1)
+    value = seq % (1 << SEQ_BITS)
+    value = (value << TIME_BITS) | int(captured_ms) % (1 << TIME_BITS)
+    value = (value << OFFSET_BITS) | max(picked, 0)
+    value = (value << OFFSET_BITS) | max(sent, 0)
+    payload_bits = BITS - CHECK_BITS
+    check = zlib.crc32(value.to_bytes((payload_bits + 7) // 8, "big")) & ((1 << CHECK_BITS) - 1)
+    value = (value << CHECK_BITS) | check
+    return [(value >> (BITS - 1 - i)) & 1 for i in range(BITS)]
+
+
+def unpack(bits, now_ms):
+    """Inverse of pack(); None when the checksum fails. Times are unwrapped against now_ms."""
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bit
+    check = value & ((1 << CHECK_BITS) - 1)
+    value >>= CHECK_BITS
+    payload_bits = BITS - CHECK_BITS
+    if zlib.crc32(value.to_bytes((payload_bits + 7) // 8, "big")) & ((1 << CHECK_BITS) - 1) != check:
+        return None
+    sent = value & ((1 << OFFSET_BITS) - 1)
+    value >>= OFFSET_BITS
+    picked = value & ((1 << OFFSET_BITS) - 1)
+    value >>= OFFSET_BITS
+    captured = value & ((1 << TIME_BITS) - 1)
+    seq = value >> TIME_BITS
+    # Only the low 24 bits of the capture time travel (about 4.6 hours); the rest comes from our clock
+    age = (int(now_ms) - captured) % (1 << TIME_BITS)
+    captured_ms = now_ms - age
+    return {"seq": seq, "captured": captured_ms, "picked": captured_ms + picked, "sent": captured_ms + sent}
+
+
+def marker_origin(height, cell):
+    # Bottom-left corner; the stats overlay sits top-left
+    return height - (ROWS + 1) * cell, cell
+
+
+def draw_marker(luma, bits):
+    """Write the bits as black/white cells into a luma image (or a BGR one, all channels)."""
+    height = luma.shape[0]
+    cell = cell_size(height)
+    top, left = marker_origin(height, cell)
+    for i, bit in enumerate(bits):
+        row, column = divmod(i, COLUMNS)
+        y, x = top + row * cell, left + column * cell
+        luma[y:y + cell, x:x + cell] = 255 if bit else 0
+
+
+def read_marker(luma):
+    """Sample the centre of every cell; threshold at mid-grey."""
+    height = luma.shape[0]
+    cell = cell_size(height)
+    top, left = marker_origin(height, cell)
+    centre = cell // 2
+    bits = []
+    for i in range(BITS):
+        row, column = divmod(i, COLUMNS)
+        y, x = top + row * cell + centre, left + column * cell + centre
+        bits.append(1 if luma[y, x] >= 128 else 0)
+    return bits
+
+
+def luma_of(frame):
+    """Y plane of a decoded av.VideoFrame as a (height, width) view, without a colour conversion."""
+    plane = frame.planes[0]
+    rows = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+    return rows[:frame.height, :frame.width]
+
+
+class FrameStamper:
+    """Sending side: stamps each outgoing frame with its sequence number and timestamps."""
+
+    def __init__(self):
+        self.seq = 0
+
+    def stamp(self, image, captured_ms, picked_ms):
+        # I420 frames are (height * 3/2, width); the marker goes on the luma rows
+        luma = image[:image.shape[0] * 2 // 3] if image.ndim == 2 else image
+        draw_marker(luma, pack(self.seq, captured_ms, picked_ms, wall_ms()))
+        self.seq += 1
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    values = np.asarray(samples)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(samples), "p50": round(float(p50), 2), "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2), "max": round(float(values.max()), 2)}
+
+
+class LatencyTracer:
+    """Receiving side: decodes markers from a remote track and keeps per-stage latency samples.
+
+    Stages: capture (camera to pipeline pickup), processing (filters, overlay), encode_network (encode,
+    packetize, pacing, transport, jitter buffer; ends when aiortc has reassembled the frame),
+    decode (decoder queue and decode) and display (receive pipeline up to the sink).
+    """
+
+    def __init__(self, name="remote", report_every=150, history=2000):
+        self.name = name
+        self.report_every = report_every
+        self.samples = {stage: collections.deque(maxlen=history) for stage in STAGES + ("total",)}
+        # RTP timestamp -> wall ms when the encoded frame reached the decoder queue
+        self.assembled = collections.OrderedDict()
+        self.frames = 0
+        self.missed = 0
+
+    def watch_receiver(self, receiver):
+        """Note when each complete encoded frame is handed to aiortc's decoder thread.
+
+        Returns False, after a warning, when this aiortc has no decoder queue to tap.
+        """
+        decoder_queue = getattr(receiver, "_RTCRtpReceiver__decoder_queue", None)
+        if decoder_queue is None or not hasattr(decoder_queue, "put"):
+            print(f"[PERF] aiortc {aiortc.__version__} has no RTCRtpReceiver decoder queue (tested with the "
+                  f"version pinned in requirements.txt); latency tracing disabled")
+            return False
+        put = decoder_queue.put
+
+        def timed_put(item, *args, **kwargs):
+            if item is not None:
+                self.assembled[item[1].timestamp] = wall_ms()
+                while len(self.assembled) > 64:
+                    self.assembled.popitem(last=False)
+            put(item, *args, **kwargs)
+
+        decoder_queue.put = timed_put
+        return True
+
+    def received(self, frame):
+        """Call as the decoded frame comes off the track. Returns a mark for displayed(), or None."""
+        now = wall_ms()
+        marker = unpack(read_marker(luma_of(frame)), now)
+        if marker is None:
+            self.missed += 1
+            MARKERS_MISSED.inc()
+            return None
+        marker["assembled"] = self.assembled.pop(frame.pts, now)
+        marker["received"] = now
+        return marker
+
+    def displayed(self, mark):
+        if mark is None:
+            return
+        now = wall_ms()
+        stages = {
+            "capture": mark["picked"] - mark["captured"],
+            "processing": mark["sent"] - mark["picked"],
+            "encode_network": mark["assembled"] - mark["sent"],
+            "decode": mark["received"] - mark["assembled"],
+            "display": now - mark["received"],
+        }
+        for stage, value in stages.items():
+            self.samples[stage].append(value)
+            G2G_STAGE_MS[stage].record(value)
+        total = now - mark["captured"]
+        self.samples["total"].append(total)
+        G2G_MS.record(total)
+        self.frames += 1
+        if self.report_every and self.frames % self.report_every == 0:
+            p = self.report()
+            print(f"[PERF] Glass-to-glass ({self.name}): p50 {p['total']['p50']} ms, p95 {p['total']['p95']} ms "
+                  f"(" + ", ".join(f"{s} {p[s]['p50']}" for s in STAGES) + ")")
+
+    def report(self):
+        report = {stage: percentiles(list(values)) for stage, values in self.samples.items()}
+        report["markers_missed"] = self.missed
+        return report
+
+
+# --- Loopback harness: sender and receiver in two processes, joined by a local signaling server ---
+
+def run_peer(role, url, room, seconds, tier, out_path):
+    asyncio.run(_peer(role, url, room, seconds, tier, out_path))
+
+
+async def _peer(role, url, room, seconds, tier, out_path):
+    from signaling_client import SignalingClient
+    from rtc_manager import RTCManager
+
+    signaling = SignalingClient(url, None, None, None, room_id=room, log=False)
+    rtc = RTCManager(signaling, trace_latency=role == "receiver")
+    track = None
+    if role == "sender":
+        from capture import SyntheticSource
+        from media_pipeline import MediaPipelineTrack
+        from hardware_probe import HardwareTier
+        track = MediaPipelineTrack({"tier": getattr(HardwareTier, tier)}, source=SyntheticSource(fps=30), preview=False, trace=True)
+        rtc.set_local_video_track(track)
+
+        async def on_user_connected(user_id):
+            await rtc.create_offer(user_id)
+        signaling.set_on_user_connected(on_user_connected)
+    signaling.on_offer_callback = rtc.handle_offer
+    signaling.on_answer_callback = rtc.handle_answer
+    signaling.on_candidate_callback = rtc.handle_candidate
+    await signaling.connect()
+    try:
+        if role == "receiver":
+            # The sender is already in the room; our joining fires its user-connected handler, which calls us
+            await asyncio.sleep(seconds)
+            tracers = [peer.tracer for peer in rtc.peers.values() if peer.tracer is not None]
+            report = tracers[0].report() if tracers else {}
+            with open(out_path, "w") as f:
+                json.dump(report, f)
+        else:
+            await asyncio.sleep(seconds)
+    finally:
+        await signaling.close()
+        await rtc.close()
+        if track is not None:
+            track.release()
+
+
+async def run_loopback(port, seconds, tier):
+    from signaling_server import start_server
+
+    runner = await start_server("127.0.0.1", port, log=False)
+    url = f"http://127.0.0.1:{port}"
+    room = f"g2g-{os.getpid()}"
+    out_path = os.path.abspath(f"g2g-{os.getpid()}.json")
+    ctx = multiprocessing.get_context("spawn")
+    sender = ctx.Process(target=run_peer, args=("sender", url, room, seconds + 6, tier, out_path))
+    receiver = ctx.Process(target=run_peer, args=("receiver", url, room, seconds, tier, out_path))
+    loop = asyncio.get_running_loop()
+    try:
+        sender.start()
+        await asyncio.sleep(3)
+        receiver.start()
+        await loop.run_in_executor(None, receiver.join, seconds + 30)
+        await loop.run_in_executor(None, sender.join, 10)
+    finally:
+        for process in (sender, receiver):
+            if process.is_alive():
+                process.terminate()
+        await runner.cleanup()
+    if not os.path.exists(out_path):
+        return {}
+    with open(out_path) as f:
+        report = json.load(f)
+    os.remove(out_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Glass-to-glass latency between two local processes over loopback")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=3200, help="Port for the in-process signaling server")
+    parser.add_argument("--tier", default="TIER_3_NORMAL_CPU",
+                        choices=("TIER_1_RTX", "TIER_2_HIGH_CPU", "TIER_3_NORMAL_CPU"), help="Sender's processing tier")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit non-zero when the total p95 is above this (CI)")
+    parser.add_argument("--out", default="g2g_latency.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_loopback(args.port, args.seconds, args.tier))
+    total = report.get("total", {})
+    if not total.get("count"):
+        print("No traced frames received")
+        sys.exit(1)
+    for stage in STAGES + ("total",):
+        p = report[stage]
+        print(f"  {stage:14s} n={p['count']:<5} p50={p['p50']} p95={p['p95']} p99={p['p99']} max={p['max']}")
+    print(f"  markers missed: {report['markers_missed']}")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
+    if args.max_p95_ms is not None and total["p95"] > args.max_p95_ms:
+        print(f"Glass-to-glass p95 {total['p95']} ms is above {args.max_p95_ms} ms")
+        sys.exit(1)
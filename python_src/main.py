@@ -1,81 +1,173 @@
+from startup import REPORT, MEDIA_MODULES, background_import
 import asyncio
-import cv2
+import os
+import sys
 from hardware_probe import HardwareProvider
 from signaling_client import SignalingClient
-from rtc_manager import RTCManager
-from media_pipeline import MediaPipelineTrack
+from data_channel import Messenger
+from metrics import start_metrics_server, push_metrics
+import runtime
 
 async def main():
-    import sys
     role = "joiner" # default
-    if len(sys.argv) > 1:
-        role = sys.argv[1].lower() # "host" or "joiner"
+    positional = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if positional:
+        role = positional[0].lower() # "host" or "joiner"
+    # --no-preview: headless relay nodes skip the local loopback window entirely
+    preview = "--no-preview" not in sys.argv
         
     print(f"Starting LumenRTC (Python) as {role.upper()}...")
-    
-    # 1. Hardware Probe
-    specs = HardwareProvider.get_capabilities()
-    print(f"Hardware Detected: {specs['tier']}")
-    if specs['has_cuda']:
-        print(f"GPU: {specs['gpu_name']}")
+    loop = asyncio.get_running_loop()
+    # Long-running tasks and signaling callbacks are supervised; the monitor reports (with a stack)
+    # any callback that blocks the loop longer than LUMENRTC_LOOP_STALL_MS
+    supervisor = runtime.Supervisor()
+    monitor = runtime.LoopLagMonitor(threshold_ms=float(os.environ.get("LUMENRTC_LOOP_STALL_MS", 100)))
+    monitor.start()
+
+    # Fast startup: join the room first and load cv2/av/aiortc in the background while the
+    # call is negotiated. Offers and peers that arrive early wait on media_ready.
+    media_loading = background_import(MEDIA_MODULES)
+
+    # 1. Hardware Probe (instant on a cache hit; first-run calibration runs off the loop)
+    probing = loop.run_in_executor(None, lambda: HardwareProvider.get_capabilities(recalibrate="--recalibrate" in sys.argv))
 
     # 2. Setup Components
-    # TODO: Make this configurable via config file or argument
-    SIGNALING_URL = "https://video-call-stremo-lumenrtc.onrender.com" 
-    # SIGNALING_URL = "http://localhost:3000" # Uncomment for local dev
+    # LUMENRTC_SIGNALING_URL=http://localhost:3000 for local dev (node signaling/server.js or python signaling_server.py)
+    SIGNALING_URL = os.environ.get("LUMENRTC_SIGNALING_URL", "https://video-call-stremo-lumenrtc.onrender.com")
     
     signaling = SignalingClient(SIGNALING_URL, None, None, None)
-    rtc = RTCManager(signaling)
-    
-    # 3. Media Pipeline
-    video_track = MediaPipelineTrack(specs)
-    rtc.set_local_video_track(video_track)
-    
-    # 4. Wire up Callbacks
-    signaling.on_offer_callback = rtc.handle_offer
-    signaling.on_answer_callback = rtc.handle_answer
-    signaling.on_candidate_callback = rtc.handle_candidate
-    
+    # Hardware info and metrics ride the peer data channels once connected, signaling before that
+    messenger = Messenger(signaling)
+    specs = None
+    rtc = None
+    video_track = None
+    recorder = None
+    metrics_server = None
+    media_ready = asyncio.Event()
+
+    async def setup_media():
+        nonlocal specs, rtc, video_track, recorder
+        specs = await probing
+        REPORT.mark("hardware probed")
+        print(f"Hardware Detected: {specs['tier']} ({specs.get('source')})")
+        if specs['has_cuda']:
+            print(f"GPU: {specs['gpu_name']}")
+        await media_loading
+        REPORT.mark("media modules loaded")
+
+        from rtc_manager import RTCManager
+        from media_pipeline import MediaPipelineTrack
+        from receive_pipeline import receive_spec
+        from preview import PreviewSink
+        # --enhance-remote runs our tier filter on incoming video, --upscale-remote doubles its size
+        remote_spec = receive_spec(specs['tier'] if "--enhance-remote" in sys.argv else None,
+                                   2.0 if "--upscale-remote" in sys.argv else 1.0)
+        remote_sink = (lambda peer_id: PreviewSink(f"LumenRTC Remote {peer_id}")) if preview else None
+        # --record archives the outgoing video (plus each remote one with --record-remote) from the
+        # packets already encoded for the call, into LUMENRTC_RECORD_DIR
+        if "--record" in sys.argv or "--record-remote" in sys.argv:
+            from recording import CallRecorder
+            recorder = CallRecorder(os.environ.get("LUMENRTC_RECORD_DIR", "recordings"),
+                                    record_remote="--record-remote" in sys.argv)
+        # --trace-latency: stamp outgoing frames and decode remote ones for glass-to-glass latency
+        trace = "--trace-latency" in sys.argv
+        rtc = RTCManager(signaling, receive_spec=remote_spec, receive_sink=remote_sink, recorder=recorder,
+                         trace_latency=trace)
+        messenger.attach(rtc)
+
+        # 3. Media Pipeline
+        # --yuv: I420 end to end, luma-only filtering (Tier 1's colour filters are skipped)
+        # --incremental: refilter only the tiles that changed since the last frame
+        # --pyramid: heavy tiers run at reduced resolution with an edge-aware upsample
+        video_track = MediaPipelineTrack(specs, preview=preview, yuv="--yuv" in sys.argv,
+                                         incremental="--incremental" in sys.argv,
+                                         pyramid="--pyramid" in sys.argv, trace=trace)
+        rtc.set_local_video_track(video_track)
+        media_ready.set()
+        REPORT.mark("media ready")
+        REPORT.print()
+        if "--startup-report" in sys.argv:
+            REPORT.write("startup_report.json")
+
+    # 4. Wire up Callbacks (each waits until the media stack is loaded)
+    async def on_offer(data):
+        await media_ready.wait()
+        await rtc.handle_offer(data)
+
+    async def on_answer(data):
+        await media_ready.wait()
+        await rtc.handle_answer(data)
+
+    async def on_candidate(data):
+        await media_ready.wait()
+        await rtc.handle_candidate(data)
+
+    signaling.on_offer_callback = supervisor.callback("offer", on_offer)
+    signaling.on_answer_callback = supervisor.callback("answer", on_answer)
+    signaling.on_candidate_callback = supervisor.callback("candidate", on_candidate)
+
     async def on_user_connected_handler(user_id):
+        await media_ready.wait()
         print(f"Peer connected ({user_id}). Sending Hardware Info...")
-        await signaling.send_hardware_info(specs)
+        await messenger.send_hardware_info(specs)
 
         if role == "host":
+            # No grace delay: both Python and browser joiners hold an early offer until their media is ready
             print(f"Initiating call with {user_id}...")
-            # Give a slight delay for peer to be ready
-            await asyncio.sleep(1)
-            await rtc.create_offer()
+            await rtc.create_offer(user_id)
+
+    async def on_user_disconnected_handler(user_id):
+        await media_ready.wait()
+        await rtc.remove_peer(user_id)
             
-    signaling.set_on_user_connected(on_user_connected_handler)
+    signaling.set_on_user_connected(supervisor.callback("user-connected", on_user_connected_handler))
+    signaling.set_on_user_disconnected(supervisor.callback("user-disconnected", on_user_disconnected_handler))
 
     # 5. Connect
-    await signaling.connect()
-    
-    # Send Hardware Info to Frontend
-    await signaling.send_hardware_info(specs)
-    
-    # Auto-open the frontend in browser (for user convenience)
-    import webbrowser
-    # Replace this with your actual Vercel/Render frontend URL once deployed
-    PRODUCTION_FRONTEND_URL = "https://video-call-stremo-lumenrtc-1.onrender.com/" 
-    webbrowser.open(PRODUCTION_FRONTEND_URL) 
-    
-    print("Running... Press Ctrl+C to exit.")
-    if role == "host":
-        print("Waiting for peer to join...")
-    else:
-        print("Joined room. Waiting for offer from Host...")
-    
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
-        pass
+        await signaling.connect()
+        REPORT.mark("signaling connected")
+
+        await setup_media()
+
+        # Send Hardware Info to Frontend
+        await messenger.send_hardware_info(specs)
+
+        # Live pipeline metrics: pushed to the frontend and served locally for scraping
+        metrics_server = await start_metrics_server()
+        supervisor.spawn("metrics", lambda: push_metrics(messenger, specs), restart=True)
+
+        # Capture resolution, frame rate and processing level follow what the network carries
+        from congestion import CongestionController
+        supervisor.spawn("congestion", CongestionController(rtc, video_track).run, restart=True)
+
+        # Auto-open the frontend in browser (for user convenience); off the loop, it can block for a while
+        import webbrowser
+        # Replace this with your actual Vercel/Render frontend URL once deployed
+        PRODUCTION_FRONTEND_URL = "https://video-call-stremo-lumenrtc-1.onrender.com/"
+        loop.run_in_executor(None, webbrowser.open, PRODUCTION_FRONTEND_URL)
+
+        print("Running... Press Ctrl+C to exit.")
+        if role == "host":
+            print("Waiting for peer to join...")
+        else:
+            print("Joined room. Waiting for offer from Host...")
+
+        await supervisor.wait()
     finally:
+        await supervisor.shutdown()
+        monitor.stop()
+        if metrics_server is not None:
+            metrics_server.close()
         await signaling.close()
-        await rtc.close()
-        video_track.release()
+        if rtc is not None:
+            await rtc.close()
+        if video_track is not None:
+            video_track.release()
+        if recorder is not None:
+            recorder.stop()
+        print(f"Stopped. Event loop: max lag {monitor.max_lag_ms:.0f} ms, {monitor.stalls} stall(s)")
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    # --no-uvloop keeps the stock asyncio loop even when uvloop is installed
+    runtime.run(main(), use_uvloop="--no-uvloop" not in sys.argv)
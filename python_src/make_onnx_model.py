@@ -0,0 +1,49 @@
+import sys
+import numpy as np
+import onnx
+from onnx import helper, TensorProto, numpy_helper
+
+
+def make_denoise_model(path):
+    # Depthwise 3x3 smoothing conv: [N,3,H,W] -> [N,3,H,W]
+    kernel = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32) / 16.0
+    weights = np.tile(kernel, (3, 1, 1, 1))
+    node = helper.make_node("Conv", ["input", "weights"], ["output"], group=3, pads=[1, 1, 1, 1])
+    graph = helper.make_graph(
+        [node], "lumen_denoise",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, "H", "W"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 3, "H", "W"])],
+        [numpy_helper.from_array(weights, "weights")],
+    )
+    save(graph, path)
+
+
+def make_upscale_model(path, scale=2):
+    # Bilinear x`scale` resize: [N,3,H,W] -> [N,3,H*scale,W*scale]
+    scales = numpy_helper.from_array(np.array([1, 1, scale, scale], dtype=np.float32), "scales")
+    node = helper.make_node("Resize", ["input", "", "scales"], ["output"], mode="linear")
+    graph = helper.make_graph(
+        [node], "lumen_upscale",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, "H", "W"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 3, "OH", "OW"])],
+        [scales],
+    )
+    save(graph, path)
+
+
+def save(graph, path):
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    # Tiny stand-in models for exercising the ONNX stage on the CPU execution provider
+    kind = sys.argv[1] if len(sys.argv) > 1 else "denoise"
+    out = sys.argv[2] if len(sys.argv) > 2 else f"lumen_{kind}.onnx"
+    if kind == "upscale":
+        make_upscale_model(out)
+    else:
+        make_denoise_model(out)
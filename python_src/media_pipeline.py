@@ -3,66 +3,136 @@ import time
 import asyncio
 from av import VideoFrame
 from aiortc import VideoStreamTrack
+from aiortc.mediastreams import MediaStreamError
 import numpy as np
 from hardware_probe import HardwareTier
+from capture import FrameGrabber
+from filter_graph import FilterGraph, freeze_spec, i420_spec, luma_capable, pyramid_spec, tiled_spec
+from frame_pool import VideoFramePool
+from frame_executor import FrameExecutor
+from quality_governor import QualityGovernor, QUALITY_LEVELS
+from preview import PreviewSink
+from overlay import StatsOverlay
+from metrics import PROCESS_MS, CONVERT_MS, ENCODE_MS, FRAMES_SENT, EXECUTOR_IN_FLIGHT
 
 class MediaPipelineTrack(VideoStreamTrack):
-    def __init__(self, hardware_specs):
+    def __init__(self, hardware_specs, executor_mode="thread", workers=1, in_flight=None,
+                 source=None, preview=True, preview_fps=10, adaptive=True, yuv=False, incremental=False,
+                 pyramid=False, trace=False):
         super().__init__()
         self.hardware_specs = hardware_specs
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FPS, 15)
+        # Any cv2.VideoCapture-like source works (video file, capture.SyntheticSource)
+        if source is None:
+            source = cv2.VideoCapture(0)
+            source.set(cv2.CAP_PROP_FPS, 15)
+        self.cap = source
+        # Closed/missing cameras report 0 or -1; fall back to the usual 640x480
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width <= 0 or height <= 0:
+            width, height = 640, 480
+        self.capture_size = (width, height)
+        # yuv=True: I420 from capture to encoder; filters run on the Y plane only and the encoder's
+        # own BGR -> yuv420p conversion disappears
+        self.format = "yuv420p" if yuv else "bgr24"
+        self.grabber = FrameGrabber(self.cap, fps=15, width=width, height=height, format=self.format)
+        # Optional local preview, drawn on its own thread; preview=False skips it entirely (headless)
+        self.preview = PreviewSink(fps=preview_fps, format=self.format) if preview else None
+        if self.preview is not None:
+            self.preview.start()
         self.tier = hardware_specs['tier']
         self.frame_count = 0
+        # Filters run off the event loop; with in_flight > 1 frames are pipelined across workers
+        self.executor = FrameExecutor(self.tier, mode=executor_mode, workers=workers, in_flight=in_flight)
+        # The probed tier is only the starting point; the governor adapts to measured frame times
+        self.level_specs = [level.spec for level in QUALITY_LEVELS]
+        self.top_level = len(QUALITY_LEVELS) - 1
+        if pyramid:
+            # Heavy tiers filter a downscaled copy and recover edges with a guided upsample
+            self.level_specs = [pyramid_spec(level.tier, level.scale) for level in QUALITY_LEVELS]
+        if incremental:
+            # Only changed tiles are refiltered; the governor sees the cheaper frames and can climb higher
+            self.level_specs = [tiled_spec(spec) if spec else spec for spec in self.level_specs]
+        if yuv:
+            # Levels whose stages need colour (detailEnhance, ONNX models) are out of reach in YUV mode
+            self.level_specs = [i420_spec(spec) for spec in self.level_specs]
+            self.top_level = max(i for i, level in enumerate(QUALITY_LEVELS) if luma_capable(level.spec))
+        self.governor = QualityGovernor(self.tier, fps=15, in_flight=self.executor.in_flight,
+                                        max_level=self.top_level, adaptive=adaptive)
+        self.overlay = StatsOverlay()
+        self.frame_pool = VideoFramePool(self.format)
+        self.local_graph = None
+        self.last_returned_at = None
+        # trace=True stamps a glass-to-glass latency marker into every frame (see latency_trace.py)
+        self.stamper = None
+        if trace:
+            from latency_trace import FrameStamper
+            self.stamper = FrameStamper()
         print(f"Media Pipeline Initialized on Tier: {self.tier}")
 
     async def recv(self):
-        pts, time_base = await self.next_timestamp()
-        
-        ret, frame = self.cap.read()
-        if not ret:
-            # Return a black frame if capture fails
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        
-        start_time = time.time()
-        
-        # Processing Logic based on Tier
-        processed_frame = self.process_frame(frame)
-        
-        end_time = time.time()
-        process_time_ms = (end_time - start_time) * 1000
+        if self.readyState != "live":
+            raise MediaStreamError
+        if self.last_returned_at is not None:
+            # aiortc encodes and sends the previous frame before asking for the next one
+            ENCODE_MS.record((time.perf_counter() - self.last_returned_at) * 1000)
+
+        # Keep the executor fed with the newest captured frames; the capture thread's clock drives pts
+        while not self.executor.ready:
+            frame, pts, time_base = await self.grabber.next_frame()
+            self.executor.spec = self.level_specs[self.governor.index]
+            # Wall-clock capture and pickup times, for the latency marker
+            picked_at = time.time()
+            captured_at = picked_at - (time.monotonic() - self.grabber.last_timestamp)
+            self.executor.submit(frame, (pts, time_base, self.governor.index, captured_at, picked_at))
+
+        EXECUTOR_IN_FLIGHT.set(len(self.executor.pending))
+        processed_frame, process_time_ms, (pts, time_base, level_index, captured_at, picked_at) = \
+            await self.executor.next_result()
+        PROCESS_MS.record(process_time_ms)
+        self.governor.record(process_time_ms, level_index)
         
         # Overlay Stats
-        cv2.putText(processed_frame, f"Tier: {self.tier}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(processed_frame, f"Proc Time: {process_time_ms:.2f}ms", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        self.overlay.update(self.governor.level.name, process_time_ms)
+        if processed_frame.ndim == 2:
+            # I420: the stats panel goes on the luma rows
+            self.overlay.draw(processed_frame[:processed_frame.shape[0] * 2 // 3])
+        else:
+            self.overlay.draw(processed_frame)
+        if self.stamper is not None:
+            self.stamper.stamp(processed_frame, captured_at * 1000, picked_at * 1000)
         
         if self.frame_count % 30 == 0:
             print(f"[PERF] Frame {self.frame_count}: {process_time_ms:.2f} ms")
         self.frame_count += 1
         
-        # Show local loopback window
-        cv2.imshow("LumenRTC Local Loopback", processed_frame)
-        cv2.waitKey(1)
+        if self.preview is not None:
+            self.preview.publish(processed_frame)
         
-        # Convert to av.VideoFrame for WebRTC
-        new_frame = VideoFrame.from_ndarray(processed_frame, format="bgr24")
-        new_frame.pts = pts
-        new_frame.time_base = time_base
+        # Copy into a pooled av.VideoFrame for WebRTC instead of allocating a new one
+        convert_start = time.perf_counter()
+        new_frame = self.frame_pool.from_ndarray(processed_frame, pts, time_base)
+        self.last_returned_at = time.perf_counter()
+        CONVERT_MS.record((self.last_returned_at - convert_start) * 1000)
+        FRAMES_SENT.inc()
         return new_frame
 
+    def set_capture_profile(self, scale=1.0, fps=15, max_level=None):
+        """Network-driven limits: capture downscale, frame-rate cap and highest processing level."""
+        self.grabber.set_profile(scale, fps)
+        self.governor.set_fps(fps, self.executor.in_flight)
+        self.governor.set_max_level(self.top_level if max_level is None else min(max_level, self.top_level))
+
     def process_frame(self, frame):
-        if self.tier == HardwareTier.TIER_3_NORMAL_CPU:
-            # Basic Filter: Gaussian Blur to simulate "denoising"
-            return cv2.GaussianBlur(frame, (5, 5), 0)
-        elif self.tier == HardwareTier.TIER_2_HIGH_CPU:
-            # High CPU: Bilateral Filter (slower, better quality)
-            return cv2.bilateralFilter(frame, 9, 75, 75)
-        elif self.tier == HardwareTier.TIER_1_RTX:
-            # RTX: Simulate heavy load or use actual model if available
-            # Placeholder for SuperRes
-            return cv2.detailEnhance(frame, sigma_s=10, sigma_r=0.15)
-        return frame
+        # Synchronous path for callers outside recv(); the result buffer is reused on the next call
+        spec = self.level_specs[self.governor.index]
+        if self.local_graph is None or self.local_graph.spec != freeze_spec(spec):
+            self.local_graph = FilterGraph(spec)
+        return self.local_graph.run(frame)
 
     def release(self):
+        self.grabber.stop()
+        self.executor.shutdown()
+        if self.preview is not None:
+            self.preview.stop()
         self.cap.release()
-        cv2.destroyAllWindows()
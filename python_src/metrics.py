@@ -0,0 +1,172 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+# Latency buckets in milliseconds (upper bounds); the last bucket catches everything above
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 4, 8, 16, 33, 50, 66, 100, 150, 250, 500, 1000)
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Fixed-bucket histogram. record() is a bisect plus two integer adds, no locks and no allocation.
+
+    Each metric is written from a single thread (capture thread or event loop), so plain attribute
+    updates are safe; readers may see a snapshot that is one sample stale.
+    """
+
+    __slots__ = ("name", "help", "buckets", "counts", "count", "sum")
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS_MS, help=""):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th sample
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+def _json_quantile(value):
+    # JSON has no infinity (json.dumps would write a bare Infinity that JSON.parse rejects)
+    return "+Inf" if value == float("inf") else value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+
+    def _get(self, cls, name, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, **kwargs)
+        return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help=help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help=help)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS_MS, help=""):
+        return self._get(Histogram, name, buckets=buckets, help=help)
+
+    def snapshot(self):
+        """Compact, JSON-safe dict for pushing over signaling; quantiles above the top bucket are "+Inf"."""
+        snap = {"uptime_s": round(time.time() - self.started, 1)}
+        for name, metric in list(self.metrics.items()):
+            if isinstance(metric, Histogram):
+                snap[name] = {
+                    "count": metric.count,
+                    "avg": round(metric.sum / metric.count, 2) if metric.count else None,
+                    "p50": _json_quantile(metric.quantile(0.5)),
+                    "p95": _json_quantile(metric.quantile(0.95)),
+                    "p99": _json_quantile(metric.quantile(0.99)),
+                }
+            else:
+                snap[name] = metric.value
+        return snap
+
+    def render_text(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for name, metric in list(self.metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, c in zip(metric.buckets, metric.counts):
+                    cumulative += c
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{name}_sum {metric.sum}")
+                lines.append(f"{name}_count {metric.count}")
+            else:
+                kind = "counter" if isinstance(metric, Counter) else "gauge"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Hot-path media metrics
+CAPTURE_MS = REGISTRY.histogram("lumen_capture_ms", help="Camera read time per frame")
+PROCESS_MS = REGISTRY.histogram("lumen_process_ms", help="Filter graph time per frame")
+CONVERT_MS = REGISTRY.histogram("lumen_convert_ms", help="ndarray to VideoFrame conversion time")
+ENCODE_MS = REGISTRY.histogram("lumen_encode_ms", help="Time between handing a frame to aiortc and its next recv() (encode + send)")
+FRAMES_SENT = REGISTRY.counter("lumen_frames_sent_total", help="Frames returned from MediaPipelineTrack.recv()")
+FRAMES_DROPPED = REGISTRY.counter("lumen_frames_dropped_total", help="Captured frames replaced before recv() took them")
+CAPTURE_BACKLOG = REGISTRY.gauge("lumen_capture_backlog", help="Captured frames waiting when recv() took the newest")
+EXECUTOR_IN_FLIGHT = REGISTRY.gauge("lumen_executor_in_flight", help="Frames queued on the processing executor")
+
+
+async def start_metrics_server(host="127.0.0.1", port=9464, registry=REGISTRY):
+    """Minimal HTTP endpoint serving registry.render_text() for local scraping."""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = registry.render_text().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    try:
+        server = await asyncio.start_server(handle, host, port)
+    except OSError as e:
+        print(f"Metrics endpoint unavailable on {host}:{port}: {e}")
+        return None
+    print(f"Metrics: http://{host}:{port}/metrics")
+    return server
+
+
+async def push_metrics(signaling, specs, interval=2.0, registry=REGISTRY):
+    """Periodically send a snapshot on the existing hardware-info event for GpuStats.jsx."""
+    while True:
+        await asyncio.sleep(interval)
+        await signaling.send_metrics(specs, registry.snapshot())
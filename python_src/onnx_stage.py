@@ -0,0 +1,134 @@
+import os
+import threading
+import numpy as np
+import onnxruntime as ort
+import filter_graph
+from filter_graph import Stage, register_stage
+
+# Process-wide: every graph (and every executor thread) running the same model shares one session
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+PREFERRED_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+
+
+def default_provider():
+    available = ort.get_available_providers()
+    for provider in PREFERRED_PROVIDERS:
+        if provider in available:
+            return provider
+    return available[0]
+
+
+def get_session(model_path, provider=None, intra_threads=None, inter_threads=1):
+    provider = provider or default_provider()
+    if intra_threads is None:
+        # Roughly one thread per physical core; hyperthreads rarely help convolution kernels. Each
+        # process-pool worker builds its own session, so they split the cores between them
+        intra_threads = max(1, (os.cpu_count() or 2) // 2 // filter_graph.POOL_PROCESSES)
+    key = (os.path.abspath(model_path), provider, intra_threads, inter_threads)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.intra_op_num_threads = intra_threads
+            options.inter_op_num_threads = inter_threads
+            # Frames arrive every few tens of ms; spinning threads in between would just burn CPU
+            options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+            options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+            session = ort.InferenceSession(model_path, sess_options=options, providers=[provider])
+            _sessions[key] = session
+            print(f"[ONNX] Loaded {os.path.basename(model_path)} on {provider} ({intra_threads} intra-op threads)")
+        return session
+
+
+def clear_session_cache():
+    with _sessions_lock:
+        _sessions.clear()
+
+
+@register_stage("onnx")
+class OnnxInferenceStage(Stage):
+    """Runs a denoise / super-resolution model on each frame.
+
+    The model takes float32 NCHW in [0, 1] (channels in capture order) and returns the same layout,
+    `scale` times larger for super-resolution. Input and output tensors are preallocated and bound
+    once with IOBinding, so a frame only costs the in-place layout conversion on each side.
+
+    run() infers one frame at a time, as the live send path needs. run_batch() infers several
+    frames in one call, for offline processing and benchmarks only.
+    """
+
+    def __init__(self, model, provider=None, scale=1, intra_threads=None, inter_threads=1):
+        super().__init__(model=model, provider=provider, scale=scale,
+                         intra_threads=intra_threads, inter_threads=inter_threads)
+        self.session = get_session(model, provider, intra_threads, inter_threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        self.scale = scale
+        self.bound = None
+
+    def output_shape(self, in_shape, graph_shape):
+        h, w = in_shape[:2]
+        return (h * self.scale, w * self.scale) + tuple(in_shape[2:])
+
+    def _bind(self, in_shape, batch):
+        if self.bound == (in_shape, batch):
+            return
+        h, w, c = in_shape
+        oh, ow = h * self.scale, w * self.scale
+        self.bound = (in_shape, batch)
+        self.input = np.zeros((batch, c, h, w), dtype=np.float32)
+        self.output = np.zeros((batch, c, oh, ow), dtype=np.float32)
+        self.scratch = np.empty((oh, ow, c), dtype=np.float32)
+        self.binding = self.session.io_binding()
+        self.binding.bind_input(self.input_name, "cpu", 0, np.float32, self.input.shape, self.input.ctypes.data)
+        self.binding.bind_output(self.output_name, "cpu", 0, np.float32, self.output.shape, self.output.ctypes.data)
+
+    def _read_input(self, k, src):
+        # HWC uint8 -> CHW float in [0, 1], written straight into the bound input tensor
+        np.multiply(src.transpose(2, 0, 1), 1.0 / 255.0, out=self.input[k], casting="unsafe")
+
+    def run(self, src, dst):
+        self._bind(src.shape, 1)
+        self._read_input(0, src)
+        self.session.run_with_iobinding(self.binding)
+        self._write_output(0, dst)
+
+    def run_batch(self, srcs, dsts):
+        """Infer same-sized frames together, writing each result into the matching dst."""
+        self._bind(srcs[0].shape, len(srcs))
+        for k, src in enumerate(srcs):
+            self._read_input(k, src)
+        self.session.run_with_iobinding(self.binding)
+        for k, dst in enumerate(dsts):
+            self._write_output(k, dst)
+
+    def _write_output(self, k, dst):
+        np.multiply(self.output[k].transpose(1, 2, 0), 255.0, out=self.scratch)
+        np.clip(self.scratch, 0, 255, out=self.scratch)
+        np.copyto(dst, self.scratch, casting="unsafe")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python onnx_stage.py <model.onnx> [scale] [batch]")
+        sys.exit(1)
+    model_path = sys.argv[1]
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    batch = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    stage = OnnxInferenceStage(model_path, provider="CPUExecutionProvider", scale=scale)
+    frames = [np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(batch)]
+    outs = [np.empty(stage.output_shape(frame.shape, frame.shape), dtype=np.uint8) for frame in frames]
+    stage.run_batch(frames, outs)
+    start = time.perf_counter()
+    for _ in range(30):
+        stage.run_batch(frames, outs)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / (30 * batch)
+    print(f"Output: {outs[0].shape}, batch {batch}, {elapsed_ms:.2f} ms/frame")
@@ -0,0 +1,105 @@
+import time
+import cv2
+import numpy as np
+
+
+class Sparkline:
+    """Fixed-size rolling window of samples."""
+
+    def __init__(self, size=60):
+        self.values = np.zeros(size, dtype=np.float32)
+        self.count = 0
+
+    def push(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def ordered(self):
+        if self.count < len(self.values):
+            return self.values[:self.count]
+        i = self.count % len(self.values)
+        return np.concatenate((self.values[i:], self.values[:i]))
+
+
+class StatsOverlay:
+    """Stats panel composited into a corner of the outgoing frame.
+
+    Text and sparklines are rendered into a small cached sprite at most `refresh_hz` times a second,
+    and only when the displayed values changed. Per frame the panel region is darkened and the
+    cached sprite pixels are copied in; nothing else in the frame is touched.
+    """
+
+    def __init__(self, width=260, height=96, origin=(10, 10), refresh_hz=4, history=60,
+                 color=(0, 255, 0), dim=0.4):
+        self.width = width
+        self.height = height
+        self.origin = origin
+        self.refresh_interval = 1.0 / refresh_hz
+        self.color = color
+        self.dim = dim
+        self.sprite = np.zeros((height, width, 3), dtype=np.uint8)
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        # Luma copy of the sprite for frames processed as I420 (draw() gets the Y plane)
+        self.sprite_y = np.zeros((height, width), dtype=np.uint8)
+        self.latency = Sparkline(history)
+        self.fps = Sparkline(history)
+        self.lines = None
+        self.rendered_samples = 0
+        self.last_render = 0.0
+        self.last_frame_time = None
+
+    def update(self, tier_name, process_time_ms):
+        now = time.monotonic()
+        if self.last_frame_time is not None and now > self.last_frame_time:
+            self.fps.push(1.0 / (now - self.last_frame_time))
+        self.last_frame_time = now
+        self.latency.push(process_time_ms)
+
+        if now - self.last_render < self.refresh_interval:
+            return
+        fps = self.fps.ordered()
+        lines = (f"Tier: {tier_name}",
+                 f"Proc Time: {process_time_ms:.2f}ms",
+                 f"FPS: {fps[-1]:.1f}" if len(fps) else "FPS: -")
+        if lines != self.lines or self.latency.count != self.rendered_samples:
+            self.lines = lines
+            self.rendered_samples = self.latency.count
+            self._render()
+            self.last_render = now
+
+    def _render(self):
+        self.sprite[:] = 0
+        self.mask[:] = 0
+        for i, text in enumerate(self.lines):
+            cv2.putText(self.sprite, text, (6, 18 + i * 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self.color, 1, cv2.LINE_AA)
+        # Latency sparkline on the left, FPS on the right of the bottom strip
+        half = self.width // 2
+        self._draw_sparkline(self.latency.ordered(), 4, half - 4, (0, 200, 255))
+        self._draw_sparkline(self.fps.ordered(), half + 4, self.width - 4, (255, 200, 0))
+        cv2.cvtColor(self.sprite, cv2.COLOR_BGR2GRAY, dst=self.sprite_y)
+        cv2.threshold(self.sprite_y, 0, 255, cv2.THRESH_BINARY, dst=self.mask)
+
+    def _draw_sparkline(self, values, x0, x1, color):
+        if len(values) < 2:
+            return
+        top, bottom = 70, self.height - 4
+        peak = float(values.max()) or 1.0
+        xs = np.linspace(x0, x1, len(values))
+        ys = bottom - (values / peak) * (bottom - top)
+        points = np.stack((xs, ys), axis=1).astype(np.int32)
+        cv2.polylines(self.sprite, [points], False, color, 1, cv2.LINE_AA)
+
+    def draw(self, frame):
+        if self.lines is None:
+            return frame
+        x, y = self.origin
+        h = min(self.height, frame.shape[0] - y)
+        w = min(self.width, frame.shape[1] - x)
+        if h <= 0 or w <= 0:
+            return frame
+        roi = frame[y:y + h, x:x + w]
+        if self.dim is not None:
+            cv2.convertScaleAbs(roi, dst=roi, alpha=self.dim)
+        sprite = self.sprite if frame.ndim == 3 else self.sprite_y
+        cv2.copyTo(sprite[:h, :w], self.mask[:h, :w], dst=roi)
+        return frame
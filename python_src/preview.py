@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import cv2
+
+
+def display_available():
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+class PreviewSink:
+    """Shows the local loopback preview on its own thread at a reduced refresh rate.
+
+    publish() only stores a reference to the newest processed frame, so the send path never pays
+    for drawing. The frame buffer is reused by the pipeline, so the preview may occasionally show
+    a partially updated frame; that is acceptable for a local preview. On macOS, where HighGUI
+    (Cocoa) only works on the main thread, the window is drawn from the main thread's event loop
+    instead.
+    """
+
+    def __init__(self, window_name="LumenRTC Local Loopback", fps=10, format="bgr24"):
+        self.window_name = window_name
+        self.fps = fps
+        # "yuv420p" frames are converted for display here, on the preview thread
+        self.format = format
+        self.latest = None
+        self.shown = None
+        self.running = False
+        self.thread = None
+        self.tick = None
+
+    def start(self):
+        if self.running:
+            return
+        if not display_available():
+            print("Preview: no display found, local preview disabled")
+            return
+        if sys.platform == "darwin":
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is None or threading.current_thread() is not threading.main_thread():
+                print("Preview: macOS can only draw from the main thread's event loop, local preview disabled")
+                return
+            self.running = True
+            self.tick = loop.call_soon(self._render_tick, loop)
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._render_loop, name="lumen-preview", daemon=True)
+        self.thread.start()
+
+    def publish(self, frame):
+        self.latest = frame
+
+    def _render(self):
+        frame = self.latest
+        if frame is not None:
+            if self.format == "yuv420p":
+                frame = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
+            cv2.imshow(self.window_name, frame)
+        cv2.waitKey(1)
+
+    def _close_window(self):
+        try:
+            cv2.destroyWindow(self.window_name)
+        except cv2.error:
+            pass
+
+    def _render_loop(self):
+        interval = 1.0 / self.fps
+        try:
+            while self.running:
+                started = time.monotonic()
+                self._render()
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except cv2.error as e:
+            print(f"Preview disabled: {e}")
+        finally:
+            self._close_window()
+        self.running = False
+
+    def _render_tick(self, loop):
+        # macOS: one frame per call on the loop's (main) thread, then reschedule
+        self.tick = None
+        if not self.running:
+            return
+        try:
+            self._render()
+        except cv2.error as e:
+            print(f"Preview disabled: {e}")
+            self.running = False
+            self._close_window()
+            return
+        self.tick = loop.call_later(1.0 / self.fps, self._render_tick, loop)
+
+    def stop(self):
+        self.running = False
+        if self.tick is not None:
+            self.tick.cancel()
+            self.tick = None
+            self._close_window()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
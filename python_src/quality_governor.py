@@ -0,0 +1,123 @@
+from hardware_probe import HardwareTier
+from filter_graph import graph_spec
+
+
+class QualityLevel:
+    def __init__(self, name, tier, scale=1.0):
+        self.name = name
+        self.tier = tier
+        self.scale = scale
+        self.spec = graph_spec(tier, scale)
+
+    def __repr__(self):
+        return f"QualityLevel({self.name})"
+
+
+# Cheapest first. Scaled levels run the filter graph on a downscaled copy.
+QUALITY_LEVELS = [
+    QualityLevel("Off", None),
+    QualityLevel("Tier 3 @ 50%", HardwareTier.TIER_3_NORMAL_CPU, 0.5),
+    QualityLevel("Tier 3", HardwareTier.TIER_3_NORMAL_CPU),
+    QualityLevel("Tier 2 @ 50%", HardwareTier.TIER_2_HIGH_CPU, 0.5),
+    QualityLevel("Tier 2", HardwareTier.TIER_2_HIGH_CPU),
+    QualityLevel("Tier 1 @ 50%", HardwareTier.TIER_1_RTX, 0.5),
+    QualityLevel("Tier 1", HardwareTier.TIER_1_RTX),
+]
+
+
+def level_for_tier(tier):
+    for i, level in enumerate(QUALITY_LEVELS):
+        if level.tier == tier and level.scale == 1.0:
+            return i
+    return 0
+
+
+class QualityGovernor:
+    """Picks the processing level from measured per-frame time against the frame budget.
+
+    Steps down when the smoothed time stays above `high` * budget and steps up when it stays below
+    `low` * budget. Separate hold times, a cooldown after every change and an exponential backoff
+    on levels that already proved too slow keep it from flapping between two levels.
+    """
+
+    def __init__(self, start_tier, fps=15, in_flight=1, max_level=None, high=0.9, low=0.5,
+                 down_after=5, up_after=45, cooldown=30, alpha=0.2, adaptive=True):
+        # With frames pipelined across workers each one may take in_flight frame intervals
+        self.budget_ms = 1000.0 / fps * in_flight
+        self.index = level_for_tier(start_tier)
+        self.max_level = len(QUALITY_LEVELS) - 1 if max_level is None else max_level
+        self.index = min(self.index, self.max_level)
+        self.high = high
+        self.low = low
+        self.down_after = down_after
+        self.up_after = up_after
+        self.cooldown = cooldown
+        self.alpha = alpha
+        # adaptive=False keeps the starting level (benchmarks, debugging)
+        self.adaptive = adaptive
+        self.avg_ms = None
+        self.level_cost_ms = {}
+        self.backoff = {}
+        self.max_backoff = 5
+        self.over = 0
+        self.under = 0
+        self.hold = 0
+        self.changes = 0
+
+    @property
+    def level(self):
+        return QUALITY_LEVELS[self.index]
+
+    def set_fps(self, fps, in_flight=1):
+        self.budget_ms = 1000.0 / fps * in_flight
+
+    def set_max_level(self, max_level):
+        self.max_level = max(0, min(max_level, len(QUALITY_LEVELS) - 1))
+        if self.index > self.max_level:
+            self._change(self.max_level)
+
+    def record(self, process_time_ms, level_index=None):
+        """Feed one measured frame time. Returns True when the level changed."""
+        if level_index is not None and level_index != self.index:
+            return False  # pipelined frame submitted before the last change
+        if self.avg_ms is None:
+            self.avg_ms = process_time_ms
+        else:
+            self.avg_ms += self.alpha * (process_time_ms - self.avg_ms)
+        self.level_cost_ms[self.index] = self.avg_ms
+
+        if not self.adaptive:
+            return False
+        if self.hold > 0:
+            self.hold -= 1
+            return False
+
+        if self.avg_ms > self.budget_ms * self.high:
+            self.over += 1
+            self.under = 0
+        elif self.avg_ms < self.budget_ms * self.low:
+            self.under += 1
+            self.over = 0
+        else:
+            self.over = self.under = 0
+
+        if self.over >= self.down_after and self.index > 0:
+            # Every time a level proves too slow, wait twice as long before trying it again
+            self.backoff[self.index] = min(self.backoff.get(self.index, 0) + 1, self.max_backoff)
+            return self._change(self.index - 1)
+        if self.index < self.max_level:
+            needed = self.up_after * (2 ** self.backoff.get(self.index + 1, 0))
+            if self.under >= needed:
+                return self._change(self.index + 1)
+        return False
+
+    def _change(self, index):
+        previous = self.level
+        self.index = index
+        self.over = self.under = 0
+        self.hold = self.cooldown
+        # Measurements from the old level say nothing about the new one
+        self.avg_ms = self.level_cost_ms.get(index)
+        self.changes += 1
+        print(f"[GOVERNOR] {previous.name} -> {self.level.name} (budget {self.budget_ms:.0f} ms)")
+        return True
@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiortc.mediastreams import MediaStreamError
+from filter_graph import FilterGraph, graph_spec
+from metrics import REGISTRY
+
+RX_FRAMES = REGISTRY.counter("lumen_rx_frames_total", help="Remote video frames received")
+RX_DROPPED = REGISTRY.counter("lumen_rx_frames_dropped_total", help="Remote frames replaced in the queue before processing")
+RX_QUEUE_MS = REGISTRY.histogram("lumen_rx_queue_ms", help="Remote frame wait between recv() and processing")
+RX_CONVERT_MS = REGISTRY.histogram("lumen_rx_convert_ms", help="Remote VideoFrame to ndarray conversion time")
+RX_PROCESS_MS = REGISTRY.histogram("lumen_rx_process_ms", help="Receive-side filter graph time per frame")
+
+
+def receive_spec(tier=None, upscale=1.0):
+    """Stage chain for remote frames: the tier filter at the received size, then an optional upscale."""
+    spec = graph_spec(tier) if tier is not None else ()
+    if upscale > 1.0:
+        spec = tuple(spec) + (("resize", (("scale", upscale),)),)
+    return spec
+
+
+class LatestQueue:
+    """Bounded queue for the event loop. A put() on a full queue drops the oldest item."""
+
+    def __init__(self, maxsize=1):
+        self.items = collections.deque(maxlen=maxsize)
+        self.event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, item):
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+            RX_DROPPED.inc()
+        self.items.append(item)
+        self.event.set()
+
+    async def get(self):
+        while not self.items:
+            self.event.clear()
+            await self.event.wait()
+        return self.items.popleft()
+
+
+class RemoteVideoPipeline:
+    """Consumes a remote video track in the background and hands processed frames to a sink.
+
+    The reader task only pulls frames off the track into a LatestQueue, so a slow sink or filter
+    never backs up the receiver; conversion and filtering run on a worker thread. `sink` is
+    anything with publish(frame), e.g. a PreviewSink. The published ndarray is reused for the
+    next frame.
+    """
+
+    def __init__(self, track, spec=(), sink=None, queue_size=1, name="remote", tracer=None):
+        self.track = track
+        self.graph = FilterGraph(spec)
+        self.sink = sink
+        self.name = name
+        self.queue = LatestQueue(queue_size)
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lumen-rx")
+        self.tasks = []
+        self.frames_processed = 0
+        # latency_trace.LatencyTracer: reads each frame's marker on arrival, records it once displayed
+        self.tracer = tracer
+
+    def start(self):
+        if self.sink is not None and hasattr(self.sink, "start"):
+            self.sink.start()
+        self.tasks = [asyncio.ensure_future(self._read()), asyncio.ensure_future(self._process())]
+
+    async def _read(self):
+        while True:
+            try:
+                frame = await self.track.recv()
+            except MediaStreamError:
+                print(f"Remote track ended ({self.name})")
+                self.queue.put(None)
+                return
+            RX_FRAMES.inc()
+            mark = self.tracer.received(frame) if self.tracer is not None else None
+            self.queue.put((frame, time.perf_counter(), mark))
+
+    def _convert_and_run(self, frame):
+        start = time.perf_counter()
+        array = frame.to_ndarray(format="bgr24")
+        converted = time.perf_counter()
+        output = self.graph.run(array)
+        return output, (converted - start) * 1000, (time.perf_counter() - converted) * 1000
+
+    async def _process(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            frame, received_at, mark = item
+            RX_QUEUE_MS.record((time.perf_counter() - received_at) * 1000)
+            if self.sink is None and not self.graph.stages:
+                # Nothing consumes pixels; just keep aiortc's unbounded track queue drained
+                if self.tracer is not None:
+                    self.tracer.displayed(mark)
+                continue
+            output, convert_ms, process_ms = await loop.run_in_executor(self.pool, self._convert_and_run, frame)
+            RX_CONVERT_MS.record(convert_ms)
+            RX_PROCESS_MS.record(process_ms)
+            self.frames_processed += 1
+            if self.sink is not None:
+                self.sink.publish(output)
+            if self.tracer is not None:
+                self.tracer.displayed(mark)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.pool.shutdown(wait=False)
+        if self.sink is not None and hasattr(self.sink, "stop"):
+            self.sink.stop()
@@ -0,0 +1,347 @@
+import os
+import queue
+import struct
+import threading
+import time
+import aiortc
+from aiortc.codecs import depayload, get_encoder
+from metrics import REGISTRY
+
+REC_FRAMES = REGISTRY.counter("lumen_rec_frames_total", help="Encoded frames written to recordings")
+REC_DROPPED = REGISTRY.counter("lumen_rec_frames_dropped_total",
+                               help="Encoded frames dropped by a recording (queue full, or waiting for a keyframe)")
+REC_BYTES = REGISTRY.counter("lumen_rec_bytes_total", help="Bytes written to recordings")
+REC_WRITE_MS = REGISTRY.histogram("lumen_rec_write_ms", help="Recording disk write time per frame")
+
+CLOCK_RATE = 90000
+RTP_WRAP = 2 ** 32
+
+
+def is_keyframe(codec_name, data):
+    if not data:
+        return False
+    if codec_name == "VP8":
+        # Bit 0 of the frame tag is 0 on key frames
+        return data[0] & 1 == 0
+    if codec_name == "H264":
+        # Annex B: any IDR slice (NAL type 5)
+        return any(nal and nal[0] & 0x1F == 5 for nal in data.split(b"\x00\x00\x01"))
+    return True
+
+
+def vp8_size(data):
+    # Key frame header: 3-byte tag, 3-byte start code, then 14-bit width and height
+    width, height = struct.unpack_from("<HH", data, 6)
+    return width & 0x3FFF, height & 0x3FFF
+
+
+class IvfWriter:
+    """VP8 frames in an IVF container, timestamps on the RTP 90 kHz clock from the segment's first frame."""
+
+    extension = ".ivf"
+
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.frames = 0
+        self.file.write(struct.pack("<4sHH4sHHIIII", b"DKIF", 0, 32, b"VP80", width, height, CLOCK_RATE, 1, 0, 0))
+
+    def write(self, data, timestamp):
+        self.file.write(struct.pack("<IQ", len(data), timestamp))
+        self.file.write(data)
+        self.frames += 1
+
+    def close(self):
+        self.file.seek(24)
+        self.file.write(struct.pack("<I", self.frames))
+        self.file.close()
+
+
+class AnnexBWriter:
+    """H.264 Annex B elementary stream; it carries no timestamps, players assume a constant rate."""
+
+    extension = ".h264"
+
+    def __init__(self, path, width=None, height=None):
+        self.file = open(path, "wb")
+
+    def write(self, data, timestamp):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {"VP8": IvfWriter, "H264": AnnexBWriter}
+
+
+class RecordingSink:
+    """Writes already-encoded video frames to segmented files on a background thread.
+
+    offer() is called from aiortc's encoder or decoder threads and never blocks: frames go into a
+    bounded queue, and when the disk falls behind the frame is dropped along with every frame up
+    to the next keyframe, since those could not be decoded anyway. Segments start on keyframes
+    once segment_seconds of media have been written; `want_keyframe` asks the encoder for one
+    (only honoured for the local stream).
+    """
+
+    def __init__(self, directory, name, segment_seconds=60, queue_frames=90):
+        self.directory = directory
+        self.name = name
+        self.segment_ticks = int(segment_seconds * CLOCK_RATE)
+        self.queue = queue.Queue(maxsize=queue_frames)
+        self.thread = None
+        self.writer = None
+        self.segment_start = None
+        self.segment_size = None
+        self.last_rtp = None
+        self.last_timestamp = None
+        self.segments = []
+        self.want_keyframe = True
+        self.rotate_pending = False
+        self.resync = True
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        if self.thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.thread = threading.Thread(target=self._write_loop, name=f"lumen-rec-{self.name}", daemon=True)
+            self.thread.start()
+
+    def offer(self, codec_name, data, timestamp):
+        if self.thread is None or codec_name not in WRITERS:
+            return
+        keyframe = is_keyframe(codec_name, data)
+        if self.resync and not keyframe:
+            self._drop()
+            return
+        try:
+            self.queue.put_nowait((codec_name, data, timestamp, keyframe))
+            self.resync = False
+        except queue.Full:
+            self._drop()
+            self.resync = self.want_keyframe = True
+
+    def _drop(self):
+        self.frames_dropped += 1
+        REC_DROPPED.inc()
+
+    def _unwrap(self, rtp_timestamp):
+        # RTP timestamps are 32-bit and wrap about every 13 hours at 90 kHz (sooner from a random start),
+        # so extend them against the previous one; a step of more than half the range is backwards
+        if self.last_rtp is None:
+            self.last_timestamp = rtp_timestamp
+        else:
+            step = (rtp_timestamp - self.last_rtp) % RTP_WRAP
+            if step >= RTP_WRAP // 2:
+                step -= RTP_WRAP
+            self.last_timestamp += step
+        self.last_rtp = rtp_timestamp
+        return self.last_timestamp
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            codec_name, data, rtp_timestamp, keyframe = item
+            timestamp = self._unwrap(rtp_timestamp)
+            start = time.perf_counter()
+            try:
+                if keyframe:
+                    self._maybe_rotate(codec_name, data, timestamp)
+                if self.writer is None:
+                    continue
+                self.writer.write(data, timestamp - self.segment_start)
+            except OSError as e:
+                # Keep draining so offer() never backs up; the next keyframe opens a new segment
+                print(f"[REC] {self.name}: write failed: {e}")
+                self._close_writer()
+                self.resync = self.want_keyframe = True
+                continue
+            self.frames_written += 1
+            REC_FRAMES.inc()
+            REC_BYTES.inc(len(data))
+            REC_WRITE_MS.record((time.perf_counter() - start) * 1000)
+            if not self.rotate_pending and timestamp - self.segment_start >= self.segment_ticks:
+                self.rotate_pending = self.want_keyframe = True
+        self._close_writer()
+
+    def _close_writer(self):
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            try:
+                writer.close()
+            except OSError:
+                pass
+
+    def _maybe_rotate(self, codec_name, data, timestamp):
+        size = vp8_size(data) if codec_name == "VP8" else None
+        if self.writer is not None and size == self.segment_size \
+                and 0 <= timestamp - self.segment_start < self.segment_ticks:
+            return
+        # New segment: first frame, segment length reached, a resolution change, or the clock
+        # stepping back (the recording moved to another peer's encoder)
+        self._close_writer()
+        writer_class = WRITERS[codec_name]
+        path = os.path.join(self.directory, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{len(self.segments):03d}"
+                                            f"{writer_class.extension}")
+        self.writer = writer_class(path, *(size or (0, 0)))
+        self.segment_start = timestamp
+        self.segment_size = size
+        self.segments.append(path)
+        self.rotate_pending = False
+        print(f"[REC] {self.name}: writing {path}")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        # The stop marker must not be dropped, so wait for room
+        try:
+            self.queue.put(None, timeout=5.0)
+        except queue.Full:
+            print(f"[REC] {self.name}: writer not draining, abandoning queued frames")
+        self.thread.join(timeout=5.0)
+        self.thread = None
+
+
+class TeeEncoder:
+    """Stands in for an RTCRtpSender's encoder: encodes as usual and hands the frame to a RecordingSink.
+
+    The frame is reassembled from the RTP payloads the same way the receiving side does, so the
+    recording costs a copy, not a second encode.
+    """
+
+    def __init__(self, inner, codec, sink):
+        self.inner = inner
+        self.codec = codec
+        self.sink = sink
+
+    @property
+    def target_bitrate(self):
+        return self.inner.target_bitrate
+
+    @target_bitrate.setter
+    def target_bitrate(self, bitrate):
+        self.inner.target_bitrate = bitrate
+
+    def _tee(self, payloads, timestamp):
+        if payloads:
+            self.sink.offer(self.codec.name, b"".join(depayload(self.codec, p) for p in payloads), timestamp)
+        return payloads, timestamp
+
+    def encode(self, frame, force_keyframe=False):
+        if self.sink.want_keyframe:
+            self.sink.want_keyframe = False
+            force_keyframe = True
+        return self._tee(*self.inner.encode(frame, force_keyframe))
+
+    def pack(self, packet):
+        return self._tee(*self.inner.pack(packet))
+
+
+def _unsupported(what):
+    print(f"[REC] aiortc {aiortc.__version__} has no {what} (tested with the version pinned in "
+          f"requirements.txt); recording disabled")
+    return False
+
+
+def tee_sender(pc, sender, sink):
+    """Record what `sender` encodes. Call after negotiation, when the send codec is known.
+
+    Returns False, after a warning, when this aiortc lacks the private slots the tee relies on.
+    """
+    transceiver = next(t for t in pc.getTransceivers() if t.sender is sender)
+    if not hasattr(sender, "_RTCRtpSender__encoder") or not getattr(transceiver, "_codecs", None):
+        return _unsupported("RTCRtpSender encoder slot")
+    codec = transceiver._codecs[0]
+    # aiortc creates the encoder lazily on the first frame and keeps it in a private slot
+    inner = sender._RTCRtpSender__encoder or get_encoder(codec)
+    if not isinstance(inner, TeeEncoder):
+        sender._RTCRtpSender__encoder = TeeEncoder(inner, codec, sink)
+    return True
+
+
+def tee_receiver(receiver, sink):
+    """Record the remote stream from the complete encoded frames aiortc queues for its decoder.
+
+    Returns False, after a warning, when this aiortc has no decoder queue to tap.
+    """
+    decoder_queue = getattr(receiver, "_RTCRtpReceiver__decoder_queue", None)
+    if decoder_queue is None or not hasattr(decoder_queue, "put"):
+        return _unsupported("RTCRtpReceiver decoder queue")
+    put = decoder_queue.put
+
+    def tee_put(item, *args, **kwargs):
+        if item is not None:
+            codec, encoded_frame = item
+            sink.offer(codec.name, encoded_frame.data, encoded_frame.timestamp)
+        put(item, *args, **kwargs)
+
+    decoder_queue.put = tee_put
+    return True
+
+
+class CallRecorder:
+    """Records the processed outgoing video once per call, and optionally each remote video.
+
+    Every peer connection encodes the outgoing track separately; the recording taps one of them
+    (the first connected) and moves to another when that peer leaves.
+    """
+
+    def __init__(self, directory="recordings", record_remote=False, segment_seconds=60, queue_frames=90):
+        self.directory = directory
+        self.record_remote = record_remote
+        self.segment_seconds = segment_seconds
+        self.queue_frames = queue_frames
+        self.local = self._sink("local")
+        self.source = None
+        self.remote = {}
+
+    def _sink(self, name):
+        sink = RecordingSink(self.directory, name, self.segment_seconds, self.queue_frames)
+        sink.start()
+        return sink
+
+    def peer_connected(self, session):
+        # A stopped local sink means this aiortc cannot be tapped
+        if self.source is not None or self.local.thread is None:
+            return
+        for sender in session.pc.getSenders():
+            if sender.track is not None and sender.track.kind == "video":
+                if not tee_sender(session.pc, sender, self.local):
+                    self.local.stop()
+                    return
+                self.source = session
+                self.local.resync = self.local.want_keyframe = True
+                return
+
+    def remote_track(self, session, track):
+        if not self.record_remote or session.peer_id in self.remote:
+            return
+        for transceiver in session.pc.getTransceivers():
+            if transceiver.receiver.track is track:
+                sink = self._sink(f"remote-{session.peer_id}")
+                if not tee_receiver(transceiver.receiver, sink):
+                    sink.stop()
+                    self.record_remote = False
+                    return
+                self.remote[session.peer_id] = sink
+                return
+
+    def peer_closed(self, session, others):
+        sink = self.remote.pop(session.peer_id, None)
+        if sink is not None:
+            sink.stop()
+        if self.source is session:
+            self.source = None
+            for other in others:
+                if other.pc.connectionState == "connected":
+                    self.peer_connected(other)
+                    break
+
+    def stop(self):
+        self.local.stop()
+        for sink in self.remote.values():
+            sink.stop()
+        self.remote = {}
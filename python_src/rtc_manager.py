@@ -1,61 +1,360 @@
 import asyncio
+import functools
 import json
+import time
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate, VideoStreamTrack
-from aiortc.contrib.media import MediaBlackhole, MediaPlayer, MediaRecorder
+from aiortc.contrib.media import MediaRelay
+from aiortc.sdp import candidate_from_sdp, candidate_to_sdp
+from aiortc.rtp import RtcpRtpfbPacket, RtcpPsfbPacket, RTCP_RTPFB_NACK, RTCP_PSFB_PLI, RTCP_PSFB_FIR
+from metrics import REGISTRY
+from receive_pipeline import RemoteVideoPipeline
+from data_channel import CHANNEL_ID, CHANNEL_LABEL, PeerChannel
 
-class RTCManager:
-    def __init__(self, signaling_client):
+CALL_SETUP_MS = REGISTRY.histogram("lumen_call_setup_ms", buckets=(100, 250, 500, 1000, 2000, 3000, 5000, 10000, 20000),
+                                   help="Offer/answer start to ICE connected")
+PEERS = REGISTRY.gauge("lumen_peers", help="Peer connections fed from the local relay")
+NACKS = REGISTRY.counter("lumen_rtcp_nack_total", help="Packets the remote side asked to retransmit")
+PLIS = REGISTRY.counter("lumen_rtcp_pli_total", help="Keyframe requests (PLI/FIR) from the remote side")
+
+
+def sdp_from(data):
+    # Signaling delivers {'roomId': ..., 'sdp': ..., 'from': ...}; older callers pass the SDP string itself
+    return data['sdp'] if isinstance(data, dict) else data
+
+
+def sender_of(data):
+    # Socket id of the remote user; None with a server that does not tag messages
+    return data.get('from') if isinstance(data, dict) else None
+
+
+def count_feedback(sender, feedback):
+    """Count NACK and PLI/FIR packets addressed to `sender` into the `feedback` dict.
+
+    aiortc handles RTCP feedback inside the sender and does not report it in getStats(), so the
+    sender's RTCP handler is wrapped; it still does the retransmits and keyframes itself.
+    """
+    handle = sender._handle_rtcp_packet
+
+    async def counting(packet):
+        if isinstance(packet, RtcpRtpfbPacket) and packet.fmt == RTCP_RTPFB_NACK:
+            feedback['nack'] += len(packet.lost)
+            NACKS.inc(len(packet.lost))
+        elif isinstance(packet, RtcpPsfbPacket) and packet.fmt in (RTCP_PSFB_PLI, RTCP_PSFB_FIR):
+            feedback['pli'] += 1
+            PLIS.inc()
+        await handle(packet)
+
+    sender._handle_rtcp_packet = counting
+
+
+def parse_candidate(info):
+    """Browser-style {'candidate': 'candidate:...', 'sdpMid': ..., 'sdpMLineIndex': ...} -> RTCIceCandidate.
+
+    Returns None for the end-of-candidates marker (empty candidate string).
+    """
+    line = info.get('candidate') or ''
+    if line.startswith('candidate:'):
+        line = line[len('candidate:'):]
+    if not line.strip():
+        return None
+    candidate = candidate_from_sdp(line)
+    candidate.sdpMid = info.get('sdpMid')
+    candidate.sdpMLineIndex = info.get('sdpMLineIndex')
+    return candidate
+
+
+class PeerSession:
+    """One RTCPeerConnection to one remote user; all signaling it sends is addressed to that user."""
+
+    def __init__(self, peer_id, signaling, tracks, receive_spec=(), receive_sink=None, recorder=None,
+                 on_message=None, trace_latency=False, on_undelivered=None):
+        self.peer_id = peer_id
+        self.signaling = signaling
         self.pc = RTCPeerConnection()
-        self.signaling = signaling_client
-        self.local_video_track = None
-        
+        self.receive_spec = receive_spec
+        # Callable(peer_id) -> sink with publish(frame), or None to only drain the remote track
+        self.receive_sink = receive_sink
+        self.receiver = None
+        self.recorder = recorder
+        self.trace_latency = trace_latency
+        self.tracer = None
+        # Remote candidates that arrive before the remote description is set
+        self.pending_candidates = []
+        self.gather_task = None
+        self.setup_started = None
+        self.time_to_connected_ms = None
+        self.feedback = {'nack': 0, 'pli': 0}
+
         self.pc.on("track", self.on_track)
         self.pc.on("iceconnectionstatechange", self.on_ice_connection_state_change)
+        for track in tracks:
+            self.add_track(track)
+        # Chat and hardware stats once connected; negotiated with a fixed id, like the browser's, so
+        # neither side waits for an in-band open
+        undelivered = functools.partial(on_undelivered, peer_id) if on_undelivered is not None else None
+        self.channel = PeerChannel(self.pc.createDataChannel(CHANNEL_LABEL, negotiated=True, id=CHANNEL_ID),
+                                   on_message, on_undelivered=undelivered)
+        self.start_gathering()
 
-    def set_local_video_track(self, track):
-        self.local_video_track = track
-        self.pc.addTrack(track)
+    def add_track(self, track):
+        sender = self.pc.addTrack(track)
+        if track.kind == "video":
+            count_feedback(sender, self.feedback)
+
+    async def video_stats(self):
+        """Cumulative send-side counters of the outgoing video, or None before media flows."""
+        for sender in self.pc.getSenders():
+            if sender.track is None or sender.track.kind != "video" or sender.transport is None:
+                continue
+            stats = {'time': time.monotonic(), 'bytes_sent': 0, 'packets_sent': 0, 'rtt_ms': None,
+                     'fraction_lost': None, 'nack': self.feedback['nack'], 'pli': self.feedback['pli']}
+            report = await sender.getStats()
+            for entry in report.values():
+                if entry.type == "outbound-rtp":
+                    stats['bytes_sent'] = entry.bytesSent
+                    stats['packets_sent'] = entry.packetsSent
+                elif entry.type == "remote-inbound-rtp":
+                    if entry.roundTripTime is not None:
+                        stats['rtt_ms'] = entry.roundTripTime * 1000
+                    # RTCP carries the loss fraction as an 8-bit fixed point number
+                    stats['fraction_lost'] = entry.fractionLost / 256
+            return stats
+        return None
+
+    def start_gathering(self):
+        # aiortc gathers every candidate inside setLocalDescription(). Starting early (as soon as
+        # the transceivers exist) takes STUN round trips off the offer/answer critical path.
+        if self.gather_task is not None:
+            return
+        gatherers = {id(g): g for _, g in self._ice_gatherers()}.values()
+        if gatherers:
+            self.gather_task = asyncio.ensure_future(asyncio.gather(*(g.gather() for g in gatherers)))
+
+    def _ice_gatherers(self):
+        # (mid, gatherer) per media section; the data channel's SCTP transport has its own until bundled
+        sections = [(t.mid, t.sender.transport) for t in self.pc.getTransceivers()]
+        if self.pc.sctp is not None:
+            sections.append((self.pc.sctp.mid, self.pc.sctp.transport))
+        return [(mid, transport.transport.iceGatherer) for mid, transport in sections if transport is not None]
+
+    async def wait_for_gathering(self):
+        # setLocalDescription() skips gathering that is already running, so let the early run
+        # finish first or the SDP would go out without any candidates
+        if self.gather_task is not None:
+            await self.gather_task
+
+    async def send_local_candidates(self):
+        # Trickle the gathered candidates so peers that rely on trickle ICE (browsers) can start checks
+        mids = [line[len("a=mid:"):] for line in self.pc.localDescription.sdp.splitlines()
+                if line.startswith("a=mid:")]
+        for mid, gatherer in self._ice_gatherers():
+            if mid not in mids:
+                continue
+            mline_index = mids.index(mid)
+            for candidate in gatherer.getLocalCandidates():
+                await self.signaling.send_candidate(
+                    "candidate:" + candidate_to_sdp(candidate), mid, mline_index, to=self.peer_id)
+            # Empty candidate = end-of-candidates
+            await self.signaling.send_candidate("", mid, mline_index, to=self.peer_id)
 
     async def on_track(self, track):
-        print(f"Track received: {track.kind}")
-        if track.kind == "video":
-            # Just consume it for now or display
-            # In a real app we'd attach this to a remote video sink
-            pass
+        print(f"Track received from {self.peer_id}: {track.kind}")
+        if track.kind == "video" and self.receiver is None:
+            # Always consumed: aiortc queues decoded remote frames without bound until someone reads them
+            sink = self.receive_sink(self.peer_id) if self.receive_sink is not None else None
+            if self.trace_latency:
+                from latency_trace import LatencyTracer
+                self.tracer = LatencyTracer(name=str(self.peer_id))
+                for transceiver in self.pc.getTransceivers():
+                    if transceiver.receiver.track is track and not self.tracer.watch_receiver(transceiver.receiver):
+                        self.tracer = None
+            self.receiver = RemoteVideoPipeline(track, self.receive_spec, sink, name=str(self.peer_id),
+                                                tracer=self.tracer)
+            self.receiver.start()
+            if self.recorder is not None:
+                self.recorder.remote_track(self, track)
 
     async def on_ice_connection_state_change(self):
-        print(f"ICE Connection State: {self.pc.iceConnectionState}")
+        print(f"ICE Connection State ({self.peer_id}): {self.pc.iceConnectionState}")
+        if self.pc.iceConnectionState in ("connected", "completed") and self.recorder is not None:
+            self.recorder.peer_connected(self)
+        if self.pc.iceConnectionState in ("connected", "completed") and self.setup_started is not None \
+                and self.time_to_connected_ms is None:
+            self.time_to_connected_ms = (time.perf_counter() - self.setup_started) * 1000
+            CALL_SETUP_MS.record(self.time_to_connected_ms)
+            print(f"[PERF] Time to connected ({self.peer_id}): {self.time_to_connected_ms:.0f} ms")
+
+    def _mark_setup_start(self):
+        if self.setup_started is None:
+            self.setup_started = time.perf_counter()
 
     async def create_offer(self):
+        self._mark_setup_start()
         offer = await self.pc.createOffer()
+        await self.wait_for_gathering()
         await self.pc.setLocalDescription(offer)
-        await self.signaling.send_offer(self.pc.localDescription.sdp)
+        await self.signaling.send_offer(self.pc.localDescription.sdp, to=self.peer_id)
+        await self.send_local_candidates()
 
-    async def handle_offer(self, sdp):
+    async def handle_offer(self, data):
         if self.pc.signalingState != "stable":
             print(f"Warning: Received Offer in {self.pc.signalingState} state. Ignoring to avoid collision.")
             return
-        
-        print("Processing Remote Offer...")
-        await self.pc.setRemoteDescription(RTCSessionDescription(sdp, 'offer'))
+
+        print(f"Processing Remote Offer from {self.peer_id}...")
+        self._mark_setup_start()
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp_from(data), 'offer'))
+        await self.flush_pending_candidates()
         answer = await self.pc.createAnswer()
+        await self.wait_for_gathering()
         await self.pc.setLocalDescription(answer)
-        await self.signaling.send_answer(self.pc.localDescription.sdp)
+        await self.signaling.send_answer(self.pc.localDescription.sdp, to=self.peer_id)
+        await self.send_local_candidates()
 
-    async def handle_answer(self, sdp):
+    async def handle_answer(self, data):
         if self.pc.signalingState == "stable":
             print("Warning: Received Answer in stable state. Ignoring.")
             return
-            
-        print("Processing Remote Answer...")
-        await self.pc.setRemoteDescription(RTCSessionDescription(sdp, 'answer'))
+
+        print(f"Processing Remote Answer from {self.peer_id}...")
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp_from(data), 'answer'))
+        await self.flush_pending_candidates()
 
     async def handle_candidate(self, candidate_info):
-        # aiortc handles candidates a bit differently, usually bundled in SDP or trickle.
-        # For simplicity, if we get a candidate object:
-        # candidate = RTCIceCandidate(...)
-        # await self.pc.addIceCandidate(candidate)
-        print("Received ICE Candidate (Not implemented for aiortc trickle yet)")
+        try:
+            candidate = parse_candidate(candidate_info)
+        except (AssertionError, ValueError, TypeError) as e:
+            print(f"Ignoring malformed ICE candidate: {e}")
+            return
+        if self.pc.remoteDescription is None:
+            self.pending_candidates.append(candidate)
+            return
+        await self.pc.addIceCandidate(candidate)
+
+    async def flush_pending_candidates(self):
+        pending, self.pending_candidates = self.pending_candidates, []
+        for candidate in pending:
+            await self.pc.addIceCandidate(candidate)
 
     async def close(self):
+        if self.gather_task is not None:
+            self.gather_task.cancel()
+        if self.receiver is not None:
+            await self.receiver.stop()
+            self.receiver = None
         await self.pc.close()
+
+
+class RTCManager:
+    """One peer connection per remote user in the room, all fed from the same local tracks.
+
+    Each local track is read once by a MediaRelay and fanned out to every connection, so capture,
+    filtering and frame conversion run once per frame regardless of the number of peers.
+    """
+
+    def __init__(self, signaling_client, receive_spec=(), receive_sink=None, recorder=None, trace_latency=False):
+        self.signaling = signaling_client
+        # Applied to every remote video track (see receive_pipeline.receive_spec)
+        self.receive_spec = receive_spec
+        self.receive_sink = receive_sink
+        # recording.CallRecorder, fed from the peers' own encoders and decoders
+        self.recorder = recorder
+        # Decode glass-to-glass latency markers from remote video (senders run with trace=True)
+        self.trace_latency = trace_latency
+        self.relay = MediaRelay()
+        self.local_tracks = []
+        self.local_video_track = None
+        self.peers = {}
+        # async (event, data) for chat-message / hardware-info arriving on a peer data channel
+        self.on_message = None
+        # (peer_id, event, data) for messages queued on a channel that closed before they went out
+        self.on_undelivered = None
+
+    def set_local_video_track(self, track):
+        self.local_video_track = track
+        self.add_local_track(track)
+
+    def add_local_track(self, track):
+        self.local_tracks.append(track)
+        # Connections that already exist only pick the track up on their next negotiation
+        for peer in self.peers.values():
+            peer.add_track(self.relay.subscribe(track, buffered=False))
+
+    @property
+    def pc(self):
+        # Single-peer callers (1:1 calls, scripts) keep working against the only connection
+        return next(iter(self.peers.values())).pc if self.peers else None
+
+    def add_peer(self, peer_id):
+        peer = self.peers.get(peer_id)
+        if peer is None:
+            # Unbuffered relay proxies: a slow connection only ever sees the newest frame
+            tracks = [self.relay.subscribe(track, buffered=False) for track in self.local_tracks]
+            peer = self.peers[peer_id] = PeerSession(peer_id, self.signaling, tracks, self.receive_spec,
+                                                     self.receive_sink, self.recorder, self.dispatch_message,
+                                                     self.trace_latency, self.undelivered_message)
+            PEERS.set(len(self.peers))
+            print(f"Peer added: {peer_id} ({len(self.peers)} connected)")
+        return peer
+
+    async def remove_peer(self, peer_id):
+        peer = self.peers.pop(peer_id, None)
+        if peer is None:
+            return
+        PEERS.set(len(self.peers))
+        print(f"Peer removed: {peer_id} ({len(self.peers)} connected)")
+        await peer.close()
+        if self.recorder is not None:
+            self.recorder.peer_closed(peer, self.peers.values())
+
+    async def dispatch_message(self, event, data):
+        if self.on_message is not None:
+            await self.on_message(event, data)
+
+    def undelivered_message(self, peer_id, event, data):
+        if self.on_undelivered is not None:
+            self.on_undelivered(peer_id, event, data)
+
+    def _peer_for(self, data):
+        peer_id = sender_of(data)
+        if peer_id not in self.peers and None in self.peers:
+            # First reply to an unaddressed offer claims that connection
+            self.peers[peer_id] = self.peers.pop(None)
+            self.peers[peer_id].peer_id = peer_id
+        return self.peers.get(peer_id)
+
+    async def create_offer(self, peer_id=None):
+        # peer_id=None broadcasts the offer to the room (1:1 calls)
+        await self.add_peer(peer_id).create_offer()
+
+    async def handle_offer(self, data):
+        await self.add_peer(sender_of(data)).handle_offer(data)
+
+    async def handle_answer(self, data):
+        peer = self._peer_for(data)
+        if peer is None:
+            print(f"Warning: Answer from unknown peer {sender_of(data)}. Ignoring.")
+            return
+        await peer.handle_answer(data)
+
+    async def handle_candidate(self, candidate_info):
+        peer = self._peer_for(candidate_info)
+        if peer is None:
+            # Candidates can beat the offer through the relay
+            peer = self.add_peer(sender_of(candidate_info))
+        await peer.handle_candidate(candidate_info)
+
+    async def video_stats(self):
+        """Outgoing video counters per connected peer, for the congestion controller."""
+        stats = {}
+        for peer_id, peer in list(self.peers.items()):
+            if peer.pc.connectionState != "connected":
+                continue
+            sample = await peer.video_stats()
+            if sample is not None:
+                stats[peer_id] = sample
+        return stats
+
+    async def close(self):
+        for peer_id in list(self.peers):
+            await self.remove_peer(peer_id)
@@ -0,0 +1,201 @@
+import asyncio
+import signal
+import sys
+import threading
+import time
+import traceback
+from metrics import REGISTRY
+
+LOOP_LAG_MS = REGISTRY.histogram("lumen_loop_lag_ms", help="How late the event loop ran a timer")
+LOOP_STALLS = REGISTRY.counter("lumen_loop_stalls_total", help="Times the event loop was blocked beyond the stall threshold")
+HANDLER_MS = REGISTRY.histogram("lumen_handler_ms", help="Run time of signaling and RTC callbacks")
+TASK_FAILURES = REGISTRY.counter("lumen_task_failures_total", help="Supervised tasks and callbacks that raised")
+
+
+def new_event_loop(use_uvloop=True):
+    # uvloop when installed (not available on Windows), the stock loop otherwise
+    if use_uvloop:
+        try:
+            import uvloop
+            return uvloop.new_event_loop()
+        except ImportError:
+            pass
+    return asyncio.new_event_loop()
+
+
+def run(main, use_uvloop=True):
+    """Run the coroutine `main` to completion on a fresh loop, like asyncio.run().
+
+    SIGINT/SIGTERM cancel `main` so its finally blocks run on the live loop; where signal handlers
+    are unavailable (Windows) the same happens on KeyboardInterrupt.
+    """
+    loop = new_event_loop(use_uvloop)
+    asyncio.set_event_loop(loop)
+    if "uvloop" in type(loop).__module__:
+        print("Event loop: uvloop")
+    task = loop.create_task(main)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass
+    try:
+        return loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        return None
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            pass
+        return None
+    finally:
+        pending = [t for t in asyncio.all_tasks(loop) if not t.done()]
+        for t in pending:
+            t.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        # The default executor is not joined: a blocked probe or import must not hang exit
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class Supervisor:
+    """Owns the app's long-running tasks and wraps its callbacks.
+
+    A task that raises is logged and counted; with restart=True it is started again after
+    `backoff` seconds, otherwise it stays down without taking the rest of the app with it.
+    Callbacks wrapped with callback() are timed, logged when slower than `slow_handler_ms`, and
+    their exceptions reported instead of vanishing in an unobserved task. shutdown() cancels
+    everything still running and waits a bounded time for it to unwind.
+    """
+
+    def __init__(self, slow_handler_ms=250):
+        self.slow_handler_ms = slow_handler_ms
+        self.tasks = {}
+        self.callbacks = set()
+        self.stopping = asyncio.Event()
+
+    def spawn(self, name, factory, restart=False, backoff=1.0):
+        """Run factory() (a coroutine function) as the task `name`."""
+        task = self.tasks[name] = asyncio.ensure_future(self._supervise(name, factory, restart, backoff))
+        return task
+
+    async def _supervise(self, name, factory, restart, backoff):
+        while True:
+            try:
+                return await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed(f"task {name}", e)
+                if not restart or self.stopping.is_set():
+                    return None
+            await asyncio.sleep(backoff)
+
+    def _failed(self, what, error):
+        TASK_FAILURES.inc()
+        print(f"[RUNTIME] {what} failed: {error!r}")
+        traceback.print_exc()
+
+    def callback(self, name, handler):
+        async def supervised(*args, **kwargs):
+            task = asyncio.current_task()
+            self.callbacks.add(task)
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed(f"handler {name}", e)
+            finally:
+                self.callbacks.discard(task)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                HANDLER_MS.record(elapsed_ms)
+                if elapsed_ms > self.slow_handler_ms:
+                    print(f"[RUNTIME] Slow handler {name}: {elapsed_ms:.0f} ms")
+        return supervised
+
+    def stop(self):
+        self.stopping.set()
+
+    async def wait(self):
+        """Until stop() is called (or the caller is cancelled by a signal)."""
+        await self.stopping.wait()
+
+    async def shutdown(self, timeout=5.0):
+        self.stopping.set()
+        current = asyncio.current_task()
+        tasks = [t for t in list(self.tasks.values()) + list(self.callbacks) if not t.done() and t is not current]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                print(f"[RUNTIME] {len(pending)} task(s) still running after {timeout} s")
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag and names the code blocking the loop while it is still blocking.
+
+    A coroutine sleeps `interval` seconds and records how late it wakes up. A watchdog thread
+    watches the heartbeat that coroutine leaves; when the loop has not ticked for `threshold_ms`
+    it prints the loop thread's current stack, once per stall.
+    """
+
+    def __init__(self, threshold_ms=100, interval=0.05, stack_depth=8):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.stack_depth = stack_depth
+        self.heartbeat = None
+        self.loop_thread = None
+        self.task = None
+        self.thread = None
+        self.running = False
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.running = True
+        self.task = asyncio.ensure_future(self._tick())
+        self.thread = threading.Thread(target=self._watch, name="lumen-loop-watchdog", daemon=True)
+        self.thread.start()
+
+    async def _tick(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            lag_ms = max((now - start - self.interval) * 1000, 0.0)
+            LOOP_LAG_MS.record(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.threshold_ms:
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                print(f"[LOOP] Event loop blocked for {lag_ms:.0f} ms")
+
+    def _watch(self):
+        limit = self.threshold_ms / 1000 + self.interval
+        reported = None
+        while self.running:
+            time.sleep(limit / 2)
+            beat = self.heartbeat
+            if time.monotonic() - beat < limit or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                stack = "".join(traceback.format_stack(frame)[-self.stack_depth:])
+                print(f"[LOOP] Event loop stalled > {self.threshold_ms:.0f} ms, currently in:\n{stack}", end="")
+
+    def stop(self):
+        self.running = False
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -1,30 +1,42 @@
 import socketio
 import asyncio
+import time
+from signaling_pubsub import shard_for
 
 class SignalingClient:
-    def __init__(self, url, on_offer, on_answer, on_candidate):
+    def __init__(self, url, on_offer, on_answer, on_candidate, room_id='test-room', log=True):
         self.sio = socketio.AsyncClient()
-        self.url = url
+        self.room_id = room_id
+        # A comma-separated list is a sharded deployment: every member of a room picks the same shard
+        urls = [u.strip() for u in url.split(',') if u.strip()]
+        self.url = urls[shard_for(room_id, len(urls))] if len(urls) > 1 else url
         self.on_offer_callback = on_offer
         self.on_answer_callback = on_answer
         self.on_candidate_callback = on_candidate
         self.connected = False
+        self.log = log
+        self.joined_at = None
+
+    def _say(self, message):
+        if self.log:
+            print(message)
 
     async def connect(self):
         @self.sio.event
         async def connect():
-            print("Signaling: Connected")
+            self._say("Signaling: Connected")
             self.connected = True
-            await self.sio.emit('join-room', 'test-room')
+            self.joined_at = time.perf_counter()
+            await self.sio.emit('join-room', self.room_id)
 
         @self.sio.event
         async def disconnect():
-            print("Signaling: Disconnected")
+            self._say("Signaling: Disconnected")
             self.connected = False
 
         @self.sio.on('user-connected')
         async def on_user_connected(user_id):
-            print(f"User Connected: {user_id}")
+            self._say(f"User Connected: {user_id}")
             # If we are the host/initiator, we should start the call now
             # But simpler: The new joiner sends the offer? Or existing user?
             # Standard: Existing user (Host) sends offer to new user.
@@ -32,16 +44,22 @@ class SignalingClient:
             if self.on_offer_callback and hasattr(self, 'on_user_connected_callback'):
                  await self.on_user_connected_callback(user_id)
 
+        @self.sio.on('user-disconnected')
+        async def on_user_disconnected(user_id):
+            self._say(f"User Disconnected: {user_id}")
+            if hasattr(self, 'on_user_disconnected_callback'):
+                await self.on_user_disconnected_callback(user_id)
+
         @self.sio.on('offer')
         async def on_offer(data):
             if self.on_offer_callback:
-                print("Received Offer")
+                self._say("Received Offer")
                 await self.on_offer_callback(data)
 
         @self.sio.on('answer')
         async def on_answer(data):
             if self.on_answer_callback:
-                print("Received Answer")
+                self._say("Received Answer")
                 await self.on_answer_callback(data)
 
         @self.sio.on('candidate')
@@ -54,39 +72,54 @@ class SignalingClient:
         except Exception as e:
             print(f"Signaling Connection Error: {e}")
 
-    async def send_offer(self, sdp):
+    def _payload(self, to, **fields):
+        # 'to' addresses a single socket in the room; without it the server broadcasts to the room
+        payload = {'roomId': self.room_id, **fields}
+        if to is not None:
+            payload['to'] = to
+        return payload
+
+    async def send_offer(self, sdp, to=None):
         if self.connected:
-            print("Sending Offer...")
-            await self.sio.emit('offer', {'roomId': 'test-room', 'sdp': sdp})
+            self._say("Sending Offer...")
+            await self.sio.emit('offer', self._payload(to, sdp=sdp))
 
-    async def send_answer(self, sdp):
+    async def send_answer(self, sdp, to=None):
         if self.connected:
-            print("Sending Answer...")
-            await self.sio.emit('answer', {'roomId': 'test-room', 'sdp': sdp})
+            self._say("Sending Answer...")
+            await self.sio.emit('answer', self._payload(to, sdp=sdp))
     
-    # Callback setter
+    # Callback setters
     def set_on_user_connected(self, callback):
         self.on_user_connected_callback = callback
 
+    def set_on_user_disconnected(self, callback):
+        self.on_user_disconnected_callback = callback
 
-    async def send_candidate(self, candidate, sdp_mid, sdp_mline_index):
+
+    async def send_candidate(self, candidate, sdp_mid, sdp_mline_index, to=None):
         if self.connected:
-            await self.sio.emit('candidate', {
-                'roomId': 'test-room', 
-                'candidate': {
-                    'candidate': candidate, 
-                    'sdpMid': sdp_mid, 
-                    'sdpMLineIndex': sdp_mline_index
-                }
-            })
+            await self.sio.emit('candidate', self._payload(to, candidate={
+                'candidate': candidate, 
+                'sdpMid': sdp_mid, 
+                'sdpMLineIndex': sdp_mline_index
+            }))
 
     async def send_hardware_info(self, specs):
         if self.connected:
-            print(f"Sending Hardware Info: {specs}")
+            self._say(f"Sending Hardware Info: {specs}")
             await self.sio.emit('hardware-info', {
-                'roomId': 'test-room', # Hardcoded for prototype
+                'roomId': self.room_id,
                 'specs': specs
             })
 
+    async def send_metrics(self, specs, metrics):
+        # Same event as send_hardware_info so the frontend picks it up without changes to the relay
+        if self.connected:
+            await self.sio.emit('hardware-info', {
+                'roomId': self.room_id,
+                'specs': {**specs, 'metrics': metrics}
+            })
+
     async def close(self):
         await self.sio.disconnect()
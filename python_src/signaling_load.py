@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from signaling_client import SignalingClient
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    values = np.asarray(samples)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(samples), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "max": round(float(values.max()), 3)}
+
+
+def fake_sdp(token, size):
+    # Roughly the size of a real offer, so the server relays realistic payloads
+    head = f"v=0\r\no=- {token} 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+    return head + "a=x-pad:" + "0" * max(size - len(head) - 10, 0) + "\r\n"
+
+
+class SimulatedPeer:
+    """One SignalingClient that answers offers, times offer->answer and counts relayed messages."""
+
+    def __init__(self, load, url, room_id):
+        self.load = load
+        self.client = SignalingClient(url, self.on_offer, self.on_answer, None, room_id=room_id, log=False)
+        self.client.set_on_user_connected(self.on_user_connected)
+        self.offers = {}
+        self.received = 0
+
+        @self.client.sio.on('chat-message')
+        async def on_chat(data):
+            self.count()
+
+        @self.client.sio.on('hardware-info')
+        async def on_hardware(data):
+            self.count()
+
+    @property
+    def sid(self):
+        return self.client.sio.get_sid()
+
+    def count(self):
+        self.received += 1
+        self.load.received += 1
+        if self.load.received >= self.load.expected:
+            self.load.burst_done.set()
+
+    async def on_user_connected(self, user_id):
+        joiner = self.load.by_sid.get(user_id)
+        if joiner is not None and joiner.client.joined_at is not None:
+            self.load.join_ms.append((time.perf_counter() - joiner.client.joined_at) * 1000)
+
+    async def on_offer(self, data):
+        token = data['sdp'].split("\r\n")[1].split()[1]
+        await self.client.send_answer(fake_sdp(token, len(data['sdp'])), to=data['from'])
+
+    async def on_answer(self, data):
+        token = data['sdp'].split("\r\n")[1].split()[1]
+        sent_at = self.offers.pop(token, None)
+        if sent_at is not None:
+            self.load.answer_ms.append((time.perf_counter() - sent_at) * 1000)
+
+    async def offer(self, to, sdp_size):
+        token = f"{id(self)}{len(self.offers)}{time.perf_counter_ns()}"
+        self.offers[token] = time.perf_counter()
+        await self.client.send_offer(fake_sdp(token, sdp_size), to=to)
+
+
+class SignalingLoad:
+    """Hundreds of SignalingClients spread over rooms, driven through join, negotiation and chat phases."""
+
+    def __init__(self, urls, clients, rooms, sdp_size=3000, burst=20, connect_concurrency=50, spread=False):
+        self.rooms = [f"load-{i}" for i in range(rooms)]
+        # Clients hash their room to a shard unless spread, which scatters each room over all shards
+        # so every message has to cross the pub/sub adapter
+        self.peers = [SimulatedPeer(self, urls[i % len(urls)] if spread else ",".join(urls), self.rooms[i % rooms])
+                      for i in range(clients)]
+        self.sdp_size = sdp_size
+        self.burst = burst
+        self.connect_concurrency = connect_concurrency
+        self.by_sid = {}
+        self.join_ms = []
+        self.answer_ms = []
+        self.received = 0
+        self.expected = float("inf")
+        self.burst_done = asyncio.Event()
+
+    async def connect_all(self):
+        gate = asyncio.Semaphore(self.connect_concurrency)
+
+        async def connect(peer):
+            async with gate:
+                await peer.client.connect()
+                self.by_sid[peer.sid] = peer
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect(peer) for peer in self.peers))
+        await asyncio.sleep(0.5)  # let the last user-connected notifications land
+        return time.perf_counter() - start
+
+    async def negotiate(self, timeout=10.0):
+        # Every member offers to the next member of its room, like a host dialing a new viewer
+        members = {}
+        for peer in self.peers:
+            members.setdefault(peer.client.room_id, []).append(peer)
+        offers = 0
+        start = time.perf_counter()
+        for group in members.values():
+            if len(group) < 2:
+                continue
+            for i, peer in enumerate(group):
+                await peer.offer(group[(i + 1) % len(group)].sid, self.sdp_size)
+                offers += 1
+        deadline = start + timeout
+        while len(self.answer_ms) < offers and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        return offers
+
+    async def chat_burst(self, timeout=30.0):
+        members = {}
+        for peer in self.peers:
+            members[peer.client.room_id] = members.get(peer.client.room_id, 0) + 1
+        # Each message reaches everyone else in the sender's room
+        self.expected = sum(self.burst * 2 * (members[p.client.room_id] - 1) for p in self.peers)
+        self.received = 0
+        self.burst_done.clear()
+        if self.expected == 0:
+            return 0, 0.0
+
+        async def send(peer):
+            sio = peer.client.sio
+            for i in range(self.burst):
+                await sio.emit('chat-message', {'roomId': peer.client.room_id, 'sender': peer.sid, 'message': f"msg {i}"})
+                await peer.client.send_hardware_info({'tier': 'load', 'seq': i})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(peer) for peer in self.peers))
+        try:
+            await asyncio.wait_for(self.burst_done.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Burst timed out: {self.received}/{self.expected} messages delivered")
+        return self.burst * 2 * len(self.peers), time.perf_counter() - start
+
+    async def close(self):
+        await asyncio.gather(*(peer.client.close() for peer in self.peers), return_exceptions=True)
+
+    async def run(self):
+        connect_s = await self.connect_all()
+        connected = sum(1 for peer in self.peers if peer.client.connected)
+        offers = await self.negotiate()
+        sent, burst_s = await self.chat_burst()
+        await self.close()
+        return {
+            "clients": len(self.peers),
+            "connected": connected,
+            "rooms": len(self.rooms),
+            "connect_s": round(connect_s, 3),
+            "join_to_user_connected_ms": percentiles(self.join_ms),
+            "offer_to_answer_ms": percentiles(self.answer_ms),
+            "offers": offers,
+            "burst": {
+                "sent": sent,
+                "delivered": self.received,
+                "expected": self.expected,
+                "seconds": round(burst_s, 3),
+                "sent_per_s": round(sent / burst_s, 1) if burst_s else None,
+                "delivered_per_s": round(self.received / burst_s, 1) if burst_s else None,
+            },
+        }
+
+
+async def start_shards(port, shards, pubsub):
+    """In-process signaling shards on consecutive ports, joined by a memory hub or a local-socket broker."""
+    from signaling_server import ShardManager, start_server
+    from signaling_pubsub import MemoryHub, PubSubBroker, SocketPubSub
+
+    broker = hub = None
+    if shards > 1 and pubsub == "socket":
+        broker = await PubSubBroker("127.0.0.1", port + shards).start()
+    elif shards > 1:
+        hub = MemoryHub()
+    runners = []
+    for i in range(shards):
+        manager = None
+        if broker is not None:
+            manager = ShardManager(SocketPubSub("127.0.0.1", broker.port))
+        elif hub is not None:
+            manager = ShardManager(hub.connect())
+        runners.append(await start_server("127.0.0.1", port + i, log=False, manager=manager))
+    return runners, broker
+
+
+async def main(args):
+    runners, broker = [], None
+    if args.url is None:
+        runners, broker = await start_shards(args.port, args.shards, args.pubsub)
+        urls = [f"http://127.0.0.1:{args.port + i}" for i in range(args.shards)]
+    else:
+        urls = [u.strip() for u in args.url.split(",")]
+    try:
+        load = SignalingLoad(urls, args.clients, args.rooms, sdp_size=args.sdp_size, burst=args.burst,
+                             spread=args.spread)
+        report = await load.run()
+        report["shards"] = len(urls)
+        report["spread"] = args.spread
+        if broker is not None:
+            report["broker"] = {"published": broker.published, "dropped": broker.dropped}
+        return report
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        if broker is not None:
+            await broker.close()
+
+
+def print_report(report):
+    print(f"{report['connected']}/{report['clients']} clients in {report['rooms']} rooms on {report['shards']} shard(s)"
+          f"{' (spread)' if report['spread'] else ''}, connected in {report['connect_s']} s")
+    for name in ("join_to_user_connected_ms", "offer_to_answer_ms"):
+        p = report[name]
+        print(f"  {name:28s} n={p['count']:<6} p50={p['p50']} p95={p['p95']} p99={p['p99']} max={p['max']}")
+    burst = report["burst"]
+    print(f"  burst: {burst['sent']} sent, {burst['delivered']}/{burst['expected']} delivered in {burst['seconds']} s "
+          f"({burst['sent_per_s']} sent/s, {burst['delivered_per_s']} delivered/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signaling load test with simulated SignalingClients")
+    parser.add_argument("--url", help="Existing signaling server(s), comma-separated for shards; "
+                                      "by default in-process Python servers are started")
+    parser.add_argument("--port", type=int, default=3100, help="First port for the in-process shards")
+    parser.add_argument("--shards", type=int, default=1, help="In-process shards; rooms are hashed across them")
+    parser.add_argument("--pubsub", choices=("memory", "socket"), default="memory",
+                        help="Adapter joining in-process shards: shared memory hub or a local-socket broker")
+    parser.add_argument("--spread", action="store_true",
+                        help="Place clients round-robin over shards instead of by room, forcing cross-shard fan-out")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--sdp-size", type=int, default=3000, help="Bytes per fake offer/answer SDP")
+    parser.add_argument("--burst", type=int, default=20, help="chat-message + hardware-info pairs sent per client")
+    parser.add_argument("--out", default="signaling_load.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print_report(report)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
@@ -0,0 +1,217 @@
+import asyncio
+import collections
+import zlib
+
+
+def shard_for(room_id, shards):
+    """Stable shard index of a room; every client and worker computes the same answer."""
+    return zlib.crc32(str(room_id).encode()) % shards
+
+
+class MemoryHub:
+    """In-process broker for MemoryPubSub adapters, e.g. several shards inside one test or load run."""
+
+    def __init__(self):
+        self.subscribers = collections.defaultdict(set)
+
+    def connect(self):
+        return MemoryPubSub(self)
+
+
+class MemoryPubSub:
+    """Pub/sub adapter over a MemoryHub.
+
+    Adapters share one interface: subscribe(channel) and unsubscribe(channel) take effect in
+    call order, publish(channel, message) delivers a str to every other subscriber of the
+    channel, messages() yields what this adapter receives, and close() ends it. A Redis or
+    NATS adapter only has to provide the same five methods.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.channels = set()
+        self.inbox = asyncio.Queue()
+
+    def subscribe(self, channel):
+        self.channels.add(channel)
+        self.hub.subscribers[channel].add(self)
+
+    def unsubscribe(self, channel):
+        self.channels.discard(channel)
+        subscribers = self.hub.subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub.subscribers[channel]
+
+    async def publish(self, channel, message):
+        for subscriber in self.hub.subscribers.get(channel, ()):
+            if subscriber is not self:
+                subscriber.inbox.put_nowait(message)
+
+    async def messages(self):
+        while True:
+            yield await self.inbox.get()
+
+    async def close(self):
+        for channel in list(self.channels):
+            self.unsubscribe(channel)
+
+
+# Broker wire format, one line per command. Channels and payloads are JSON text, which never
+# contains a raw tab or newline:  S\t<channel>\n  U\t<channel>\n  P\t<channel>\t<payload>\n
+# Subscribers receive just <payload>\n. Both ends read with the same line limit; a longer line is
+# dropped (and counted) without closing the connection.
+LINE_LIMIT = 2 ** 22
+
+class PubSubBroker:
+    """Local-socket broker for SocketPubSub adapters in separate worker processes.
+
+    Fans each published line out to the other connections subscribed to its channel. A
+    subscriber whose socket buffer passes max_buffer drops messages instead of growing the
+    broker's memory.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6390, max_buffer=8 * 1024 * 1024, limit=LINE_LIMIT):
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.limit = limit
+        self.subscribers = collections.defaultdict(set)
+        self.server = None
+        self.clients = {}
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=self.limit)
+        return self
+
+    async def _handle(self, reader, writer):
+        channels = set()
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the limit: the line is discarded, the connection stays up
+                    self.dropped += 1
+                    print(f"Pub/sub broker: dropped a line over {self.limit} bytes")
+                    continue
+                if not line:
+                    break
+                op, _, rest = line.rstrip(b"\n").partition(b"\t")
+                if op == b"P":
+                    channel, _, payload = rest.partition(b"\t")
+                    self.published += 1
+                    out = payload + b"\n"
+                    for subscriber in self.subscribers.get(channel, ()):
+                        if subscriber is writer:
+                            continue
+                        if subscriber.transport.get_write_buffer_size() > self.max_buffer:
+                            self.dropped += 1
+                            continue
+                        subscriber.write(out)
+                elif op == b"S":
+                    channels.add(rest)
+                    self.subscribers[rest].add(writer)
+                elif op == b"U":
+                    channels.discard(rest)
+                    self._remove(rest, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            for channel in channels:
+                self._remove(channel, writer)
+            self.clients.pop(writer, None)
+            writer.close()
+
+    def _remove(self, channel, writer):
+        subscribers = self.subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.subscribers[channel]
+
+    async def close(self):
+        """Stop accepting, hang up on every adapter and wait for their handlers to finish."""
+        if self.server is not None:
+            self.server.close()
+        handlers = list(self.clients.values())
+        for writer in list(self.clients):
+            writer.close()
+        if handlers:
+            await asyncio.wait(handlers, timeout=5)
+        if self.server is not None:
+            await self.server.wait_closed()
+            self.server = None
+
+
+class SocketPubSub:
+    """Pub/sub adapter connected to a PubSubBroker; reconnects and resubscribes if the broker restarts."""
+
+    def __init__(self, host="127.0.0.1", port=6390, retry=0.5):
+        self.host = host
+        self.port = port
+        self.retry = retry
+        self.channels = set()
+        self.writer = None
+        self.closed = False
+        self.connected = asyncio.Event()
+
+    def _send(self, line):
+        if self.writer is not None:
+            self.writer.write(line)
+
+    def subscribe(self, channel):
+        self.channels.add(channel)
+        self._send(b"S\t" + channel.encode() + b"\n")
+
+    def unsubscribe(self, channel):
+        self.channels.discard(channel)
+        self._send(b"U\t" + channel.encode() + b"\n")
+
+    async def publish(self, channel, message):
+        await self.connected.wait()
+        self._send(b"P\t" + channel.encode() + b"\t" + message.encode() + b"\n")
+
+    async def messages(self):
+        while not self.closed:
+            try:
+                reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+            except OSError as e:
+                print(f"Pub/sub broker {self.host}:{self.port} unavailable ({e}), retrying")
+                await asyncio.sleep(self.retry)
+                continue
+            for channel in self.channels:
+                self._send(b"S\t" + channel.encode() + b"\n")
+            self.connected.set()
+            try:
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:
+                        print(f"Pub/sub: dropped a message over {LINE_LIMIT} bytes")
+                        continue
+                    if not line:
+                        break
+                    yield line[:-1].decode()
+            except ConnectionError:
+                pass
+            self.connected.clear()
+            self.writer = None
+            if self.closed:
+                return
+            print("Pub/sub broker connection lost, reconnecting")
+            await asyncio.sleep(self.retry)
+
+    async def close(self):
+        self.closed = True
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
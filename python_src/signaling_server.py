@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import socketio
+from socketio.async_manager import AsyncManager
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from aiohttp import web
+from signaling_pubsub import PubSubBroker, SocketPubSub
+
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "signaling", "public")
+LOG_EVERY = int(os.environ.get("LUMENRTC_SIGNALING_LOG_EVERY", 100))
+
+
+class SampledLog:
+    """Prints the first event of each kind and then one in `every`, with the running count."""
+
+    def __init__(self, every=LOG_EVERY, enabled=True):
+        self.every = max(int(every), 1)
+        self.enabled = enabled
+        self.counts = collections.Counter()
+
+    def __call__(self, kind, message):
+        self.counts[kind] += 1
+        count = self.counts[kind]
+        if self.enabled and (count == 1 or count % self.every == 0):
+            print(f"{message} [{kind} #{count}]")
+
+
+BROADCAST_CHANNEL = json.dumps(["broadcast"])
+
+
+def channel_for(namespace, room):
+    # One channel per room (sid rooms included), so a worker only receives traffic for rooms it has members in.
+    # Room-less broadcasts go to one channel every worker subscribes to
+    if room is None:
+        return BROADCAST_CHANNEL
+    return json.dumps([namespace or "/", room])
+
+
+def in_room(manager, sid, room, namespace="/"):
+    # Local membership only; with ShardManager a member on another worker is not visible here
+    return sid in manager.rooms.get(namespace, {}).get(room, {})
+
+
+class ShardManager(AsyncPubSubManager):
+    """Socket.IO client manager that fans out across workers through a pub/sub adapter.
+
+    Unlike a single shared channel, each worker subscribes only to the rooms it has local
+    members in, plus its own sids and one channel for room-less broadcasts. With rooms hashed
+    to shards most rooms live on one worker and their traffic never reaches the others; clients
+    on the wrong shard still work. It overrides AsyncPubSubManager internals (_publish, _listen,
+    _handle_emit, the rooms layout), so requirements.txt pins python-socketio to the tested version.
+    """
+
+    name = "lumenshard"
+
+    def __init__(self, adapter, channel="lumenrtc"):
+        super().__init__(channel=channel)
+        self.adapter = adapter
+
+    def initialize(self):
+        super().initialize()
+        self.adapter.subscribe(json.dumps(["host", self.host_id]))
+        self.adapter.subscribe(BROADCAST_CHANNEL)
+
+    def basic_enter_room(self, sid, namespace, room, eio_sid=None):
+        fresh = room not in self.rooms.get(namespace, {})
+        super().basic_enter_room(sid, namespace, room, eio_sid=eio_sid)
+        if fresh:
+            self.adapter.subscribe(channel_for(namespace, room))
+
+    def basic_leave_room(self, sid, namespace, room):
+        present = room in self.rooms.get(namespace, {})
+        super().basic_leave_room(sid, namespace, room)
+        if present and room not in self.rooms.get(namespace, {}):
+            self.adapter.unsubscribe(channel_for(namespace, room))
+
+    async def emit_to_member(self, event, data, namespace, room, sid):
+        """Emit to `sid` only if it is in `room`; checked by whichever worker holds the sid."""
+        if in_room(self, sid, room, namespace):
+            await AsyncManager.emit(self, event, data, namespace=namespace, room=sid)
+            return
+        await self._publish({"method": "emit", "event": event, "data": data, "namespace": namespace,
+                             "room": room, "member": sid, "host_id": self.host_id})
+
+    async def _handle_emit(self, message):
+        member = message.get("member")
+        if member is None:
+            await super()._handle_emit(message)
+            return
+        namespace = message.get("namespace") or "/"
+        if in_room(self, member, message["room"], namespace):
+            await AsyncManager.emit(self, message["event"], message["data"], namespace=namespace, room=member)
+
+    async def _publish(self, data):
+        method = data["method"]
+        if method == "callback":
+            channel = json.dumps(["host", data["host_id"]])
+        elif method in ("emit", "close_room"):
+            channel = channel_for(data["namespace"], data.get("room"))
+        else:  # disconnect, enter_room, leave_room address one sid
+            channel = channel_for(data["namespace"], data["sid"])
+        await self.adapter.publish(channel, self.json.dumps(data))
+
+    async def _listen(self):
+        async for message in self.adapter.messages():
+            yield message
+
+    async def close(self):
+        """Stop the listener task and close the adapter; runs on app cleanup."""
+        thread, self.thread = getattr(self, "thread", None), None
+        if thread is not None:
+            thread.cancel()
+            await asyncio.gather(thread, return_exceptions=True)
+        await self.adapter.close()
+
+
+def create_app(log=True, manager=None, log_every=LOG_EVERY):
+    """Python stand-in for signaling/server.js with the same events and relay rules.
+
+    Lets main.py, terminal_chat.py and the load harness run against a local server without Node.
+    Pass a ShardManager to run as one of several workers. Returns (app, sio).
+    """
+    sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*", client_manager=manager)
+    app = web.Application()
+    sio.attach(app)
+    if isinstance(manager, ShardManager):
+        async def close_manager(app):
+            await manager.close()
+        app.on_cleanup.append(close_manager)
+    say = SampledLog(log_every, enabled=log)
+
+    def member(sid, data):
+        # Only members of a room may send into it
+        room_id = data.get("roomId")
+        return room_id is not None and room_id in sio.rooms(sid)
+
+    async def relay(sid, event, data, payload):
+        # Relay to one socket when the sender addressed it (multi-peer rooms), otherwise to the rest of the room.
+        # An addressed socket must be in the same room as the sender.
+        if not member(sid, data):
+            return
+        room_id, target = data["roomId"], data.get("to")
+        if target is None:
+            await sio.emit(event, payload, room=room_id, skip_sid=sid)
+        elif isinstance(sio.manager, ShardManager):
+            await sio.manager.emit_to_member(event, payload, "/", room_id, target)
+        elif in_room(sio.manager, target, room_id):
+            await sio.emit(event, payload, room=target)
+
+    @sio.event
+    async def connect(sid, environ):
+        say("connect", f"Client connected: {sid}")
+
+    @sio.on("join-room")
+    async def join_room(sid, room_id):
+        await sio.enter_room(sid, room_id)
+        say("join", f"Socket {sid} joined room {room_id}")
+        await sio.emit("user-connected", sid, room=room_id, skip_sid=sid)
+
+    @sio.on("offer")
+    async def offer(sid, data):
+        say("offer", f"Forwarding offer to room {data.get('roomId')}, SDP length: {len(data.get('sdp') or '')}")
+        await relay(sid, "offer", data, {**data, "from": sid})
+
+    @sio.on("answer")
+    async def answer(sid, data):
+        say("answer", f"Forwarding answer to room {data.get('roomId')}, SDP length: {len(data.get('sdp') or '')}")
+        await relay(sid, "answer", data, {**data, "from": sid})
+
+    @sio.on("candidate")
+    async def candidate(sid, data):
+        await relay(sid, "candidate", data, {**(data.get("candidate") or {}), "from": sid})
+
+    # Chat and stats normally travel on peer data channels; through here they may be addressed too,
+    # when a data channel closed with messages still queued for that one peer
+    @sio.on("chat-message")
+    async def chat_message(sid, data):
+        await relay(sid, "chat-message", data, data)
+
+    @sio.on("hardware-info")
+    async def hardware_info(sid, data):
+        await relay(sid, "hardware-info", data, data)
+
+    @sio.event
+    async def disconnect(sid, *args):
+        # Rooms are still attached while the handler runs, like 'disconnecting' in socket.io
+        for room_id in sio.rooms(sid):
+            if room_id != sid:
+                await sio.emit("user-disconnected", sid, room=room_id, skip_sid=sid)
+        say("disconnect", f"Client disconnected: {sid}")
+
+    if os.path.isdir(PUBLIC_DIR):
+        async def index(request):
+            return web.FileResponse(os.path.join(PUBLIC_DIR, "index.html"))
+        app.router.add_get("/", index)
+        app.router.add_static("/", PUBLIC_DIR)
+    return app, sio
+
+
+async def start_server(host="127.0.0.1", port=3000, log=True, manager=None):
+    """Serve in the current event loop. Returns the aiohttp AppRunner; await runner.cleanup() to stop."""
+    app, _ = create_app(log=log, manager=manager)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if log:
+        print(f"Signaling Server running on http://{host}:{port}")
+    return runner
+
+
+async def serve_forever(host, port, broker=None):
+    manager = ShardManager(SocketPubSub(*broker)) if broker is not None else None
+    runner = await start_server(host, port, manager=manager)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_worker(host, port, broker):
+    try:
+        asyncio.run(serve_forever(host, port, broker))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_sharded(host, port, workers, broker_port):
+    """Broker in this process, one worker process per shard on consecutive ports."""
+    broker = await PubSubBroker("127.0.0.1", broker_port).start()
+    processes = [multiprocessing.Process(target=run_worker, args=(host, port + i, ("127.0.0.1", broker_port)),
+                                         daemon=True) for i in range(workers)]
+    for process in processes:
+        process.start()
+    urls = ",".join(f"http://localhost:{port + i}" for i in range(workers))
+    print(f"{workers} signaling shards, pub/sub broker on 127.0.0.1:{broker_port}")
+    print(f"LUMENRTC_SIGNALING_URL={urls}")
+    try:
+        while all(process.is_alive() for process in processes):
+            await asyncio.sleep(1)
+        print("A signaling worker exited, shutting down")
+    finally:
+        for process in processes:
+            process.terminate()
+        await broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LumenRTC signaling server (Python)")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 3000)), help="First shard's port")
+    parser.add_argument("--workers", type=int, default=1, help="Shard processes; rooms are hashed across them")
+    parser.add_argument("--broker-port", type=int, default=6390, help="Local pub/sub broker port when sharded")
+    args = parser.parse_args()
+
+    try:
+        if args.workers > 1:
+            asyncio.run(run_sharded(args.host, args.port, args.workers, args.broker_port))
+        else:
+            asyncio.run(serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
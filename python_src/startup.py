@@ -0,0 +1,82 @@
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Heavy modules, in the order the media path needs them
+MEDIA_MODULES = ("numpy", "cv2", "av", "aiortc", "media_pipeline", "rtc_manager")
+REPORT_MODULES = ("socketio", "numpy", "cv2", "av", "aiortc", "onnxruntime")
+
+_process_start = time.perf_counter()
+
+
+class StartupReport:
+    """Milestones and import times since process start, printed once the call path is ready."""
+
+    def __init__(self):
+        self.milestones = []
+        self.imports = {}
+
+    def mark(self, name):
+        self.milestones.append((name, (time.perf_counter() - _process_start) * 1000))
+
+    def timed_import(self, name):
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports[name] = (time.perf_counter() - start) * 1000
+        return module
+
+    def as_dict(self):
+        return {
+            "milestones_ms": {name: round(ms, 1) for name, ms in self.milestones},
+            "imports_ms": {name: round(ms, 1) for name, ms in self.imports.items()},
+        }
+
+    def print(self):
+        print("[STARTUP] Milestones (ms since start):")
+        for name, ms in self.milestones:
+            print(f"[STARTUP]   {ms:8.1f}  {name}")
+        if self.imports:
+            print("[STARTUP] Background imports (ms):")
+            for name, ms in self.imports.items():
+                print(f"[STARTUP]   {ms:8.1f}  {name}")
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+REPORT = StartupReport()
+
+
+def background_import(names, report=REPORT):
+    """Import modules on a worker thread so the loop keeps handling signaling meanwhile."""
+    loop = asyncio.get_running_loop()
+
+    def load():
+        for name in names:
+            report.timed_import(name)
+
+    return loop.run_in_executor(None, load)
+
+
+def measure_cold_imports(modules=REPORT_MODULES):
+    """Import time of each module in a fresh interpreter, for tracking regressions across builds."""
+    results = {}
+    for name in modules:
+        code = f"import time; t = time.perf_counter(); import {name}; print((time.perf_counter() - t) * 1000)"
+        proc = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        results[name] = round(float(proc.stdout.strip()), 1) if proc.returncode == 0 else None
+    return results
+
+
+if __name__ == "__main__":
+    print("Cold import times (ms):")
+    for name, ms in measure_cold_imports().items():
+        print(f"  {name:12s} {ms if ms is not None else 'not installed'}")
@@ -1,11 +1,18 @@
 import asyncio
+import os
 import sys
 import aioconsole
-from hardware_probe import HardwareProvider
+from startup import REPORT
 from signaling_client import SignalingClient
-from rtc_manager import RTCManager
-from media_pipeline import MediaPipelineTrack
-from aiortc.contrib.media import MediaPlayer
+from data_channel import Messenger
+# The media stack (cv2, av, aiortc) is imported on the first call, so chat-only sessions never load it
+
+def arg_value(name):
+    # "--name=value" style options
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return None
 
 # ANSI Colors
 RESET = "\033[0m"
@@ -19,35 +26,30 @@ class TerminalApp:
         self.username = ""
         self.room_id = ""
         self.signaling = None
+        self.messenger = None
         self.rtc = None
         self.video_track = None
-        self.audio_player = None
+        self.audio_track = None
         self.in_call = False
-        self.loop = asyncio.get_event_loop()
+        self.specs = None
 
     async def start(self):
         print(f"{GREEN}=== LumenRTC Terminal Chat ==={RESET}")
         self.username = await aioconsole.ainput("Enter Username: ")
         self.room_id = await aioconsole.ainput("Enter Room ID to Join/Create: ")
         
-        # 1. Hardware Probe
-        self.specs = HardwareProvider.get_capabilities()
-        print(f"{YELLOW}System detected: {self.specs['tier']}{RESET}")
-        if self.specs['has_cuda']:
-            print(f"{YELLOW}GPU: {self.specs['gpu_name']}{RESET}")
-
-        # 2. Setup Signaling
-        self.signaling = SignalingClient("http://localhost:3000", self.on_offer, self.on_answer, self.on_candidate)
-        
-        # 3. Setup RTC
-        self.rtc = RTCManager(self.signaling)
+        # 1. Setup Signaling (hardware probe and RTC are deferred until a call starts)
+        url = os.environ.get("LUMENRTC_SIGNALING_URL", "http://localhost:3000")
+        self.signaling = SignalingClient(url, self.on_offer, self.on_answer, self.on_candidate, room_id=self.room_id)
         
-        # Custom Signaling Events
-        @self.signaling.sio.on('chat-message')
+        # Chat goes peer to peer over the call's data channel while in a call, through signaling otherwise
+        self.messenger = Messenger(self.signaling)
+
         async def on_chat(data):
             if data['sender'] != self.username:
                 print(f"\r{BLUE}[{data['sender']}]: {data['message']}{RESET}")
                 print(f"{GREEN}[You]: {RESET}", end="", flush=True)
+        self.messenger.on('chat-message', on_chat)
 
         @self.signaling.sio.on('user-connected')
         async def on_user_info(user_id):
@@ -56,7 +58,7 @@ class TerminalApp:
 
         # Connect
         await self.signaling.connect()
-        await self.signaling.sio.emit('join-room', self.room_id)
+        REPORT.mark("room joined")
         print(f"{GREEN}Joined Room: {self.room_id}{RESET}")
         print(f"Type message to chat. Type {RED}/call{RESET} to video call. Type {RED}/quit{RESET} to exit.")
 
@@ -71,11 +73,7 @@ class TerminalApp:
                 await self.handle_command(msg)
             else:
                 if msg.strip():
-                    await self.signaling.sio.emit('chat-message', {
-                        'roomId': self.room_id,
-                        'sender': self.username,
-                        'message': msg
-                    })
+                    await self.messenger.send_chat(self.username, msg)
 
     async def handle_command(self, cmd):
         if cmd == "/quit":
@@ -99,35 +97,58 @@ class TerminalApp:
              else:
                  print(f"{RED}Not in a call.{RESET}")
 
+    async def ensure_rtc(self):
+        # First call: probe hardware and load the media stack off the event loop
+        if self.specs is None:
+            from hardware_probe import HardwareProvider
+            from startup import MEDIA_MODULES, background_import
+            await background_import(MEDIA_MODULES)
+            self.specs = await asyncio.get_running_loop().run_in_executor(None, HardwareProvider.get_capabilities)
+            REPORT.mark("media ready")
+            if "--startup-report" in sys.argv:
+                REPORT.print()
+            print(f"{YELLOW}System detected: {self.specs['tier']}{RESET}")
+            if self.specs['has_cuda']:
+                print(f"{YELLOW}GPU: {self.specs['gpu_name']}{RESET}")
+        if self.rtc is None:
+            from rtc_manager import RTCManager
+            self.rtc = RTCManager(self.signaling)
+            self.messenger.attach(self.rtc)
+        return self.rtc
+
     async def start_av_pipeline(self):
+        await self.ensure_rtc()
+        from media_pipeline import MediaPipelineTrack
+        from audio_track import VadAudioTrack, WavFileSource, open_microphone
+
         # Video
-        self.video_track = MediaPipelineTrack(self.specs)
+        self.video_track = MediaPipelineTrack(self.specs, preview="--no-preview" not in sys.argv)
         self.rtc.set_local_video_track(self.video_track)
         
-        # Audio (Try to capture mic)
+        # Audio: microphone (or --audio-wav=<file>), gated by voice activity.
+        # --vad-silence=comfort sends DTX-style comfort noise, =send disables gating.
         try:
-             # On Windows/DirectShow, finding device is tricky. 
-             # 'audio=default' might work if FFMPEG dshow is available.
-             # fallback to no audio if fails.
-             print("Initializing Audio...")
-             self.audio_player = MediaPlayer('audio=microphone', format='dshow')
-             if self.audio_player.audio:
-                 self.rtc.pc.addTrack(self.audio_player.audio)
-                 print(f"{GREEN}Microphone Active.{RESET}")
+            print("Initializing Audio...")
+            wav = arg_value("--audio-wav")
+            source = WavFileSource(wav, loop=True) if wav else open_microphone()
+            self.audio_track = VadAudioTrack(source, silence=arg_value("--vad-silence") or "drop")
+            self.rtc.add_local_track(self.audio_track)
+            print(f"{GREEN}{'Audio file' if wav else 'Microphone'} Active.{RESET}")
         except Exception as e:
-            print(f"{RED}Audio init failed (Check FFMPEG/PyAudio): {e}{RESET}")
+            print(f"{RED}Audio init failed: {e}{RESET}")
             print("Proceeding with Video Only.")
 
     async def stop_av_pipeline(self):
         if self.video_track:
             self.video_track.release()
             self.video_track = None
-        if self.audio_player:
-            self.audio_player.stop()
-            self.audio_player = None
-        # Re-init RTC for next call
-        await self.rtc.close()
-        self.rtc = RTCManager(self.signaling) # Fresh PC
+        if self.audio_track:
+            self.audio_track.stop()
+            self.audio_track = None
+        # Fresh PC is created on the next call
+        if self.rtc is not None:
+            await self.rtc.close()
+            self.rtc = None
 
     # RTC Callbacks
     async def on_offer(self, data):
@@ -139,12 +160,15 @@ class TerminalApp:
         await self.rtc.handle_offer(data)
 
     async def on_answer(self, data):
+        if self.rtc is None:
+            return
         print(f"\r{YELLOW}Call Accepted.{RESET}")
         print(f"{GREEN}[You]: {RESET}", end="", flush=True)
         await self.rtc.handle_answer(data)
 
     async def on_candidate(self, data):
-        await self.rtc.handle_candidate(data)
+        if self.rtc is not None:
+            await self.rtc.handle_candidate(data)
 
     async def cleanup(self):
         await self.signaling.close()
@@ -15,7 +15,7 @@ async def main():
             # Manually pump the track
             frame = await track.recv()
             
-            # The track already does imshow in recv() for this prototype
+            # The track's preview sink draws the window on its own thread
             # But let's check for exit key here too just in case
             if cv2.waitKey(1) & 0xFF == 27:
                 break
@@ -1,14 +1,23 @@
+import os
 import subprocess
 import time
 import sys
 
 def run_p2p_test():
     print("Starting P2P Simulation...")
+
+    # Both peers talk to a local Python signaling server instead of the deployed one
+    print("Launching Signaling Server...")
+    env = dict(os.environ, PORT="3000", LUMENRTC_SIGNALING_URL="http://127.0.0.1:3000")
+    server = subprocess.Popen([sys.executable, "python_src/signaling_server.py"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
     
     # Start Joiner
     print("Launching Joiner...")
     joiner = subprocess.Popen(
         [sys.executable, "python_src/main.py", "joiner"],
+        env=env,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
@@ -21,6 +30,7 @@ def run_p2p_test():
     print("Launching Host...")
     host = subprocess.Popen(
         [sys.executable, "python_src/main.py", "host"],
+        env=env,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
@@ -50,6 +60,8 @@ def run_p2p_test():
         joiner.terminate()
         host.wait()
         joiner.wait()
+        server.terminate()
+        server.wait()
         print("Test Complete.")
 
 if __name__ == "__main__":
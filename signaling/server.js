@@ -16,43 +16,76 @@ const io = new Server(server, {
 });
 
 const PORT = process.env.PORT || 3000;
+const LOG_EVERY = Math.max(parseInt(process.env.LUMENRTC_SIGNALING_LOG_EVERY || '100', 10), 1);
+
+// Per-message logs are sampled: the first event of each kind, then one in LOG_EVERY with the running count.
+const logCounts = {};
+const log = (kind, message) => {
+    const count = (logCounts[kind] || 0) + 1;
+    logCounts[kind] = count;
+    if (count === 1 || count % LOG_EVERY === 0) {
+        console.log(`${message} [${kind} #${count}]`);
+    }
+};
+
+// Only members of a room may send into it.
+const isMember = (socket, data) => Boolean(data && data.roomId) && socket.rooms.has(data.roomId);
+
+// Relay to one socket when the sender addressed it (multi-peer rooms), otherwise to the rest of the room.
+// An addressed socket must be in the same room as the sender.
+// The sender's id travels as 'from' so receivers can keep one peer connection per remote user.
+const relay = (socket, event, data, payload) => {
+    if (!isMember(socket, data)) return;
+    if (!data.to) {
+        socket.to(data.roomId).emit(event, payload);
+    } else if (io.sockets.adapter.rooms.get(data.roomId)?.has(data.to)) {
+        socket.to(data.to).emit(event, payload);
+    }
+};
 
 io.on('connection', (socket) => {
-    console.log(`Client connected: ${socket.id}`);
+    log('connect', `Client connected: ${socket.id}`);
 
     socket.on('join-room', (roomId) => {
         socket.join(roomId);
-        console.log(`Socket ${socket.id} joined room ${roomId}`);
+        log('join', `Socket ${socket.id} joined room ${roomId}`);
         socket.to(roomId).emit('user-connected', socket.id);
     });
 
     socket.on('offer', (data) => {
-        console.log(`Forwarding offer to room ${data.roomId}, SDP length: ${data.sdp?.length || 'undefined'}`);
+        log('offer', `Forwarding offer to room ${data.roomId}, SDP length: ${data.sdp?.length || 'undefined'}`);
         // Forward the entire payload - the receiver expects { sdp: ... }
-        socket.to(data.roomId).emit('offer', data);
+        relay(socket, 'offer', data, { ...data, from: socket.id });
     });
 
     socket.on('answer', (data) => {
-        console.log(`Forwarding answer to room ${data.roomId}, SDP length: ${data.sdp?.length || 'undefined'}`);
+        log('answer', `Forwarding answer to room ${data.roomId}, SDP length: ${data.sdp?.length || 'undefined'}`);
         // Forward the entire payload - the receiver expects { sdp: ... }
-        socket.to(data.roomId).emit('answer', data);
+        relay(socket, 'answer', data, { ...data, from: socket.id });
     });
 
     socket.on('candidate', (data) => {
-        socket.to(data.roomId).emit('candidate', data.candidate);
+        relay(socket, 'candidate', data, { ...data.candidate, from: socket.id });
     });
 
-    socket.on('chat-message', (data) => {
-        socket.to(data.roomId).emit('chat-message', data);
-    });
+    // Addressed ('to') when a Python peer's data channel closed with messages still queued for that peer
+    socket.on('chat-message', (data) => relay(socket, 'chat-message', data, data));
 
     socket.on('hardware-info', (data) => {
         // Broadcast backend hardware specs to the room (so frontend can see what the Python backend is running on)
-        socket.to(data.roomId).emit('hardware-info', data);
+        relay(socket, 'hardware-info', data, data);
+    });
+
+    socket.on('disconnecting', () => {
+        for (const roomId of socket.rooms) {
+            if (roomId !== socket.id) {
+                socket.to(roomId).emit('user-disconnected', socket.id);
+            }
+        }
     });
 
     socket.on('disconnect', () => {
-        console.log(`Client disconnected: ${socket.id}`);
+        log('disconnect', `Client disconnected: ${socket.id}`);
     });
 });
 